@@ -0,0 +1,349 @@
+"""
+WriterOutputHolder fan-out benchmark.
+
+A producer writes synthetic frames to a WriterOutputHolder at the camera framerate
+(or as fast as the holder takes them with --fps 0) which fans them out to 1..64 outputs:
+- memory: in-process outputs that only record when every frame arrived
+- loopback: ClientSocketWrap outputs over loopback tcp, like NetworkServingMode,
+  read by a separate process so reading doesn't count against the holder's cpu
+- engine: the same loopback connections owned by a single NetworkEngine output
+
+Every frame carries its sequence number so the arrival at every output can be matched
+to the time it was written, reported per case:
+- delivered_fps: frames/sec that reached the slowest output during the run
+- latency_ms p50/p90/p99/max: from write() until the frame reached the last output
+- cpu_us_per_frame_per_output: cpu time of this process per frame and output,
+  without the producer and the queue sampler
+- max_queue_frames/max_queue_bytes/queue_growth_bytes_per_s: frames waiting in the holder and its output queues
+- frames_lost: written frames that never reached every output
+- threads: threads alive in this process at the end of the run
+
+Usage: python3 benchmarks/bench_fanout.py [--outputs 1,4,16] [--profiles mjpeg_720p] [--sinks memory]
+                                          [--drop-policy keyframe] [--slow-outputs 1 --slow-delay 0.5]
+                                          [--json results.json] [--compare baseline.json]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import struct
+import argparse
+import selectors
+import multiprocessing
+from threading import Thread, Event, active_count
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "picameleon"))
+from outputs.output_holder import WriterOutputHolder
+from outputs.output_queue import DROP_POLICIES, DEFAULT_DROP_POLICY
+from outputs.client_socket_wrap import ClientSocketWrap
+from outputs.network_engine import NetworkEngine
+from streamers.frame_ring import Frame
+from streamers.frame_assembler import SIZE_PREFIX, SIZE_PREFIX_LENGTH
+
+SEQ = struct.Struct('<Q')
+HEADER_LENGTH = SIZE_PREFIX_LENGTH + SEQ.size
+DEFAULT_OUTPUTS = "1,2,4,8,16,32,64"
+DEFAULT_SINKS = "memory,loopback,engine"
+DEFAULT_FPS = 30
+DEFAULT_DURATION = 3
+DRAIN_TIMEOUT = 5
+SAMPLE_INTERVAL = 0.01
+SATURATE_QUEUE_FRAMES = 2
+RECV_SIZE = 1 << 20
+DEFAULT_TOLERANCE = 0.2
+DEFAULT_SLOW_DELAY = 0.5
+
+PROFILES = {
+    "mjpeg_720p": {"size": 120000, "keyframe_size": 120000, "intra_period": 1},
+    "mjpeg_1080p": {"size": 300000, "keyframe_size": 300000, "intra_period": 1},
+    "h264_1080p": {"size": 60000, "keyframe_size": 250000, "intra_period": 60},
+    "yuv_720p": {"size": 1382400, "keyframe_size": 1382400, "intra_period": 1},
+}
+
+# (metric, True when higher is better) checked by --compare
+COMPARED_METRICS = (
+    ("delivered_fps", True),
+    ("latency_p99_ms", False),
+    ("cpu_us_per_frame_per_output", False),
+)
+
+
+def queue_depth(holder):
+    """Returns (frames, bytes) waiting in the holder or any of its output queues to be written,
+    a frame queued for several outputs only counts once
+    """
+    frames = {id(frame): frame for frame in list(holder.aux_buffer)}
+    for queue in list(holder.queues.values()):
+        frames.update((id(frame), frame) for frame in list(queue.frames))
+    return len(frames), sum(len(frame) for frame in frames.values() if isinstance(frame, Frame))
+
+
+def make_frame(seq, profile, body):
+    keyframe = seq % profile["intra_period"] == 1 or profile["intra_period"] == 1
+    size = profile["keyframe_size"] if keyframe else profile["size"]
+    payload = bytearray(SIZE_PREFIX_LENGTH + size)
+    SIZE_PREFIX.pack_into(payload, 0, size)
+    SEQ.pack_into(payload, SIZE_PREFIX_LENGTH, seq)
+    payload[HEADER_LENGTH:] = body[:size - SEQ.size]
+    return Frame(seq, None, memoryview(payload)[SIZE_PREFIX_LENGTH:], payload, keyframe=keyframe)
+
+
+class MemorySink:
+    def __init__(self, delay=0):
+        self.received = []
+        self.delay = delay
+
+    def write(self, buf):
+        if self.delay:
+            time.sleep(self.delay)
+        self.received.append((SEQ.unpack_from(buf, SIZE_PREFIX_LENGTH)[0], time.monotonic()))
+        return True
+
+
+def read_loopback(port, connections, results):
+    """Runs in a child process, reads size prefixed frames from every connection until they close
+    and sends back the (seq, arrival time) of every frame per connection.
+    """
+    selector = selectors.DefaultSelector()
+    received = []
+    for index in range(connections):
+        sock = socket.create_connection(("127.0.0.1", port))
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ, (index, bytearray()))
+        received.append([])
+
+    open_connections = connections
+    while open_connections > 0:
+        for key, _ in selector.select():
+            index, pending = key.data
+            data = key.fileobj.recv(RECV_SIZE)
+            if not data:
+                selector.unregister(key.fileobj)
+                key.fileobj.close()
+                open_connections -= 1
+                continue
+
+            pending += data
+            arrival = time.monotonic()
+            while len(pending) >= HEADER_LENGTH:
+                size = SIZE_PREFIX.unpack_from(pending)[0]
+                if len(pending) < SIZE_PREFIX_LENGTH + size:
+                    break
+                received[index].append((SEQ.unpack_from(pending, SIZE_PREFIX_LENGTH)[0], arrival))
+                del pending[:SIZE_PREFIX_LENGTH + size]
+    results.send(received)
+
+
+class LoopbackSinks:
+    def __init__(self, count, engine=False):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen(count)
+        self.results, child_results = multiprocessing.Pipe(duplex=False)
+        self.reader = multiprocessing.Process(target=read_loopback,
+                                              args=(self.server.getsockname()[1], count, child_results))
+        self.reader.start()
+        self.engine = NetworkEngine() if engine else None
+        if self.engine:
+            self.engine.start()
+        self.outputs = []
+        for _ in range(count):
+            conn, address = self.server.accept()
+            if self.engine:
+                self.engine.add_connection(address, conn)
+            else:
+                self.outputs.append(ClientSocketWrap(conn, address))
+        if self.engine:
+            self.outputs = [self.engine]
+
+    def close(self):
+        if self.engine:
+            drain_deadline = time.monotonic() + DRAIN_TIMEOUT
+            while any(stats["pending_bytes"] for stats in self.engine.stats().values()) and \
+                    time.monotonic() < drain_deadline:
+                time.sleep(SAMPLE_INTERVAL)
+            self.engine.stop()
+            self.engine.join()
+        else:
+            for output in self.outputs:
+                output.close()
+        received = self.results.recv()
+        self.reader.join()
+        self.server.close()
+        return received
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def run_case(profile_name, outputs, sink, fps, duration, drop_policy, slow_outputs=0, slow_delay=0):
+    profile = PROFILES[profile_name]
+    body = os.urandom(max(profile["size"], profile["keyframe_size"]))
+    holder = WriterOutputHolder(drop_policy=drop_policy)
+    holder.start()
+    loopback = None
+    if sink in ("loopback", "engine"):
+        loopback = LoopbackSinks(outputs, engine=sink == "engine")
+        sinks = loopback.outputs
+    else:
+        sinks = [MemorySink() for _ in range(outputs)]
+    for index, output in enumerate(sinks):
+        holder.add_output("output_%d" % index, output)
+    # slow outputs only lose their own frames and aren't part of the results
+    for index in range(slow_outputs):
+        holder.add_output("slow_%d" % index, MemorySink(slow_delay))
+
+    samples = []
+    sampling = Event()
+    sampler_cpu = []
+
+    def sample():
+        cpu_start = time.thread_time()
+        while not sampling.wait(SAMPLE_INTERVAL):
+            samples.append((time.monotonic(),) + queue_depth(holder))
+        sampler_cpu.append(time.thread_time() - cpu_start)
+
+    sampler = Thread(target=sample)
+    sampler.start()
+
+    written = {}
+    cpu_start = time.process_time()
+    producer_cpu_start = time.thread_time()
+    start = time.monotonic()
+    end = start + duration
+    next_frame = start
+    seq = 0
+    while time.monotonic() < end:
+        if fps:
+            delay = next_frame - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            next_frame += 1.0 / fps
+        elif queue_depth(holder)[0] >= SATURATE_QUEUE_FRAMES:
+            time.sleep(0.0005)
+            continue
+
+        seq += 1
+        frame = make_frame(seq, profile, body)
+        written[seq] = time.monotonic()
+        holder.write(frame)
+
+    threads = active_count()
+
+    # let the holder write what it still has queued
+    for index in range(slow_outputs):
+        holder.remove_output("slow_%d" % index)
+    drain_deadline = time.monotonic() + DRAIN_TIMEOUT
+    while queue_depth(holder)[0] > 0 and time.monotonic() < drain_deadline:
+        time.sleep(SAMPLE_INTERVAL)
+    time.sleep(0.1)
+    producer_cpu = time.thread_time() - producer_cpu_start
+    sampling.set()
+    sampler.join()
+    cpu = time.process_time() - cpu_start - producer_cpu - sampler_cpu[0]
+    holder.stop()
+    holder.join()
+
+    received = loopback.close() if loopback else [output.received for output in sinks]
+    arrivals = {}
+    delivered = []
+    for output_received in received:
+        delivered.append(sum(1 for _, arrival in output_received if arrival <= end))
+        for frame_seq, arrival in output_received:
+            last = arrivals.setdefault(frame_seq, [0, 0])
+            last[0] += 1
+            last[1] = max(last[1], arrival)
+    latencies = sorted((arrivals[frame_seq][1] - written[frame_seq]) * 1000
+                       for frame_seq in written if frame_seq in arrivals and arrivals[frame_seq][0] == outputs)
+
+    growth = 0
+    if len(samples) > 1 and samples[-1][0] > samples[0][0]:
+        growth = (samples[-1][2] - samples[0][2]) / (samples[-1][0] - samples[0][0])
+    return {
+        "profile": profile_name,
+        "outputs": outputs,
+        "sink": sink,
+        "target_fps": fps,
+        "drop_policy": drop_policy,
+        "slow_outputs": slow_outputs,
+        "frames_written": seq,
+        "offered_fps": round(seq / duration, 2),
+        "delivered_fps": round(min(delivered) / duration, 2),
+        "latency_p50_ms": round(percentile(latencies, 0.5) or 0, 3),
+        "latency_p90_ms": round(percentile(latencies, 0.9) or 0, 3),
+        "latency_p99_ms": round(percentile(latencies, 0.99) or 0, 3),
+        "latency_max_ms": round(latencies[-1] if latencies else 0, 3),
+        "cpu_us_per_frame_per_output": round(cpu / max(seq, 1) / outputs * 1e6, 2),
+        "max_queue_frames": max((sample[1] for sample in samples), default=0),
+        "max_queue_bytes": max((sample[2] for sample in samples), default=0),
+        "queue_growth_bytes_per_s": int(growth),
+        "frames_lost": seq - len(latencies),
+        "threads": threads,
+    }
+
+
+def compare(results, baseline_path, tolerance):
+    """Prints the metrics that got worse than the baseline by more than tolerance, returns how many"""
+    with open(baseline_path) as baseline_file:
+        baseline = {(r["profile"], r["outputs"], r["sink"]): r for r in json.load(baseline_file)}
+
+    regressions = 0
+    for result in results:
+        base = baseline.get((result["profile"], result["outputs"], result["sink"]))
+        if base is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS:
+            old, new = base[metric], result[metric]
+            if not old:
+                continue
+            change = (new - old) / old
+            if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+                regressions += 1
+                print("REGRESSION %s %d outputs %s: %s %s -> %s (%+.0f%%)" % (
+                    result["profile"], result["outputs"], result["sink"], metric, old, new, change * 100))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--outputs", default=DEFAULT_OUTPUTS, help="comma separated output counts")
+    parser.add_argument("--profiles", default=",".join(PROFILES.keys()), help="comma separated frame profiles")
+    parser.add_argument("--sinks", default=DEFAULT_SINKS, help="memory, loopback and/or engine")
+    parser.add_argument("--fps", type=float, default=DEFAULT_FPS, help="0 writes frames as fast as they are taken")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION, help="seconds per case")
+    parser.add_argument("--drop-policy", default=DEFAULT_DROP_POLICY, choices=DROP_POLICIES)
+    parser.add_argument("--slow-outputs", type=int, default=0,
+                        help="extra outputs taking --slow-delay seconds per frame, left out of the results")
+    parser.add_argument("--slow-delay", type=float, default=DEFAULT_SLOW_DELAY)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="baseline results to check for regressions, exits with 1 if any")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    results = []
+    for profile in args.profiles.split(","):
+        for sink in args.sinks.split(","):
+            for outputs in map(int, args.outputs.split(",")):
+                result = run_case(profile, outputs, sink, args.fps, args.duration,
+                                  args.drop_policy, args.slow_outputs, args.slow_delay)
+                results.append(result)
+                print("%-11s %-8s %3d outputs %8.2f fps  p50 %8.3f ms  p99 %8.3f ms  %8.2f cpu us/frame/output"
+                      "  max queue %4d frames %10d bytes  lost %d  threads %d" % (
+                          profile, sink, outputs, result["delivered_fps"], result["latency_p50_ms"],
+                          result["latency_p99_ms"], result["cpu_us_per_frame_per_output"],
+                          result["max_queue_frames"], result["max_queue_bytes"], result["frames_lost"],
+                          result["threads"]))
+
+    if args.json:
+        with open(args.json, "w") as results_file:
+            json.dump(results, results_file, indent=2)
+
+    if args.compare and compare(results, args.compare, args.tolerance) > 0:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Frame assembly benchmark.
+
+Feeds synthetic encoder chunks through the FrameAssembler used by the SplitFrameStreamer
+and through the previous io.BytesIO based assembly, reporting time and allocations per frame.
+
+copies/frame counts the frame sized buffers allocated while assembling a frame
+(the copy of the encoder chunk into the assembly buffer happens on both paths and isn't counted).
+
+Usage: python3 benchmarks/bench_frame_assembly.py [--frames N] [--json results.json]
+"""
+import io
+import os
+import sys
+import json
+import time
+import struct
+import argparse
+import tracemalloc
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "picameleon"))
+from streamers.frame_assembler import FrameAssembler
+
+CHUNK_SIZE = 65536
+FRAME_PROFILES = {
+    "mjpeg_720p": 120000,
+    "mjpeg_1080p": 300000,
+    "h264_1080p": 60000,
+}
+
+
+class BytesIOAssembler:
+    """The assembly done by SplitFrameStreamer before the FrameAssembler"""
+
+    def __init__(self):
+        self.stream = io.BytesIO()
+
+    def __len__(self):
+        return self.stream.tell()
+
+    def write(self, buf):
+        self.stream.write(buf)
+
+    def finish(self):
+        self.stream.seek(0)
+        frame = self.stream.read()
+        self.stream.seek(0)
+        self.stream.truncate()
+        return frame, struct.pack('<L', len(frame)) + frame
+
+
+def make_chunks(frame_size):
+    frame = b'\xff\xd8' + os.urandom(frame_size - 2)
+    return [frame[i:i + CHUNK_SIZE] for i in range(0, frame_size, CHUNK_SIZE)]
+
+
+def assemble(assembler, chunks):
+    for chunk in chunks:
+        assembler.write(chunk)
+    frame, sized_frame = assembler.finish()
+    return len(frame) + len(sized_frame)
+
+
+def measure(assembler_factory, frame_size, frames):
+    chunks = make_chunks(frame_size)
+    assembler = assembler_factory()
+    # warm up so buffers reach their steady state size
+    for _ in range(10):
+        assemble(assembler, chunks)
+
+    start = time.perf_counter()
+    for _ in range(frames):
+        assemble(assembler, chunks)
+    elapsed = time.perf_counter() - start
+
+    allocated = 0
+    samples = min(frames, 50)
+    for _ in range(samples):
+        tracemalloc.start()
+        assemble(assembler, chunks)
+        allocated += tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    allocated_per_frame = allocated / samples
+    return {
+        "us_per_frame": round(elapsed / frames * 1e6, 2),
+        "bytes_allocated_per_frame": int(allocated_per_frame),
+        "copies_per_frame": round(allocated_per_frame / frame_size, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=2000)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for profile, frame_size in FRAME_PROFILES.items():
+        for name, factory in (("bytesio", BytesIOAssembler), ("frame_assembler", FrameAssembler)):
+            result = {"profile": profile, "frame_size": frame_size, "assembler": name,
+                      **measure(factory, frame_size, args.frames)}
+            results.append(result)
+            print("%-12s %-16s %10.2f us/frame %12d bytes allocated/frame %6.2f copies/frame" % (
+                profile, name, result["us_per_frame"], result["bytes_allocated_per_frame"], result["copies_per_frame"]))
+
+    if args.json:
+        with open(args.json, "w") as results_file:
+            json.dump(results, results_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Motion vector analysis benchmark.
+
+Runs MotionDetector.analyze over synthetic motion vector grids of the sizes the camera produces
+and compares it with the previous float64 path (sqrt of the squares, clipped and cast back to uint8),
+reporting time and bytes allocated per frame. The zones run only looks at the center quarter of the picture,
+the noise floor run learns a threshold for every macroblock, the blobs run also groups the moving macroblocks into blobs, which has to fit in the 40ms of a frame at 25 fps.
+
+Usage: python3 benchmarks/bench_motion.py [--frames N] [--json results.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+import numpy
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "picameleon"))
+from outputs.motion_detector import MotionDetector
+from utils.camera_backend import MOTION_DTYPE, motion_resolution
+
+RESOLUTIONS = {
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+}
+THRESHOLD = 15
+SENSITIVITY = 25
+GRIDS = 16  # different grids cycled through so the caches don't only ever see one
+ZONES = {"include": [{"rect": [0.25, 0.25, 0.5, 0.5]}]}
+
+
+class FloatMotionDetector(MotionDetector):
+    """The analysis done by MotionDetector before the integer path"""
+
+    def moving_blocks(self, motion_vectors):
+        magnitude = numpy.sqrt(
+            numpy.square(motion_vectors['x'].astype(numpy.float64)) +
+            numpy.square(motion_vectors['y'].astype(numpy.float64))
+        ).clip(0, 255).astype(numpy.uint8)
+        return (magnitude >= self.threshold).sum()
+
+
+def make_grids(resolution):
+    rng = numpy.random.default_rng(0)
+    grids = []
+    for _ in range(GRIDS):
+        grid = numpy.zeros(motion_resolution(resolution), dtype=MOTION_DTYPE)
+        grid['x'] = rng.integers(-20, 21, grid.shape)
+        grid['y'] = rng.integers(-20, 21, grid.shape)
+        grid['sad'] = rng.integers(0, 1024, grid.shape)
+        grids.append(grid)
+    return grids
+
+
+def measure(detector, grids, frames):
+    for grid in grids:
+        detector.analyze(grid)
+
+    start = time.perf_counter()
+    for index in range(frames):
+        detector.analyze(grids[index % GRIDS])
+    elapsed = time.perf_counter() - start
+
+    allocated = 0
+    samples = min(frames, 50)
+    for index in range(samples):
+        tracemalloc.start()
+        detector.analyze(grids[index % GRIDS])
+        allocated += tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {
+        "us_per_frame": round(elapsed / frames * 1e6, 2),
+        "bytes_allocated_per_frame": int(allocated / samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=5000)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for name, resolution in RESOLUTIONS.items():
+        grids = make_grids(resolution)
+        detectors = (
+            ("float", FloatMotionDetector(THRESHOLD, SENSITIVITY)),
+            ("integer", MotionDetector(THRESHOLD, SENSITIVITY)),
+            ("zones", MotionDetector(THRESHOLD, SENSITIVITY, ZONES)),
+            ("noise", MotionDetector(THRESHOLD, SENSITIVITY, noise_floor={})),
+            ("blobs", MotionDetector(THRESHOLD, SENSITIVITY, blobs={})),
+        )
+        for detector_name, detector in detectors:
+            result = {"resolution": name, "grid": list(grids[0].shape), "detector": detector_name,
+                      **measure(detector, grids, args.frames)}
+            results.append(result)
+            print("%-6s %-8s %10.2f us/frame %10d bytes allocated/frame" % (
+                name, detector_name, result["us_per_frame"], result["bytes_allocated_per_frame"]))
+
+    if args.json:
+        with open(args.json, "w") as results_file:
+            json.dump(results, results_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+SAD motion detection benchmark.
+
+Replays recorded motion arrays, one recording with motion and one without, through MotionDetector
+and through SADMotionDetector with a few SAD thresholds, reporting for every detector the share
+of frames it found motion in and the moving macroblocks per frame for both recordings,
+and the time it takes per frame.
+
+Usage: python3 benchmarks/bench_motion_sad.py [--motion motion.npy] [--still still.npy] [--repeat N] [--json results.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import numpy
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(os.path.join(ROOT, "picameleon"))
+from outputs.motion_detector import MotionDetector, SADMotionDetector
+
+THRESHOLD = 8  # the recordings are from a small 30x40 grid so the vectors are short
+SENSITIVITY = 10
+SAD_THRESHOLDS = (128, 256, 512)
+
+
+def detection(detector, frames):
+    moving = [detector.moving_blocks(frame) for frame in frames]
+    detected = sum(1 for blocks in moving if blocks > detector.sensitivity)
+    return round(detected / len(frames), 3), round(sum(moving) / len(frames), 1)
+
+
+def measure(detector, frames, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for frame in frames:
+            detector.analyze(frame)
+    return round((time.perf_counter() - start) / (repeat * len(frames)) * 1e6, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--motion", default=os.path.join(ROOT, "tests", "test_data", "motion_vectors.npy"))
+    parser.add_argument("--still", default=os.path.join(ROOT, "tests", "test_data", "no_motion_vectors.npy"))
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    motion, still = numpy.load(args.motion), numpy.load(args.still)
+    detectors = [("vectors", MotionDetector(THRESHOLD, SENSITIVITY))]
+    for sad_threshold in SAD_THRESHOLDS:
+        detectors.append(("sad>=%d" % sad_threshold, SADMotionDetector(THRESHOLD, SENSITIVITY, sad_threshold)))
+
+    results = []
+    for name, detector in detectors:
+        result = {"detector": name}
+        result["detected_with_motion"], result["moving_blocks_with_motion"] = detection(detector, motion)
+        result["detected_without_motion"], result["moving_blocks_without_motion"] = detection(detector, still)
+        result["us_per_frame"] = measure(detector, motion, args.repeat)
+        results.append(result)
+        print("%-8s with motion: %5.1f%% of frames %6.1f blocks/frame, without: %5.1f%% %6.1f blocks/frame, "
+              "%7.2f us/frame" % (name, result["detected_with_motion"] * 100, result["moving_blocks_with_motion"],
+                                  result["detected_without_motion"] * 100, result["moving_blocks_without_motion"],
+                                  result["us_per_frame"]))
+
+    if args.json:
+        with open(args.json, "w") as results_file:
+            json.dump(results, results_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
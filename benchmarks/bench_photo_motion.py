@@ -0,0 +1,111 @@
+"""
+Photo motion detection benchmark.
+
+Compares two pictures of every size the photo_motion_detection mode can be resized to, the way
+PhotoMotionDetection does it, on rgb, on luma only, on the Y planes of a yuv stream
+with a background model on those Y planes, by 16x16 tiles on rgb and on Y planes
+and with the previous pixel by pixel loop, reporting the time, frames per second and bytes allocated per frame.
+Everything runs on a single thread. The pictures only differ by noise so the loop can't
+stop early, which is what it spends most of its time on while nothing moves.
+
+Usage: python3 benchmarks/bench_photo_motion.py [--frames N] [--loop-frames N] [--json results.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+import numpy
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "picameleon"))
+from modes.photo_motion_detection import PicDiff, BackgroundModel, BlockDiff, THRESHOLD, LUMA_THRESHOLD, SENSITIVITY
+
+RESIZES = [(112, 80), (224, 160), (448, 320), (640, 480)]
+
+
+def loop_changed_pixels(prev_pic, new_pic, threshold, sensitivity):
+    """The comparison PhotoMotionDetection did before PicDiff"""
+    diff_count = 0
+    height, width = prev_pic.shape[:2]
+    for w in range(0, width):
+        for h in range(0, height):
+            diff_r = abs(int(prev_pic[h][w][0]) - int(new_pic[h][w][0]))
+            diff_g = abs(int(prev_pic[h][w][1]) - int(new_pic[h][w][1]))
+            diff_b = abs(int(prev_pic[h][w][2]) - int(new_pic[h][w][2]))
+            if diff_r + diff_g + diff_b > threshold:
+                diff_count += 1
+                if diff_count > sensitivity:
+                    return diff_count
+    return diff_count
+
+
+def make_pics(resize):
+    rng = numpy.random.default_rng(0)
+    width, height = resize
+    base = rng.integers(0, 256, (height, width, 3), dtype=numpy.uint8)
+    pics = []
+    for _ in range(2):
+        noise = rng.integers(-8, 9, base.shape)
+        pics.append(numpy.clip(base.astype(numpy.int16) + noise, 0, 255).astype(numpy.uint8))
+    return pics
+
+
+def measure(compare, pics, frames):
+    compare(*pics)
+    start = time.perf_counter()
+    for index in range(frames):
+        compare(pics[index % 2], pics[(index + 1) % 2])
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    compare(pics[1], pics[0])
+    allocated = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "ms_per_frame": round(elapsed / frames * 1e3, 3),
+        "frames_per_second": round(frames / elapsed, 1),
+        "bytes_allocated_per_frame": allocated,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--loop-frames", type=int, default=2, help="frames for the pixel by pixel loop")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for resize in RESIZES:
+        pics = make_pics(resize)
+        comparisons = (
+            ("loop", lambda a, b: loop_changed_pixels(a, b, THRESHOLD, SENSITIVITY), args.loop_frames),
+            ("rgb", PicDiff(THRESHOLD).changed_pixels, args.frames),
+            ("luma", PicDiff(LUMA_THRESHOLD, use_luma=True).changed_pixels, args.frames),
+        )
+        planes = [numpy.ascontiguousarray(pic[:, :, 1]) for pic in pics]
+        y_plane_diff = PicDiff(LUMA_THRESHOLD).changed_pixels
+        background = BackgroundModel(LUMA_THRESHOLD)
+        comparisons += (
+            ("yuv", lambda a, b: y_plane_diff(planes[a is pics[1]], planes[b is pics[1]]), args.frames),
+            ("background", lambda a, b: background.update(planes[b is pics[1]]), args.frames),
+            ("blocks", BlockDiff().changed_tiles, args.frames),
+        )
+        yuv_block_diff = BlockDiff().changed_tiles
+        comparisons += (
+            ("yuv blocks", lambda a, b: yuv_block_diff(planes[a is pics[1]], planes[b is pics[1]]), args.frames),
+        )
+        for name, compare, frames in comparisons:
+            result = {"resize": list(resize), "comparison": name, **measure(compare, pics, frames)}
+            results.append(result)
+            print("%4dx%-4d %-10s %10.3f ms/frame %10.1f fps %10d bytes allocated/frame" % (
+                resize[0], resize[1], name, result["ms_per_frame"], result["frames_per_second"],
+                result["bytes_allocated_per_frame"]))
+
+    if args.json:
+        with open(args.json, "w") as results_file:
+            json.dump(results, results_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,9 @@
 The contents of this file are mostly taken from the
 picamera example on how to stream jpeg to the web
 with a small adaptation by using the picameleon client
+
+To serve browsers from picameleon itself use the http_streaming mode,
+it serves /stream.mjpg and /snapshot.jpg without a client in between
 """
 
 import io
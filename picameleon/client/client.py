@@ -5,6 +5,7 @@ from json import dumps
 from dataclasses import dataclass
 from threading import Thread, Event, Lock
 from ..outputs import WriterOutputHolder
+from ..outputs.stream_protocol import MAGIC, FRAME_HEADER, FrameInfo, parse_frame_header
 
 DEFAULT_FRAME_FETCH_CHUNK_SIZE = 4096
 DEFAULT_STREAM_SERVER_PORT = 5555
@@ -24,6 +25,7 @@ class Client:
         self.address = address
         self.current_streams: Dict[str, StreamInfo] = {}
         self.current_frames: Dict[str, bytes] = {}
+        self.current_frame_info: Dict[str, FrameInfo] = {}
         self.output_holders: Dict[str, WriterOutputHolder] = {}
         self.__lock = Lock()
 
@@ -34,6 +36,11 @@ class Client:
         if self.current_streams[stream_id].event.wait(timeout):
             return self.current_frames[stream_id]
 
+    def get_frame_info(self, stream_id) -> FrameInfo:
+        """Returns the header of the last frame of a stream fetched with protocol 2, None for other streams
+        """
+        return self.current_frame_info.get(stream_id)
+
     def stop_stream(self, stream_id: str):
         with self.__lock:
             if stream_id in self.current_streams.keys():
@@ -103,14 +110,19 @@ class Client:
                      resize: list = None,
                      bitrate: int = None,
                      frame_size=DEFAULT_FRAME_FETCH_CHUNK_SIZE,
-                     size_prepended=True) -> None:
+                     size_prepended=True,
+                     protocol=1) -> None:
+        """With protocol 2 every frame comes with its metadata, see get_frame_info,
+        the server sends it in a header so size_prepended doesn't matter then
+        """
         with self.__lock:
             if stream_id in self.current_streams.keys():
                 raise Exception("stream with id %s is still active" % stream_id)
 
             event = Event()
             thread = Thread(target=self.__fetch_stream,
-                            args=(stream_id, stream_format, port, resize, bitrate, frame_size, size_prepended))
+                            args=(stream_id, stream_format, port, resize, bitrate, frame_size, size_prepended,
+                                  protocol))
             self.current_streams[stream_id] = StreamInfo(event, thread, True)
             self.current_frames[stream_id] = b''
             thread.start()
@@ -144,7 +156,8 @@ class Client:
                        resize: tuple = None,
                        bitrate: int = None,
                        frame_size=DEFAULT_FRAME_FETCH_CHUNK_SIZE,
-                       size_prepended=True) -> None:
+                       size_prepended=True,
+                       protocol=1) -> None:
         sock = socket.socket()
         sock.settimeout(1)
         try:
@@ -163,16 +176,32 @@ class Client:
                 stream_request["bitrate"] = bitrate
             if resize:
                 stream_request["resize"] = resize
+            if protocol > 1:
+                stream_request["protocol"] = protocol
 
             stream_request = dumps(stream_request).encode("utf-8")
             request_size = len(stream_request)
             sock.send(struct.pack('<L', request_size))
             sock.sendall(stream_request)
 
+            version, first_size = 1, None
+            if protocol > 1:
+                reply = recv_exactly(sock, len(MAGIC))
+                if reply == MAGIC:
+                    version = recv_exactly(sock, 1)[0]
+                else:
+                    # the server only speaks the first version, this is the size of the first frame or a refusal
+                    first_size = reply
+
             while self.current_streams[stream_id].running:
                 self.current_streams[stream_id].event.clear()
-                if size_prepended:
-                    frame_size = struct.unpack('<L', sock.recv(4))[0]
+                if version > 1:
+                    frame_info = parse_frame_header(recv_exactly(sock, FRAME_HEADER.size))
+                    frame_size = frame_info.size
+                    self.current_frame_info[stream_id] = frame_info
+                elif first_size is not None or size_prepended:
+                    frame_size = struct.unpack('<L', first_size or sock.recv(4))[0]
+                    first_size = None
                     if frame_size == 0:
                         break
 
@@ -192,6 +221,7 @@ class Client:
             with self.__lock:
                 del self.current_streams[stream_id]
                 del self.current_frames[stream_id]
+                self.current_frame_info.pop(stream_id, None)
 
     def trigger(self, port=DEFAULT_TRIGGER_SERVER_PORT):
         sock = socket.socket()
@@ -203,6 +233,16 @@ class Client:
             self.stop_stream(stream_id)
 
 
+def recv_exactly(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("connection closed by picameleon")
+        data += chunk
+    return data
+
+
 def parse_output(output: Any):
     if type(output) is str:
         return open(output, "w")
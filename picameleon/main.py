@@ -4,9 +4,10 @@ import signal
 from streamers.streamer import Streamer
 from croniter import croniter
 from datetime import datetime
-from utils.consts import GLOBALS
+from utils.consts import GLOBALS, OUTPUT_WORKERS
 from utils.single_picamera import SinglePiCamera
 from mode_executor.mode_executor import ModeExecutor
+from outputs.shared_executor import configure_shared_executor
 from apscheduler.executors.pool import ThreadPoolExecutor
 from apscheduler.schedulers.blocking import BlockingScheduler
 # Import Modes
@@ -15,6 +16,7 @@ from modes.network_streaming import NetworkStreamingMode
 from modes.network_serving import NetworkServingMode
 from modes.network_trigger import NetowrkTriggerMode
 from modes.photo_motion_detection import PhotoMotionDetection
+from modes.http_streaming import HTTPStreamingMode
 # Import Trigger Responses
 from trigger_responses.dummy import Dummy
 from trigger_responses.snapshot import Snapshot
@@ -31,7 +33,8 @@ MODE_MAP = {
     "network_streaming": NetworkStreamingMode,
     "network_serving": NetworkServingMode,
     "network_trigger": NetowrkTriggerMode,
-    "photo_motion_detection": PhotoMotionDetection
+    "photo_motion_detection": PhotoMotionDetection,
+    "http_streaming": HTTPStreamingMode
 }
 
 TRIGGER_RESPONSE_MAP = {
@@ -79,8 +82,9 @@ with open(sys.argv[1], "r") as config_file:
 
 # Load Globals
 if "globals" in config.keys():
-    for k, v in config["globals"]:
+    for k, v in config["globals"].items():
         GLOBALS[k] = v
+configure_shared_executor(GLOBALS[OUTPUT_WORKERS])
 
 if "camera_initialization_options" in config.keys():
     # Initialize singleton with the set configs
@@ -42,9 +42,12 @@ class BaseMode:
         if self.streamer and not self.streamer.output.has_outputs():
             self.streamer.stop()
 
-    def trigger_all(self):
+    def trigger_all(self, trigger_args=None):
         for trigger_response in self.trigger_responses:
-            trigger_response.trigger(self.name)
+            if trigger_args:
+                trigger_response.trigger(self.name, trigger_args)
+            else:
+                trigger_response.trigger(self.name)
 
     def detrigger_all(self):
         for trigger_response in self.trigger_responses:
@@ -0,0 +1,200 @@
+"""
+The HTTP Streaming mode.
+
+Serves the camera to browsers without a client in between:
+GET /stream.mjpg is a multipart/x-mixed-replace MJPEG stream and GET /snapshot.jpg the latest frame.
+
+A single mjpeg SplitFrameStreamer is encoded for all viewers. Its frames go to a NetworkEngine
+sharing the event loop that accepts and reads the requests, which sends every frame to all viewers
+from the same buffer after a part header built once per frame, so a viewer costs no encoding and no copies.
+A viewer that can't keep up skips frames, the others don't notice.
+"""
+
+import asyncio
+import socket
+from time import monotonic
+from threading import current_thread
+from .base import BaseMode
+from streamers.streamer import Streamer
+from outputs.network_engine import NetworkEngine, DEFAULT_MAX_SEND_BUFFER
+
+DEFAULT_LISTEN_ADDR = "0.0.0.0"
+DEFAULT_LISTEN_PORT = 8000
+DEFAULT_MAX_VIEWERS = 100
+ENGINE_OUTPUT_ID = "http_engine"
+STREAM_PATH = "/stream.mjpg"
+SNAPSHOT_PATH = "/snapshot.jpg"
+BOUNDARY = "FRAME"
+REQUEST_TIMEOUT = 5  # Seconds
+SNAPSHOT_TIMEOUT = 2  # Seconds to wait for a first frame
+MAX_REQUEST_SIZE = 8 * 1024
+RECV_SIZE = 1024
+LOOP_SLICE = .5  # Seconds the event loop runs per routine call
+NO_CACHE = {"Cache-Control": "no-cache, private", "Pragma": "no-cache", "Connection": "close"}
+
+
+def http_headers(status, headers):
+    lines = ["HTTP/1.1 %s" % status] + ["%s: %s" % (name, value) for name, value in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("ascii")
+
+
+class MultipartFraming:
+    """
+    Takes the place of stream_protocol.FrameHeaders in the NetworkEngine, the header of every frame
+    is the boundary and headers of its part, the CRLF ending the previous part comes first
+    """
+
+    def header(self, frame):
+        return self.buffer_header(frame.data)
+
+    def buffer_header(self, buffer, keyframe=True):
+        return ("\r\n--%s\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n" %
+                (BOUNDARY, len(buffer))).encode("ascii")
+
+
+class HTTPStreamingMode(BaseMode):
+    def __init__(self, config, trigger_responses):
+        super().__init__(config, trigger_responses)
+        self.name = "http_streaming"
+        self.listen_addr = config["listen_addr"] if "listen_addr" in config else DEFAULT_LISTEN_ADDR
+        self.listen_port = config["listen_port"] if "listen_port" in config else DEFAULT_LISTEN_PORT
+        self.max_viewers = config["max_viewers"] if "max_viewers" in config else DEFAULT_MAX_VIEWERS
+        self.max_send_buffer = config["max_send_buffer"] if "max_send_buffer" in config else DEFAULT_MAX_SEND_BUFFER
+        self.recording_options = config["recording_options"] if "recording_options" in config else {}
+        self.streamer = Streamer("mjpeg", recording_options=self.recording_options)
+        self.server_socket = None
+        self.engine = None
+        self.loop = None
+        self._accepting = None
+        self._requests = set()
+
+    def pre_routine(self):
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind((self.listen_addr, self.listen_port))
+        self.server_socket.listen()
+        self.server_socket.setblocking(False)
+
+        self.loop = asyncio.new_event_loop()
+        self.engine = NetworkEngine(self.max_send_buffer, replay=self._latest_frame, loop=self.loop,
+                                    framing=MultipartFraming())
+        self.engine.start()
+        self.streamer.output.add_output(ENGINE_OUTPUT_ID, self.engine)
+        self._accepting = self.loop.create_task(self._accept_clients())
+
+    def routine(self):
+        # everything happens in the loop, the routine only gives it time
+        self.loop.run_until_complete(asyncio.sleep(LOOP_SLICE))
+
+    def _latest_frame(self, until_seq):
+        # new viewers start with the latest frame instead of waiting for the next one,
+        # getting it twice if the engine wasn't handed it yet only shows the same picture a bit longer
+        frame = self.streamer.frames.latest()
+        return [frame] if frame is not None else []
+
+    async def _accept_clients(self):
+        while True:
+            try:
+                conn, client_address = await self.loop.sock_accept(self.server_socket)
+            except OSError as e:
+                print("Error accepting client:", e)
+                await asyncio.sleep(LOOP_SLICE)
+                continue
+
+            task = self.loop.create_task(self._serve_client(conn, client_address))
+            self._requests.add(task)
+            task.add_done_callback(self._requests.discard)
+
+    async def _read_request(self, conn):
+        data = b''
+        while b'\r\n\r\n' not in data:
+            if len(data) > MAX_REQUEST_SIZE:
+                raise ValueError("request headers are too large")
+            chunk = await self.loop.sock_recv(conn, RECV_SIZE)
+            if not chunk:
+                raise ConnectionError("connection closed by client")
+            data += chunk
+
+        method, path = data.split(b'\r\n', 1)[0].decode("ascii").split(" ")[:2]
+        # browsers add query strings to get around caches
+        return method, path.split("?", 1)[0]
+
+    async def _respond(self, conn, status, body=b'', content_type="text/plain"):
+        headers = {"Content-Type": content_type, "Content-Length": len(body), **NO_CACHE}
+        await self.loop.sock_sendall(conn, http_headers(status, headers))
+        if body:
+            await self.loop.sock_sendall(conn, body)
+
+    async def _send_snapshot(self, conn):
+        frame = self.streamer.frames.latest()
+        deadline = monotonic() + SNAPSHOT_TIMEOUT
+        while frame is None and monotonic() < deadline:
+            await asyncio.sleep(.05)
+            frame = self.streamer.frames.latest()
+
+        if frame is None:
+            await self._respond(conn, "503 Service Unavailable", b'no frame captured yet\n')
+            return
+        await self._respond(conn, "200 OK", frame.data, "image/jpeg")
+
+    def _add_viewer(self, conn, client_address):
+        greeting = http_headers("200 OK", {
+            "Content-Type": "multipart/x-mixed-replace; boundary=%s" % BOUNDARY, "Age": 0, **NO_CACHE})
+        self.engine.add_connection(client_address, conn, greeting=greeting, framed=True)
+
+    async def _handle(self, conn, client_address):
+        """Returns True if the connection was handed over to the engine
+        """
+        method, path = await self._read_request(conn)
+        if method != "GET":
+            await self._respond(conn, "405 Method Not Allowed", b'only GET is supported\n')
+        elif path == STREAM_PATH:
+            if len(self.engine.connections) >= self.max_viewers:
+                await self._respond(conn, "503 Service Unavailable", b'too many viewers\n')
+                return False
+            self._add_viewer(conn, client_address)
+            return True
+        elif path == SNAPSHOT_PATH:
+            await self._send_snapshot(conn)
+        else:
+            await self._respond(conn, "404 Not Found", b'not found\n')
+        return False
+
+    async def _serve_client(self, conn, client_address):
+        handed_over = False
+        try:
+            handed_over = await asyncio.wait_for(self._handle(conn, client_address), REQUEST_TIMEOUT)
+        except asyncio.TimeoutError:
+            print("client %s took too long, closing the connection" % str(client_address))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print("Error serving http client %s: %s" % (str(client_address), e))
+        finally:
+            if not handed_over:
+                conn.close()
+
+    def _stop_loop(self):
+        # the loop only runs in the routine, once the runner is done it can be wound down from here
+        if self.runner_thread is not None and self.runner_thread is not current_thread():
+            self.runner_thread.join()
+
+        tasks = [self._accepting, *self._requests]
+        for task in tasks:
+            task.cancel()
+        self.engine.stop()
+        self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        # lets the engine close its connections
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.loop.close()
+        self.loop = None
+
+    def _cleanup(self):
+        if self.loop is None:
+            return
+
+        self._stop_loop()
+        if self.streamer.output.has_output(ENGINE_OUTPUT_ID):
+            self.streamer.output.remove_output(ENGINE_OUTPUT_ID)
+        self.engine = None
+        self.server_socket.close()
@@ -5,10 +5,13 @@ It uses the SplitFrameStreamer with the mjpeg format to
 continuously capture and compare images.
 
 When motion is detected it will use the configured trigger response.
+With "blobs" configured the trigger responses get the blobs that were detected in their trigger_args.
+With "noise_floor" configured the thresholds are learned per macroblock from the scene.
+With "sad_threshold" configured macroblocks the encoder couldn't match well count as moving too.
 """
 
 from .base import BaseMode
-from outputs.motion_detector import MotionDetector, OUTPUT_ID
+from outputs.motion_detector import MotionDetector, SADMotionDetector, OUTPUT_ID
 from utils.single_picamera import SinglePiCamera
 from streamers.streamer import Streamer
 
@@ -19,13 +22,25 @@ class MotionDetectionMode(BaseMode):
         self.name = "motion_detection"
         self.recording_options = config["recording_options"] if "recording_options" in config else {}
 
+        self.zones = config["zones"] if "zones" in config else None
+        self.blobs = config["blobs"] if "blobs" in config else None
+        self.noise_floor = config["noise_floor"] if "noise_floor" in config else None
+        self.sad_threshold = config["sad_threshold"] if "sad_threshold" in config else None
+
         self.streamer = Streamer("h264", recording_options=self.recording_options)
-        # TODO: Add Motion Detector Configs
-        if self.streamer.motion_output.has_output(OUTPUT_ID):
-            self.motion_detector = self.streamer.motion_output.get_output(OUTPUT_ID)
+        # a configured detector only counts for the mode that configured it
+        configured = self.zones or self.blobs is not None or self.noise_floor is not None or \
+            self.sad_threshold is not None
+        self.output_id = "%s_%d" % (OUTPUT_ID, id(self)) if configured else OUTPUT_ID
+        if self.streamer.motion_output.has_output(self.output_id):
+            self.motion_detector = self.streamer.motion_output.get_output(self.output_id)
         else:
-            self.motion_detector = MotionDetector()
-            self.streamer.motion_output.add_output(OUTPUT_ID, self.motion_detector)
+            options = {"zones": self.zones, "blobs": self.blobs, "noise_floor": self.noise_floor}
+            if self.sad_threshold is not None:
+                self.motion_detector = SADMotionDetector(sad_threshold=self.sad_threshold, **options)
+            else:
+                self.motion_detector = MotionDetector(**options)
+            self.streamer.motion_output.add_output(self.output_id, self.motion_detector)
 
     def pre_routine(self):
         self.motion_detector.calibrate()
@@ -33,11 +48,11 @@ class MotionDetectionMode(BaseMode):
     def routine(self):
         # Wait until motion is detected
         if self.motion_detector.wait_for_motion(5):
-            self.trigger_all()
+            self.trigger_all({"blobs": self.motion_detector.blobs} if self.blobs is not None else None)
             # Wait until motion is no longer detected
             while not self.motion_detector.calibrate(no_motion_seconds=5):
                 pass
             self.detrigger_all()
 
     def _cleanup(self):
-        self.streamer.motion_output.remove_output(OUTPUT_ID)
+        self.streamer.motion_output.remove_output(self.output_id)
@@ -3,11 +3,17 @@ import json
 import redis
 import socket
 import struct
+import asyncio
 from time import sleep
-from threading import Thread, Lock
+from threading import Thread, Lock, current_thread
 from .base import BaseMode
 from streamers.streamer import Streamer
+from streamers.gop_cache import DEFAULT_GOP_CACHE_SIZE
+from streamers.derived import source_resolution
 from outputs.client_socket_wrap import ClientSocketWrap
+from outputs.output_queue import DROP_POLICIES
+from outputs.network_engine import NetworkEngine, DEFAULT_MAX_SEND_BUFFER
+from outputs.stream_protocol import FrameHeaders, negotiate, handshake
 from queue import Queue
 
 DEFAULT_MAX_STREAMS = 2
@@ -15,6 +21,10 @@ DEFAULT_REDIS_ADDR = "redis_streaming"
 DEFAULT_REDIS_PORT = 6379
 DEFAULT_LISTEN_ADDR = "0.0.0.0"
 DEFAULT_LISTEN_PORT = 5555
+ENGINE_OUTPUT_ID = "network_engine"
+REQUEST_TIMEOUT = 5  # Seconds
+MAX_REQUEST_SIZE = 64 * 1024
+LOOP_SLICE = .5  # Seconds the event loop runs per routine call
 STREAM_ID = int(os.getenv("STREAMER_ID", 0))
 NODE_ADDR = os.getenv("NODE_ADDR", "")
 
@@ -41,12 +51,31 @@ class NetworkServingMode(BaseMode):
         self.socket_map = {}
         self.socket_to_stream = {}
         self.streamer_map = {}
+        self.engine_map = {}
         self._lock = Lock()
         self._unregister_queue = Queue()
 
         # Streamer init options
         self.prepend_size = config["prepend_size"] if "prepend_size" in config else False
         self.recording_options = config["recording_options"] if "recording_options" in config else {}
+        self.gop_cache_size = config["gop_cache_size"] if "gop_cache_size" in config else DEFAULT_GOP_CACHE_SIZE
+
+        # Output queue options, clients can ask for another drop policy in their request
+        self.drop_policy = config["drop_policy"] if "drop_policy" in config else None
+        self.queue_size = config["queue_size"] if "queue_size" in config else None
+
+        # Write to all clients of a stream from a single event loop instead of a thread per client
+        self.network_engine = config["network_engine"] if "network_engine" in config else False
+        self.max_send_buffer = config["max_send_buffer"] if "max_send_buffer" in config else DEFAULT_MAX_SEND_BUFFER
+
+        # Accept, read requests and write frames for all clients from one event loop run by the routine,
+        # a client that is slow to send its request doesn't hold back the others
+        self.event_loop = config["event_loop"] if "event_loop" in config else False
+        if self.event_loop:
+            self.network_engine = True
+        self.loop = None
+        self._accepting = None
+        self._requests = set()
 
     def pre_routine(self):
         # Initialize server socket
@@ -55,6 +84,10 @@ class NetworkServingMode(BaseMode):
         self.server_socket.bind((self.listen_addr, self.listen_port))
         self.server_socket.listen()
         self.is_listening = True
+        if self.event_loop:
+            self.server_socket.setblocking(False)
+            self.loop = asyncio.new_event_loop()
+            self._accepting = self.loop.create_task(self._accept_clients())
         
         # Register at redis
         if self.enable_redis_discovery:
@@ -80,21 +113,98 @@ class NetworkServingMode(BaseMode):
 
     def cleanup_output(self, output_id):
         with self._lock:
-            del self.socket_map[output_id]
+            self.socket_map.pop(output_id, None)
             if output_id in self.socket_to_stream:
                 streamer_id = self.socket_to_stream[output_id]
+                if streamer_id in self.engine_map:
+                    self._cleanup_engine(streamer_id)
+                    del self.socket_to_stream[output_id]
+                    return
+
                 # at this point the output hasn't been removed yet because the callback didn't return, so the number of outputs should be 1
                 if streamer_id in self.streamer_map and len(self.streamer_map[streamer_id].output.outputs) == 1:
                     self.streamer_map[streamer_id].stop()
                     del self.streamer_map[streamer_id]
                 del self.socket_to_stream[output_id]
 
+    def _get_engine(self, stream_key, streamer):
+        if stream_key not in self.engine_map:
+            engine = NetworkEngine(self.max_send_buffer, replay=streamer.output.replay, loop=self.loop,
+                                   framing=FrameHeaders(streamer.format, source_resolution(streamer)))
+            engine.start()
+            streamer.output.add_output(ENGINE_OUTPUT_ID, engine)
+            self.engine_map[stream_key] = engine
+        return self.engine_map[stream_key]
+
+    def _cleanup_engine(self, stream_key):
+        # the engine calls back once the connection is gone, so it's the last one if none are left
+        engine = self.engine_map[stream_key]
+        if engine.has_connections():
+            return
+
+        engine.stop()
+        del self.engine_map[stream_key]
+        if stream_key in self.streamer_map:
+            streamer = self.streamer_map[stream_key]
+            if streamer.output.has_output(ENGINE_OUTPUT_ID):
+                streamer.output.remove_output(ENGINE_OUTPUT_ID)
+            # other modes may still be writing the stream somewhere else
+            if not streamer.output.has_outputs():
+                streamer.stop()
+                del self.streamer_map[stream_key]
+
     def parse_request(self, conn: socket) -> dict:
         conn.settimeout(5)
         input_length = struct.unpack('<L', conn.recv(4))[0]
         request = json.loads(conn.recv(input_length))
         return request
 
+    async def _accept_clients(self):
+        while True:
+            try:
+                conn, client_address = await self.loop.sock_accept(self.server_socket)
+            except OSError as e:
+                # most likely out of file descriptors, the clients already connected keep being served
+                print("Error accepting client:", e)
+                await asyncio.sleep(LOOP_SLICE)
+                continue
+
+            task = self.loop.create_task(self._read_request(conn, client_address))
+            self._requests.add(task)
+            task.add_done_callback(self._requests.discard)
+
+    async def _recv_exactly(self, conn, size):
+        data = b''
+        while len(data) < size:
+            chunk = await self.loop.sock_recv(conn, size - len(data))
+            if not chunk:
+                raise ConnectionError("connection closed by client")
+            data += chunk
+        return data
+
+    async def _parse_request(self, conn):
+        input_length = struct.unpack('<L', await self._recv_exactly(conn, 4))[0]
+        if input_length > MAX_REQUEST_SIZE:
+            raise ValueError("request of %d bytes is too large" % input_length)
+        return json.loads(await self._recv_exactly(conn, input_length))
+
+    async def _read_request(self, conn, client_address):
+        try:
+            options = await asyncio.wait_for(self._parse_request(conn), REQUEST_TIMEOUT)
+        except asyncio.CancelledError:
+            conn.close()
+            raise
+        except asyncio.TimeoutError:
+            print("client %s didn't send its request in time" % str(client_address))
+            conn.close()
+            return
+        except Exception as e:
+            print("Error reading request of client %s: %s" % (str(client_address), e))
+            conn.close()
+            return
+
+        self.serve_client(conn, client_address, options)
+
     def can_serve_client(self, stream_key: str, options = None) -> bool:
         default_options = {"format": "h264"}
         if options is None:
@@ -102,6 +212,11 @@ class NetworkServingMode(BaseMode):
         else:
             options = {**default_options, **options}
 
+        # a stream that is already shedding frames can't take another client
+        if stream_key in self.streamer_map and self.streamer_map[stream_key].output.shedding:
+            print("stream %s is overloaded, not taking new clients" % stream_key)
+            return False
+
         if stream_key not in self.streamer_map:
             if len(self.streamer_map) >= self.max_streams:
                 return False
@@ -111,6 +226,7 @@ class NetworkServingMode(BaseMode):
                 del options["format"]
                 self.streamer_map[stream_key] = Streamer(vformat,
                                                          prepend_size=self.prepend_size,
+                                                         gop_cache_size=self.gop_cache_size,
                                                          recording_options={
                                                              **self.recording_options,
                                                              **options
@@ -121,53 +237,118 @@ class NetworkServingMode(BaseMode):
         return True
 
     def routine(self):
+        if self.loop is not None:
+            # everything happens in the loop, the routine only gives it time
+            self.loop.run_until_complete(asyncio.sleep(LOOP_SLICE))
+            return
+
         conn, client_address = self.server_socket.accept()
-        stream_key = ""
         try:
             options = self.parse_request(conn)
+        except Exception as e:
+            print("Error in network serving routine:", e)
+            conn.close()
+            return
+        self.serve_client(conn, client_address, options)
+
+    def serve_client(self, conn, client_address, options):
+        stream_key = ""
+        try:
+            drop_policy = options.pop("drop_policy", self.drop_policy)
+            # clients that don't ask for a protocol version speak the first one
+            protocol = negotiate(options.pop("protocol", 1))
             stream_key = streamer_key(options)
             with self._lock:
-                if not self.can_serve_client(stream_key, options):
+                if (drop_policy is not None and drop_policy not in DROP_POLICIES) or \
+                        not self.can_serve_client(stream_key, options):
                     conn.sendall(struct.pack('<L', 0))
                     conn.close()
                     return
 
-                client_socket = ClientSocketWrap(conn, client_address, self.cleanup_output)
+                streamer = self.streamer_map[stream_key]
+                if self.network_engine:
+                    engine = self._get_engine(stream_key, streamer)
+                    self.socket_to_stream[client_address] = stream_key
+                    self.socket_map[client_address] = engine.add_connection(
+                        client_address, conn, self.cleanup_output,
+                        greeting=handshake(protocol) if protocol > 1 else None, framed=protocol > 1)
+                    if not streamer.is_running:
+                        streamer.start()
+                    return
+
+                framing = None
+                if protocol > 1:
+                    conn.sendall(handshake(protocol))
+                    framing = FrameHeaders(streamer.format, source_resolution(streamer))
+                # writes block, a stalled client holds one of the streamer's lane slots until it times out
+                client_socket = ClientSocketWrap(conn, client_address, self.cleanup_output, framing)
                 self.socket_map[client_address] = client_socket
                 self.socket_to_stream[client_address] = stream_key
 
-                streamer = self.streamer_map[stream_key]
                 if len(self.socket_map) >= 1 and not streamer.is_running:
                     streamer.start()
 
-                streamer.output.add_output(client_address, client_socket)
+                streamer.output.add_output(client_address, client_socket,
+                                           drop_policy=drop_policy, queue_size=self.queue_size)
         except Exception as e:
             print("Error in network serving routine:", e)
-            if client_address in self.socket_map.keys():
-                self.socket_map[client_address].close()
+            # other clients may be on the stream already, it only goes once nobody is left on it
+            with self._lock:
+                client_socket = self.socket_map.get(client_address)
+                if stream_key in self.engine_map:
+                    # engine connections call back to cleanup_output once they are gone
+                    if client_socket is None and not self.engine_map[stream_key].has_connections():
+                        self._cleanup_engine(stream_key)
+                else:
+                    self.socket_map.pop(client_address, None)
+                    self.socket_to_stream.pop(client_address, None)
+                    if stream_key in self.streamer_map and stream_key not in self.socket_to_stream.values():
+                        self.streamer_map[stream_key].stop()
+                        del self.streamer_map[stream_key]
+
+            if client_socket is not None:
+                client_socket.close()
             else:
                 conn.close()
 
-            if client_address in self.socket_to_stream.keys():
-                del self.socket_to_stream[client_address]
+    def _stop_loop(self):
+        # the loop only runs in the routine, once the runner is done it can be wound down from here
+        if self.runner_thread is not None and self.runner_thread is not current_thread():
+            self.runner_thread.join()
 
-            if stream_key in self.streamer_map.keys():
-                streamer.stop()
-                del self.streamer_map[stream_key]
+        tasks = [self._accepting, *self._requests]
+        for task in tasks:
+            task.cancel()
+        for engine in list(self.engine_map.values()):
+            engine.stop()
+        self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        # lets the engines close their connections
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.loop.close()
+        self.loop = None
 
     def _cleanup(self):
+        if self.loop is not None:
+            self._stop_loop()
+
         sockets_to_clean = [s for s in self.socket_map.values()]
         for sock in sockets_to_clean:
             sock.close()
 
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            try:
-                s.connect((self.listen_addr, self.listen_port))
-            except:
-                pass
+        if not self.event_loop:
+            # unblocks the accept of the routine
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+                try:
+                    s.connect((self.listen_addr, self.listen_port))
+                except:
+                    pass
+
+        for engine in self.engine_map.values():
+            engine.stop()
 
         self.socket_map = {}
         self.socket_to_stream = {}
+        self.engine_map = {}
         self.server_socket.close()
         self.is_listening = False
         if self.redis_announcer:
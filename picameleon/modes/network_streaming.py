@@ -3,6 +3,7 @@ from time import sleep
 from .base import BaseMode
 from outputs.server_socket_wrap import SocketWrap, SOCKET_TYPES
 from streamers.streamer import Streamer
+from streamers.gop_cache import DEFAULT_GOP_CACHE_SIZE
 
 DEFAULT_FORMAT = "h264"
 
@@ -27,7 +28,11 @@ class NetworkStreamingMode(BaseMode):
 
         prepend_size = config["prepend_size"] if "prepend_size" in config else False
         recording_options = config["recording_options"] if "recording_options" in config else {}
-        self.streamer = Streamer(self.format, prepend_size=prepend_size, recording_options=recording_options)
+        gop_cache_size = config["gop_cache_size"] if "gop_cache_size" in config else DEFAULT_GOP_CACHE_SIZE
+        self.streamer = Streamer(self.format, prepend_size=prepend_size, recording_options=recording_options,
+                                 gop_cache_size=gop_cache_size)
+        self.drop_policy = config["drop_policy"] if "drop_policy" in config else None
+        self.queue_size = config["queue_size"] if "queue_size" in config else None
 
     def _read_hosts_file(self, retry=False, retries=5, timeout=2):
         retry_count = 0
@@ -91,7 +96,8 @@ class NetworkStreamingMode(BaseMode):
                 print("%s is not connected. Trying to reconnect." % host)
                 if sock.connect():
                     if not self.streamer.output.has_output(host):
-                        self.streamer.output.add_output(host, sock)
+                        self.streamer.output.add_output(host, sock, drop_policy=self.drop_policy,
+                                                        queue_size=self.queue_size)
                 else:
                     if self.streamer.output.has_output(host):
                         self.streamer.output.remove_output(host)
@@ -1,6 +1,8 @@
 class ClientSocketWrap:
-    def __init__(self, client_socket, client_address, cleanup=None):
+    def __init__(self, client_socket, client_address, cleanup=None, framing=None):
         self.cleanup = cleanup
+        # stream_protocol.FrameHeaders for clients speaking version 2, they get a header before every frame
+        self.framing = framing
         self.client_address = client_address
         self.client_socket = client_socket
         self.is_connected = True
@@ -23,3 +25,8 @@ class ClientSocketWrap:
             self.close()
             return False
         return True
+
+    def write_frame(self, frame, timeout=5):
+        if self.framing is None:
+            return self.write(frame.payload, timeout)
+        return self.write(self.framing.header(frame), timeout) and self.write(frame.data, timeout)
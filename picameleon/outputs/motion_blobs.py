@@ -0,0 +1,119 @@
+"""
+Motion blobs.
+
+Groups the moving macroblocks of a motion grid into blobs of 4-connected macroblocks,
+so a person walking by can be told apart from noise scattered over the picture.
+Blobs smaller than min_area are dropped, the others have to keep showing up in persistence
+consecutive frames, overlapping the blob they were in the previous frame, before they count.
+
+Labelling is done with numpy only: the runs of moving macroblocks in every row are joined with
+the runs they touch in the next row, union-find style, a few vectorized passes even for large blobs.
+
+Blobs are reported as dicts with their area in macroblocks and their bounding box [x, y, width, height]
+and centroid [x, y] relative to the picture, like the zones in motion_zones.
+"""
+
+import numpy
+
+DEFAULT_MIN_AREA = 4  # Number of macroblocks
+DEFAULT_PERSISTENCE = 3  # Number of frames
+
+
+def label_blobs(moving):
+    """Returns a grid with the flat index of the first macroblock of its blob for every moving macroblock
+    and moving.size for the ones that didn't move
+    """
+    rows, cols = moving.shape
+    none = moving.size
+    # macroblocks next to each other in a row are joined from the start, only the runs are labelled
+    starts = moving.copy()
+    starts[:, 1:] &= ~moving[:, :-1]
+    run_starts = numpy.flatnonzero(starts)
+    run_of_cell = numpy.cumsum(starts.reshape(-1)).reshape(rows, cols) - 1
+    touching = moving[:-1] & moving[1:]
+    above, below = run_of_cell[:-1][touching], run_of_cell[1:][touching]
+
+    # every run points to a run of its blob before it, runs touching another blob hook
+    # the larger root onto the smaller one, then the pointers are followed to the roots again
+    parent = numpy.arange(len(run_starts))
+    while True:
+        parent_above, parent_below = parent[above], parent[below]
+        joined = parent_above != parent_below
+        if not joined.any():
+            break
+        parent_above, parent_below = parent_above[joined], parent_below[joined]
+        numpy.minimum.at(parent, numpy.maximum(parent_above, parent_below), numpy.minimum(parent_above, parent_below))
+        while True:
+            jumped = parent[parent]
+            if numpy.array_equal(jumped, parent):
+                break
+            parent = jumped
+
+    labels = numpy.full(none, none)
+    cells = numpy.flatnonzero(moving)
+    labels[cells] = run_starts[parent[run_of_cell.reshape(-1)[cells]]]
+    return labels.reshape(rows, cols)
+
+
+class BlobFilter:
+    """
+    Keeps the blobs of the previous frame to follow them, not meant to be updated from more than one thread
+    """
+
+    def __init__(self, min_area=DEFAULT_MIN_AREA, persistence=DEFAULT_PERSISTENCE):
+        self.min_area = max(int(min_area), 1)
+        self.persistence = max(int(persistence), 1)
+        self._ages = None
+
+    def reset(self):
+        self._ages = None
+
+    def update(self, moving):
+        """Takes the moving macroblocks of a frame, without the extra column of the motion data,
+        and returns the blobs that are large enough and were seen for long enough
+        """
+        if self._ages is None or self._ages.shape != moving.shape:
+            self._ages = numpy.zeros(moving.shape, dtype=numpy.int32)
+
+        # not even all of them together would make a blob that counts
+        if numpy.count_nonzero(moving) < self.min_area:
+            self._ages.fill(0)
+            return []
+
+        # blobs are known by their label so everything per blob is indexed by it
+        labels = label_blobs(moving).reshape(-1)
+        cells = numpy.flatnonzero(labels < moving.size)
+        blob_of_cell = labels[cells]
+        areas = numpy.bincount(blob_of_cell, minlength=moving.size)
+        large = areas >= self.min_area
+        cells, blob_of_cell = cells[large[blob_of_cell]], blob_of_cell[large[blob_of_cell]]
+
+        # a blob is one frame older than the oldest blob it overlaps in the previous frame
+        ages = numpy.zeros(moving.size, dtype=numpy.int32)
+        numpy.maximum.at(ages, blob_of_cell, self._ages.reshape(-1)[cells])
+        ages += 1
+        self._ages.fill(0)
+        self._ages.reshape(-1)[cells] = ages[blob_of_cell]
+
+        found = numpy.flatnonzero(large & (ages >= self.persistence))
+        if len(found) == 0:
+            return []
+
+        # the label is the first macroblock of the blob so its row is the top one
+        rows, cols = numpy.divmod(cells, moving.shape[1])
+        top = found // moving.shape[1]
+        left, right = numpy.full(moving.size, moving.shape[1]), numpy.zeros(moving.size, dtype=cols.dtype)
+        bottom = numpy.zeros(moving.size, dtype=rows.dtype)
+        numpy.minimum.at(left, blob_of_cell, cols)
+        numpy.maximum.at(right, blob_of_cell, cols)
+        numpy.maximum.at(bottom, blob_of_cell, rows)
+        row_sums = numpy.bincount(blob_of_cell, weights=rows, minlength=moving.size)
+        col_sums = numpy.bincount(blob_of_cell, weights=cols, minlength=moving.size)
+
+        height, width = moving.shape
+        bboxes = numpy.round(numpy.stack((left[found] / width, top / height, (right[found] + 1 - left[found]) / width,
+                                          (bottom[found] + 1 - top) / height), axis=1), 4).tolist()
+        centroids = numpy.round(numpy.stack(((col_sums[found] / areas[found] + 0.5) / width,
+                                             (row_sums[found] / areas[found] + 0.5) / height), axis=1), 4).tolist()
+        return [{"area": area, "bbox": bbox, "centroid": centroid}
+                for area, bbox, centroid in zip(areas[found].tolist(), bboxes, centroids)]
@@ -1,35 +1,127 @@
 """
 The Motion Detection class.
+
+A macroblock moved when the magnitude of its motion vector reaches the threshold,
+that is compared without floats or square roots as x*x + y*y >= threshold*threshold.
+The squares go to scratch buffers allocated once per motion grid size.
+
+With zones (see motion_zones) the moving macroblocks are masked with the zones before counting,
+a single pass that costs less than gathering the macroblocks inside them first.
+
+With blobs (see motion_blobs) motion is only detected when the moving macroblocks form a blob
+large enough and seen for long enough, the blobs of the last analyzed frame are kept in blobs.
+
+With a noise floor (see motion_noise) every macroblock gets its own threshold learned from the scene,
+threshold is then the smallest one any macroblock can have.
+
+SADMotionDetector also takes the sum of absolute differences (SAD) the encoder reports for every macroblock,
+so the macroblocks it couldn't match well, which end up intra coded or with a small vector, count as moving too.
 """
 
+import math
 import numpy
 from threading import Event
-from utils.consts import GLOBALS, MOTION_DETECTOR_THRESHOLD, MOTION_DETECTOR_SENSITIVITY
+from utils.consts import GLOBALS, MOTION_DETECTOR_THRESHOLD, MOTION_DETECTOR_SENSITIVITY, MOTION_DETECTOR_SAD_THRESHOLD
+from .motion_zones import zones_mask
+from .motion_blobs import BlobFilter
+from .motion_noise import NoiseFloor
 
 OUTPUT_ID = "motion_detector"
 
 
+def squared_threshold(threshold):
+    """The smallest x*x + y*y whose magnitude, truncated like before to an integer, reaches threshold
+    """
+    if threshold <= 0:
+        return 0
+    # int8 vectors never get past 128*128 + 128*128
+    return min(math.ceil(threshold) ** 2, numpy.iinfo(numpy.uint16).max)
+
+
 class MotionDetector:
-    def __init__(self, threshold=GLOBALS[MOTION_DETECTOR_THRESHOLD], sensitivity=GLOBALS[MOTION_DETECTOR_SENSITIVITY]):
+    """
+    Not meant to analyze more than one array at a time, MotionOutputHolder never does that
+    """
+
+    def __init__(self, threshold=GLOBALS[MOTION_DETECTOR_THRESHOLD], sensitivity=GLOBALS[MOTION_DETECTOR_SENSITIVITY],
+                 zones=None, blobs=None, noise_floor=None):
         self.threshold = threshold
         self.sensitivity = sensitivity
+        self.squared_threshold = squared_threshold(threshold)
+        self.zones = zones
+        if zones:
+            # fail on a bad zone when configured instead of on the first frame
+            zones_mask(zones, (2, 3))
+        self._zone_mask = None
+        # blobs is the config of the filter, e.g. {"min_area": 4, "persistence": 3}
+        self.blob_filter = BlobFilter(**blobs) if blobs is not None else None
+        self.blobs = []
+        # noise_floor is the config of the learning, e.g. {"alpha": 0.02, "deviations": 3}
+        self.noise_floor = NoiseFloor(math.sqrt(self.squared_threshold), **noise_floor) \
+            if noise_floor is not None else None
         self.motion_detected = Event()
         self.save = True
         self.motion_vectors_list = []
         self.start = 0
+        self._squares = None
+
+    def _scratch(self, shape):
+        if self._squares is None or self._squares[0].shape != shape:
+            self._squares = (numpy.empty(shape, dtype=numpy.int16), numpy.empty(shape, dtype=numpy.int16),
+                             numpy.empty(shape, dtype=numpy.bool_))
+        return self._squares
+
+    def _zones(self, shape):
+        if self._zone_mask is None or self._zone_mask.shape != shape:
+            self._zone_mask = zones_mask(self.zones, shape)
+        return self._zone_mask
+
+    def moving(self, motion_vectors):
+        """Returns a scratch mask of the macroblocks whose motion vector magnitude reaches the threshold,
+        it is overwritten by the next call
+        """
+        x_squared, y_squared, moving = self._scratch(motion_vectors.shape)
+        # widening in place first keeps the multiplications from allocating cast buffers
+        numpy.copyto(x_squared, motion_vectors['x'])
+        numpy.copyto(y_squared, motion_vectors['y'])
+        numpy.multiply(x_squared, x_squared, out=x_squared)
+        numpy.multiply(y_squared, y_squared, out=y_squared)
+        # squares are at most 128*128 so their sum only fits as unsigned
+        squared = x_squared.view(numpy.uint16)
+        numpy.add(squared, y_squared.view(numpy.uint16), out=squared)
+        if self.noise_floor is not None:
+            self.noise_floor.update(squared, self.squared_threshold, moving)
+        else:
+            numpy.greater_equal(squared, self.squared_threshold, out=moving)
+        self._also_moving(motion_vectors, moving)
+        if self.zones:
+            numpy.logical_and(moving, self._zones(moving.shape), out=moving)
+        return moving
+
+    def _also_moving(self, motion_vectors, moving):
+        """Marks macroblocks found moving by other means than their motion vector in moving
+        """
+        pass
+
+    def moving_blocks(self, motion_vectors):
+        """Returns the number of macroblocks whose motion vector magnitude reaches the threshold
+        """
+        return numpy.count_nonzero(self.moving(motion_vectors))
 
-    # Jsonify numpy arrays
-    # https://stackoverflow.com/questions/26646362/numpy-array-is-not-json-serializable
     def analyze(self, motion_vectors):
         self.motion_detected.clear()
-        motion_vectors = numpy.sqrt(
-            numpy.square(motion_vectors['x'].astype(numpy.float)) +
-            numpy.square(motion_vectors['y'].astype(numpy.float))
-        ).clip(0, 255).astype(numpy.uint8)
-        if (motion_vectors >= self.threshold).sum() > self.sensitivity:
+        if self.blob_filter is not None:
+            # the extra column of the motion data isn't part of the picture
+            self.blobs = self.blob_filter.update(self.moving(motion_vectors)[:, :-1])
+            if self.blobs:
+                self.motion_detected.set()
+        elif self.moving_blocks(motion_vectors) > self.sensitivity:
             self.motion_detected.set()
 
     def calibrate(self, no_motion_seconds=5, max_resets=5):
+        # the noise floor has to have seen the scene before anything it lets through means something
+        if self.noise_floor is not None and not self.noise_floor.ready.wait(no_motion_seconds * max_resets):
+            return False
         reset_count = 0
         while self.motion_detected.wait(no_motion_seconds):
             reset_count += 1
@@ -39,3 +131,21 @@ class MotionDetector:
 
     def wait_for_motion(self, timeout=None):
         return self.motion_detected.wait(timeout)
+
+
+class SADMotionDetector(MotionDetector):
+    """
+    A macroblock moved when its motion vector reaches the threshold or its SAD reaches sad_threshold
+    """
+
+    def __init__(self, threshold=GLOBALS[MOTION_DETECTOR_THRESHOLD], sensitivity=GLOBALS[MOTION_DETECTOR_SENSITIVITY],
+                 sad_threshold=GLOBALS[MOTION_DETECTOR_SAD_THRESHOLD], **kwargs):
+        super().__init__(threshold, sensitivity, **kwargs)
+        self.sad_threshold = min(int(sad_threshold), numpy.iinfo(numpy.uint16).max)
+        self._sad_moving = None
+
+    def _also_moving(self, motion_vectors, moving):
+        if self._sad_moving is None or self._sad_moving.shape != moving.shape:
+            self._sad_moving = numpy.empty(moving.shape, dtype=numpy.bool_)
+        numpy.greater_equal(motion_vectors['sad'], self.sad_threshold, out=self._sad_moving)
+        numpy.logical_or(moving, self._sad_moving, out=moving)
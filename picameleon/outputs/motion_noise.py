@@ -0,0 +1,116 @@
+"""
+Motion noise floor.
+
+Learns how much every macroblock moves when nothing is going on, keeping an exponential moving average
+of the mean and variance of its motion vector magnitude, and derives a threshold for every macroblock
+from it: mean + deviations * standard deviation, never below the threshold of the detector.
+So the noise of a dark scene at night or of leaves in the wind raises the thresholds where it happens
+without a different config for it.
+
+Macroblocks that are moving learn at a tenth of the rate (moving_rate) so something that stops
+in the picture is only slowly taken for the scene. The first frames are averaged evenly,
+until warmup frames were seen the thresholds are only the threshold of the detector.
+
+The thresholds are kept squared like in MotionDetector, everything is done in place on float32 arrays
+allocated once per motion grid size.
+"""
+
+import numpy
+from threading import Event
+
+DEFAULT_ALPHA = 0.02
+DEFAULT_DEVIATIONS = 3
+DEFAULT_WARMUP = 50  # Number of frames
+DEFAULT_MOVING_RATE = 0.1
+
+
+class NoiseFloor:
+    """
+    Not meant to learn from more than one array at a time, MotionDetector never does that
+    """
+
+    def __init__(self, min_threshold, alpha=DEFAULT_ALPHA, deviations=DEFAULT_DEVIATIONS, warmup=DEFAULT_WARMUP,
+                 moving_rate=DEFAULT_MOVING_RATE):
+        self.min_threshold = float(min_threshold)
+        self.alpha = float(alpha)
+        self.deviations = float(deviations)
+        self.warmup = max(int(warmup), 1)
+        self.moving_rate = float(moving_rate)
+        self.frames = 0
+        self.ready = Event()
+        self.mean = None
+        self.variance = None
+        self._thresholds = None
+        self._scratch = None
+
+    def reset(self):
+        self.frames = 0
+        self.ready.clear()
+        self.mean = None
+
+    def _allocate(self, shape):
+        self.mean = numpy.zeros(shape, dtype=numpy.float32)
+        self.variance = numpy.zeros(shape, dtype=numpy.float32)
+        self._thresholds = numpy.empty(shape, dtype=numpy.float32)
+        self._scratch = tuple(numpy.empty(shape, dtype=numpy.float32) for _ in range(3))
+        self.frames = 0
+        self.ready.clear()
+
+    def squared_thresholds(self, squared_threshold):
+        """Returns the squared threshold of every macroblock, or squared_threshold while warming up
+        """
+        if not self.ready.is_set():
+            return squared_threshold
+        return self._thresholds
+
+    def update(self, squared, squared_threshold, moving):
+        """Sets the macroblocks of a frame that reach their threshold in moving, from their squared magnitudes,
+        then learns from the frame
+        """
+        if self.mean is None or self.mean.shape != squared.shape:
+            self._allocate(squared.shape)
+        magnitude, difference, rate = self._scratch
+
+        # comparing and taking the root of float32 copies keeps numpy from allocating cast buffers
+        numpy.copyto(magnitude, squared)
+        numpy.greater_equal(magnitude, self.squared_thresholds(squared_threshold), out=moving)
+        numpy.sqrt(magnitude, out=magnitude)
+
+        self.frames += 1
+        alpha = max(self.alpha, 1 / self.frames)
+        numpy.copyto(rate, moving)
+        rate *= alpha * (self.moving_rate - 1)
+        rate += alpha
+
+        numpy.subtract(magnitude, self.mean, out=difference)
+        # variance = (1 - rate) * (variance + rate * difference^2)
+        numpy.multiply(difference, difference, out=magnitude)
+        magnitude *= rate
+        self.variance += magnitude
+        numpy.subtract(1, rate, out=magnitude)
+        self.variance *= magnitude
+        # mean += rate * difference
+        difference *= rate
+        self.mean += difference
+
+        numpy.sqrt(self.variance, out=self._thresholds)
+        self._thresholds *= self.deviations
+        self._thresholds += self.mean
+        numpy.maximum(self._thresholds, self.min_threshold, out=self._thresholds)
+        numpy.multiply(self._thresholds, self._thresholds, out=self._thresholds)
+
+        if self.frames >= self.warmup:
+            self.ready.set()
+        return moving
+
+    def stats(self):
+        if self.mean is None:
+            return {"frames": 0, "ready": False}
+        thresholds = numpy.sqrt(self._thresholds)
+        return {
+            "frames": self.frames,
+            "ready": self.ready.is_set(),
+            "mean_magnitude": round(float(self.mean.mean()), 2),
+            "mean_threshold": round(float(thresholds.mean()), 2),
+            "max_threshold": round(float(thresholds.max()), 2),
+        }
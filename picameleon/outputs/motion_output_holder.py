@@ -5,20 +5,82 @@ This class helps streamers reuse camera ports for the same format and size combi
 by passing the captured content through the various output analyzers
 """
 
+import numpy as np
+from threading import Lock
 from .output_holder import OutputHolder
+from .shared_executor import DEFAULT_MAX_CONCURRENCY
 from utils.single_picamera import SinglePiCamera
-from picamerax.array import PiMotionAnalysis
+from utils.camera_backend import MOTION_DTYPE, motion_resolution
 
 
-class MotionOutputHolder(OutputHolder, PiMotionAnalysis):
-    def __init__(self, outputs={}, size=None):
-        OutputHolder.__init__(self, outputs)
-        PiMotionAnalysis.__init__(self, SinglePiCamera(), size=size)
+class MotionOutputHolder(OutputHolder):
+    """
+    It is given to the camera as motion_output like picamerax.array.PiMotionAnalysis,
+    every write holds the motion data of one frame which is passed to analyze as a (rows, cols) array.
+
+    The outputs analyze the arrays on the shared executor so the camera thread never waits for them.
+    An output that is still busy only gets the latest array once it's done, the ones in between are skipped.
+    """
+
+    def __init__(self, outputs={}, size=None, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        OutputHolder.__init__(self, outputs, max_concurrency)
+        self.camera = SinglePiCamera()
+        self.size = size
+        self.rows = None
+        self.cols = None
+        # output_id -> latest array that arrived while the output was busy
+        self.pending = {}
+        self.busy = set()
+        self.arrays_analyzed = {}
+        self.arrays_skipped = {}
+        self._analysis_lock = Lock()
+
+    def write(self, b):
+        if self.cols is None:
+            self.rows, self.cols = motion_resolution(self.size or self.camera.resolution)
+        # the array outlives this call so it can't point into a buffer the camera reuses
+        if not isinstance(b, bytes):
+            b = bytes(b)
+        self.analyze(np.frombuffer(b, dtype=MOTION_DTYPE).reshape((self.rows, self.cols)))
+        return len(b)
 
     def analyze(self, motion_vectors):
-        futures = []
+        """Hands motion_vectors to every output without waiting for them
+        """
         with self.output_lock:
-            for _, output in self.outputs.items():
-                futures.append(self.pool.submit(output.analyze, motion_vectors))
-            for future in futures:
-                future.result()
\ No newline at end of file
+            outputs = list(self.outputs.items())
+
+        with self._analysis_lock:
+            for output_id, output in outputs:
+                if output_id in self.busy:
+                    if output_id in self.pending:
+                        self.arrays_skipped[output_id] = self.arrays_skipped.get(output_id, 0) + 1
+                    self.pending[output_id] = motion_vectors
+                    continue
+
+                try:
+                    self.pool.submit(self._run_analysis, output_id, output, motion_vectors)
+                    self.busy.add(output_id)
+                except RuntimeError:
+                    # shut down while the camera was still writing
+                    return
+
+    def _run_analysis(self, output_id, output, motion_vectors):
+        while motion_vectors is not None:
+            try:
+                output.analyze(motion_vectors)
+            except Exception as e:
+                print("Error analyzing motion vectors in output %s: %s" % (output_id, e))
+
+            with self._analysis_lock:
+                self.arrays_analyzed[output_id] = self.arrays_analyzed.get(output_id, 0) + 1
+                motion_vectors = self.pending.pop(output_id, None)
+                if motion_vectors is None:
+                    self.busy.discard(output_id)
+
+    def analysis_stats(self):
+        with self._analysis_lock:
+            return {output_id: {"analyzed": self.arrays_analyzed.get(output_id, 0),
+                                "skipped": self.arrays_skipped.get(output_id, 0),
+                                "busy": output_id in self.busy}
+                    for output_id in self.outputs.keys()}
@@ -0,0 +1,64 @@
+"""
+Motion detection zones.
+
+Zones limit motion detection to parts of the picture, they are given as
+    {"include": [zone, ...], "exclude": [zone, ...]}
+where every zone is a rectangle {"rect": [x, y, width, height]} or a polygon {"polygon": [[x, y], ...]}
+in coordinates relative to the picture, from (0, 0) at the top left to (1, 1) at the bottom right.
+Without include zones the whole picture is included, exclude zones are taken out of it.
+
+A macroblock is in a zone when its center is, the zones are compiled once per motion grid
+into a mask of the macroblocks they cover.
+"""
+
+import numpy
+
+
+def _rect_mask(rect, x, y):
+    left, top, width, height = rect
+    return (x >= left) & (x < left + width) & (y >= top) & (y < top + height)
+
+
+def _polygon_mask(points, x, y):
+    # even-odd rule, a ray from every center to the right crosses the edges of the polygon
+    inside = numpy.zeros(x.shape, dtype=numpy.bool_)
+    for (x1, y1), (x2, y2) in zip(points, points[1:] + points[:1]):
+        if y1 == y2:
+            continue
+        crosses = (y1 > y) != (y2 > y)
+        x_crossing = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+        inside ^= crosses & (x < x_crossing)
+    return inside
+
+
+def _zone_mask(zone, x, y):
+    if "rect" in zone:
+        return _rect_mask(zone["rect"], x, y)
+    if "polygon" in zone:
+        return _polygon_mask([tuple(point) for point in zone["polygon"]], x, y)
+    raise Exception("Zones need a 'rect' or a 'polygon', got: %s" % zone)
+
+
+def zones_mask(zones, shape):
+    """Returns a (rows, cols) boolean mask of the macroblocks in the zones,
+    the extra column of the motion data is never part of it
+    """
+    rows, cols = shape
+    y, x = numpy.mgrid[0:rows, 0:cols - 1]
+    x = (x + 0.5) / (cols - 1)
+    y = (y + 0.5) / rows
+
+    include = zones.get("include") or []
+    mask = numpy.zeros(x.shape, dtype=numpy.bool_) if include else numpy.ones(x.shape, dtype=numpy.bool_)
+    for zone in include:
+        mask |= _zone_mask(zone, x, y)
+    for zone in zones.get("exclude") or []:
+        mask &= ~_zone_mask(zone, x, y)
+
+    return numpy.concatenate((mask, numpy.zeros((rows, 1), dtype=numpy.bool_)), axis=1)
+
+
+def zones_indices(zones, shape):
+    """Returns the flat indices into the motion grid of the macroblocks in the zones
+    """
+    return numpy.flatnonzero(zones_mask(zones, shape))
@@ -0,0 +1,334 @@
+"""
+The NetworkEngine class.
+
+A NetworkEngine owns all the network connections of a streamer and writes to them from a single asyncio event loop,
+instead of every connection taking a thread doing blocking sendall calls.
+It is added to the streamer's WriterOutputHolder as a single output and hands every frame to the loop,
+which queues it on each connection and writes with non-blocking scatter/gather sendmsg calls
+as the sockets become writable.
+
+Engines can also share the event loop of whoever accepts the connections (see NetworkServingMode's event_loop),
+they don't run a thread of their own then and everything is written from that loop.
+
+Connections speaking version 2 of the stream protocol get every frame after its header (see stream_protocol),
+the header is built once per frame for all of them and sent from its own buffer, the frame is never copied.
+
+Every connection has a send buffer of at most max_send_buffer bytes,
+a connection that can't keep up drops frames up to the next keyframe (like the keyframe drop policy)
+but never a frame that is already partly sent.
+The greeting and the frames replayed to a new connection (a whole GOP) don't count towards max_send_buffer,
+they are only ever dropped together with everything else once the live frames behind them overflow it,
+except for the greeting which is never dropped (it carries the protocol handshake).
+"""
+
+import socket
+import asyncio
+from collections import deque
+from threading import Thread, Event
+from .output_queue import is_keyframe
+
+DEFAULT_MAX_SEND_BUFFER = 2 * 1024 * 1024
+MAX_IOV = 64  # buffers handed to a single sendmsg call
+RECV_SIZE = 4096
+HAS_SENDMSG = hasattr(socket.socket, "sendmsg")
+
+
+class EngineConnection:
+    """A connection of the engine, only ever touched from the engine's loop except for close
+    """
+
+    def __init__(self, engine, conn_id, sock, on_close, max_send_buffer, framed=False):
+        self.engine = engine
+        self.conn_id = conn_id
+        self.sock = sock
+        self.on_close = on_close
+        self.max_send_buffer = max_send_buffer
+        self.framed = framed
+        # each entry is the list of buffers of one frame, the first frame may be partly sent
+        self.pending = deque()
+        self.pending_bytes = 0
+        # bytes of the greeting and replayed frames still pending, always at the front
+        self.unbudgeted_bytes = 0
+        self.greeting_bytes = 0
+        self.head_started = False
+        self.waiting_keyframe = False
+        self.is_connected = True
+        self.is_writing = False
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.bytes_sent = 0
+
+    def close(self):
+        """Can be called from any thread
+        """
+        self.engine.remove_connection(self.conn_id)
+
+    def queue(self, buffers, size, keyframe, budgeted=True):
+        """Queues the buffers of a frame, the ones that aren't budgeted (greeting, replay)
+        have to be queued before any live frame
+        """
+        if self.waiting_keyframe and not keyframe:
+            self.frames_dropped += 1
+            return
+        self.waiting_keyframe = False
+
+        if budgeted and self.pending_bytes - self.unbudgeted_bytes + size > self.max_send_buffer:
+            # keep the frame on the wire, the client would get a broken stream otherwise
+            kept = self.pending.popleft() if self.head_started or self.greeting_bytes > 0 else None
+            self.frames_dropped += len(self.pending)
+            self.pending.clear()
+            self.pending_bytes = 0
+            if kept is not None:
+                self.pending.append(kept)
+                self.pending_bytes = sum(len(buffer) for buffer in kept)
+            self.unbudgeted_bytes = min(self.unbudgeted_bytes, self.pending_bytes)
+            self.greeting_bytes = min(self.greeting_bytes, self.pending_bytes)
+            if not keyframe:
+                self.waiting_keyframe = True
+                self.frames_dropped += 1
+                return
+
+        views = [memoryview(buffer).cast("B") for buffer in buffers if len(buffer) > 0]
+        if views:
+            self.pending.append(views)
+            self.pending_bytes += size
+            if not budgeted:
+                self.unbudgeted_bytes += size
+
+    def greet(self, greeting):
+        """Queues the greeting, before anything else
+        """
+        self.queue([greeting], len(greeting), True, budgeted=False)
+        self.greeting_bytes = len(greeting)
+
+    def _gather(self):
+        iov = []
+        for frame in self.pending:
+            for buffer in frame:
+                iov.append(buffer)
+                if len(iov) == MAX_IOV:
+                    return iov
+        return iov
+
+    def _consume(self, sent):
+        """Drops sent bytes from the front of the pending frames
+        """
+        self.pending_bytes -= sent
+        self.unbudgeted_bytes -= min(sent, self.unbudgeted_bytes)
+        self.greeting_bytes -= min(sent, self.greeting_bytes)
+        self.bytes_sent += sent
+        while sent > 0:
+            frame = self.pending[0]
+            buffer = frame[0]
+            if sent < len(buffer):
+                frame[0] = buffer[sent:]
+                self.head_started = True
+                return
+            sent -= len(buffer)
+            frame.pop(0)
+            self.head_started = True
+            if not frame:
+                self.pending.popleft()
+                self.head_started = False
+                self.frames_sent += 1
+
+    def flush(self):
+        """Writes as much as the socket takes without blocking, returns True once nothing is pending
+        """
+        while self.pending:
+            iov = self._gather()
+            try:
+                if HAS_SENDMSG:
+                    sent = self.sock.sendmsg(iov)
+                else:
+                    sent = self.sock.send(iov[0])
+            except (BlockingIOError, InterruptedError):
+                return False
+            self._consume(sent)
+        return True
+
+    def stats(self):
+        return {
+            "pending_bytes": self.pending_bytes,
+            "sent_frames": self.frames_sent,
+            "sent_bytes": self.bytes_sent,
+            "dropped_frames": self.frames_dropped,
+        }
+
+
+class NetworkEngine(Thread):
+    def __init__(self, max_send_buffer=DEFAULT_MAX_SEND_BUFFER, replay=None, loop=None, framing=None):
+        Thread.__init__(self, daemon=True)
+        self.max_send_buffer = max_send_buffer
+        # returns the frames a new connection needs before the live ones, like WriterOutputHolder.replay
+        self.replay = replay
+        # stream_protocol.FrameHeaders of the stream, needed for framed connections
+        self.framing = framing
+        # with a loop that is run by someone else the engine never starts its thread
+        self.owns_loop = loop is None
+        self.loop = asyncio.new_event_loop() if loop is None else loop
+        self.connections = {}
+        self.last_seq = 0
+        self.is_running = False
+        self._started = Event()
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.is_running = True
+        self._started.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self._remove_all()
+            self.loop.close()
+
+    def start(self):
+        if not self.owns_loop:
+            self.is_running = True
+            return
+        Thread.start(self)
+        self._started.wait()
+
+    def stop(self):
+        if self.is_running:
+            self.is_running = False
+            try:
+                self.loop.call_soon_threadsafe(self.loop.stop if self.owns_loop else self._remove_all)
+            except RuntimeError:
+                # the shared loop got closed already, and the connections with it
+                pass
+
+    def _call(self, callback, *args):
+        if not self.is_running:
+            return False
+        try:
+            self.loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # the loop got closed in the meantime
+            return False
+        return True
+
+    def has_connections(self):
+        return len(self.connections) > 0
+
+    def add_connection(self, conn_id, sock, on_close=None, greeting=None, framed=False):
+        """Hands sock over to the engine, on_close(conn_id) is called once the connection is gone.
+        greeting is sent before any frame, framed connections get a header before every frame.
+        Returns the EngineConnection.
+        """
+        sock.setblocking(False)
+        connection = EngineConnection(self, conn_id, sock, on_close, self.max_send_buffer,
+                                      framed=framed and self.framing is not None)
+        if not self._call(self._add, connection, greeting):
+            connection.is_connected = False
+            sock.close()
+        return connection
+
+    def remove_connection(self, conn_id):
+        self._call(self._remove, conn_id)
+
+    def _add(self, connection, greeting):
+        old_connection = self.connections.get(connection.conn_id)
+        if old_connection is not None and old_connection is not connection:
+            self._remove(connection.conn_id)
+
+        self.connections[connection.conn_id] = connection
+        self.loop.add_reader(connection.sock.fileno(), self._read, connection)
+        if greeting:
+            connection.greet(greeting)
+
+        frames = self.replay(self.last_seq) if self.replay is not None else None
+        if frames:
+            for frame in frames:
+                if connection.framed:
+                    connection.queue(*self._framed(frame.payload, frame.keyframe, frame), frame.keyframe,
+                                     budgeted=False)
+                else:
+                    connection.queue([frame.payload], len(frame.payload), frame.keyframe, budgeted=False)
+        elif self.replay is not None:
+            # joined a stream with nothing to replay, has to wait for the next keyframe
+            connection.waiting_keyframe = True
+        self._flush(connection)
+
+    def _remove_all(self):
+        for conn_id in list(self.connections.keys()):
+            self._remove(conn_id)
+
+    def _remove(self, conn_id):
+        connection = self.connections.pop(conn_id, None)
+        if connection is None:
+            return
+
+        connection.is_connected = False
+        try:
+            self.loop.remove_reader(connection.sock.fileno())
+            if connection.is_writing:
+                self.loop.remove_writer(connection.sock.fileno())
+        except Exception:
+            pass
+        connection.sock.close()
+        if connection.on_close is not None:
+            try:
+                connection.on_close(conn_id)
+            except Exception as e:
+                print("Error cleaning up connection %s: %s" % (conn_id, e))
+
+    def _read(self, connection):
+        # clients don't send anything once streaming, this is only here to notice them leaving
+        try:
+            data = connection.sock.recv(RECV_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self._remove(connection.conn_id)
+
+    def _flush(self, connection):
+        try:
+            flushed = connection.flush()
+        except OSError as e:
+            print("Exception occurred when writing to client %s: %s" % (connection.conn_id, e))
+            self._remove(connection.conn_id)
+            return
+
+        if flushed and connection.is_writing:
+            self.loop.remove_writer(connection.sock.fileno())
+            connection.is_writing = False
+        elif not flushed and not connection.is_writing:
+            self.loop.add_writer(connection.sock.fileno(), self._flush, connection)
+            connection.is_writing = True
+
+    def _framed(self, buffer, keyframe, frame=None):
+        """Returns the buffers framed connections get for a frame and their size,
+        the header and the frame without the size it may be prefixed with
+        """
+        if frame is None:
+            header = self.framing.buffer_header(buffer, keyframe)
+        else:
+            header, buffer = self.framing.header(frame), frame.data
+        return [header, buffer], len(header) + len(buffer)
+
+    def _broadcast(self, seq, buffer, keyframe, frame=None):
+        self.last_seq = seq if seq is not None else self.last_seq
+        size = len(buffer)
+        framed = None
+        for connection in list(self.connections.values()):
+            if not connection.framed:
+                connection.queue([buffer], size, keyframe)
+            else:
+                if framed is None:
+                    framed = self._framed(buffer, keyframe, frame)
+                connection.queue(*framed, keyframe)
+            # connections that are already waiting on their socket get flushed once it's writable
+            if not connection.is_writing:
+                self._flush(connection)
+
+    def write_frame(self, frame):
+        return self._call(self._broadcast, frame.seq, frame.payload, frame.keyframe, frame)
+
+    def write(self, buffer):
+        return self._call(self._broadcast, None, buffer, is_keyframe(buffer))
+
+    def stats(self):
+        return {conn_id: connection.stats() for conn_id, connection in list(self.connections.items())}
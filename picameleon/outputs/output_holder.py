@@ -5,20 +5,46 @@ This class helps streamers reuse camera ports for the same format and size combi
 by passing the captured content through the various output analyzers
 """
 
-from time import sleep
 from collections import deque
-from threading import Thread, Event, Lock, active_count, enumerate
-from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Event, Lock, Condition, active_count, enumerate
+from .shared_executor import ExecutorLane, DEFAULT_MAX_CONCURRENCY
+from .output_queue import OutputQueue, DEFAULT_QUEUE_SIZE, DEFAULT_DROP_POLICY, is_keyframe
+
+DEFAULT_MAX_BUFFERED_BYTES = 16 * 1024 * 1024
+DEFAULT_HIGH_WATERMARK = 0.9
+DEFAULT_LOW_WATERMARK = 0.5
+
+
+def buffer_size(buffer):
+    # split notifiers and other markers don't take any memory worth counting
+    return len(buffer) if hasattr(buffer, "__len__") else 0
+
+
+def write_to_output(output, buffer):
+    """
+    Frames coming from a SplitFrameStreamer are handed whole to outputs that implement write_frame,
+    so they get the frame metadata (sequence number, timestamp, keyframe flags).
+    Every other output gets the bytes of the frame.
+    """
+    payload = getattr(buffer, "payload", None)
+    if payload is None:
+        return output.write(buffer)
+
+    write_frame = getattr(output, "write_frame", None)
+    if write_frame is not None:
+        return write_frame(buffer)
+    return output.write(payload)
 
 
 class OutputHolder:
-    def __init__(self, outputs={}):
+    def __init__(self, outputs={}, max_concurrency=DEFAULT_MAX_CONCURRENCY):
         self.outputs = outputs.copy()
         self.outputs_to_add = {}
         self.writable = False
         self.output_lock = Lock()
         self.writer_thread = None
-        self.pool = ThreadPoolExecutor(max_workers=10)
+        # runs on the process wide executor, at most max_concurrency tasks of this holder at once
+        self.pool = ExecutorLane(max_concurrency)
 
     def has_outputs(self):
         return len(self.outputs) > 0
@@ -45,67 +71,245 @@ class OutputHolder:
 
 
 class WriterOutputHolder(Thread, OutputHolder):
-    def __init__(self, outputs={}):
+    """
+    Writes every buffer to all its outputs from its own thread.
+    Each output gets an OutputQueue with its own drop policy (see output_queue), drained on the shared executor,
+    so a slow output can't hold back the others.
+
+    Buffers waiting for the writer thread are limited to max_buffered_bytes.
+    Once they go over the high watermark new buffers are shed until they are back under the low watermark
+    and a keyframe comes in, so h264 outputs keep getting frames they can decode.
+    """
+
+    def __init__(self, outputs={}, queue_size=DEFAULT_QUEUE_SIZE, drop_policy=DEFAULT_DROP_POLICY,
+                 max_buffered_bytes=DEFAULT_MAX_BUFFERED_BYTES,
+                 high_watermark=DEFAULT_HIGH_WATERMARK, low_watermark=DEFAULT_LOW_WATERMARK,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY):
         Thread.__init__(self)
-        OutputHolder.__init__(self, outputs)
+        OutputHolder.__init__(self, outputs, max_concurrency)
         self.aux_buffer = deque()
+        # the writer thread sleeps on it until write or stop wake it up
+        self.buffer_ready = Condition()
+        self.buffered_bytes = 0
+        self.set_buffer_limits(max_buffered_bytes, high_watermark, low_watermark)
+        self.shedding = False
+        self.shedding_callbacks = []
+        self.dropped_frames = 0
+        self.dropped_bytes = 0
         self.rebind_wait = Event()
         self.want_split = False
         self.outputs_to_split = {}
+        self.queue_size = queue_size
+        self.drop_policy = drop_policy
+        self.queues = {}
+        for output_id, output in self.outputs.items():
+            self._open_queue(output_id, output)
+        # streamers set replay to a callable returning the frames a new output needs before the live ones
+        self.replay = None
+        self.outputs_to_join = {}
+        self.outputs_waiting_keyframe = set()
+        self.last_seq = 0
+
+    def _open_queue(self, output_id, output, drop_policy=None, queue_size=None):
+        queue = OutputQueue(output_id, output, write_to_output, self._output_failed, self.pool,
+                            max_frames=queue_size if queue_size else self.queue_size,
+                            policy=drop_policy if drop_policy else self.drop_policy)
+        old_queue = self.queues.get(output_id)
+        if old_queue is not None:
+            old_queue.close()
+        self.queues[output_id] = queue
+
+    def add_output(self, output_id, output, drop_policy=None, queue_size=None):
+        with self.output_lock:
+            self.outputs[output_id] = output
+            self._open_queue(output_id, output, drop_policy, queue_size)
+            if self.replay is not None and self.writable:
+                self.outputs_to_join[output_id] = output
+
+    def remove_output(self, output_id):
+        with self.output_lock:
+            self._discard_output(output_id)
+
+    def _discard_output(self, output_id):
+        del self.outputs[output_id]
+        queue = self.queues.pop(output_id, None)
+        if queue is not None:
+            queue.close()
+        self.outputs_to_join.pop(output_id, None)
+        self.outputs_waiting_keyframe.discard(output_id)
+
+    def _output_failed(self, output_id, queue):
+        # the output may have been removed or replaced while its last write failed
+        with self.output_lock:
+            if self.queues.get(output_id) is queue:
+                self._discard_output(output_id)
+
+    def output_stats(self):
+        with self.output_lock:
+            return {output_id: queue.stats() for output_id, queue in self.queues.items()}
+
+    def _join_outputs(self):
+        """Queues the frames given by replay for the newly added outputs, must hold the output lock.
+        Outputs that got nothing to replay only start receiving frames on the next keyframe.
+        """
+        for oid in self.outputs_to_join.keys():
+            frames = self.replay(self.last_seq)
+            if frames:
+                self.queues[oid].put_many(frames)
+            else:
+                self.outputs_waiting_keyframe.add(oid)
+        self.outputs_to_join = {}
+
+    def _skips_frame(self, output_id, buffer):
+        if output_id not in self.outputs_waiting_keyframe:
+            return False
+        if not getattr(buffer, "keyframe", True):
+            return True
+        self.outputs_waiting_keyframe.discard(output_id)
+        return False
 
     def split_recording(self, output_id, output):
         self.want_split = True
         self.outputs_to_split[output_id] = output
 
+    def set_buffer_limits(self, max_buffered_bytes, high_watermark=DEFAULT_HIGH_WATERMARK,
+                          low_watermark=DEFAULT_LOW_WATERMARK):
+        """The watermarks are fractions of max_buffered_bytes
+        """
+        if not 0 < low_watermark <= high_watermark <= 1:
+            raise Exception("watermarks must be 0 < low (%s) <= high (%s) <= 1" % (low_watermark, high_watermark))
+        with self.buffer_ready:
+            self.max_buffered_bytes = max_buffered_bytes
+            self.high_watermark_bytes = int(max_buffered_bytes * high_watermark)
+            self.low_watermark_bytes = int(max_buffered_bytes * low_watermark)
+
+    def add_shedding_callback(self, callback):
+        """callback(shedding) is called with True when buffers start being shed and with False once they stop.
+        It is called from the thread writing to the holder so it must return fast.
+        """
+        self.shedding_callbacks.append(callback)
+
+    def remove_shedding_callback(self, callback):
+        if callback in self.shedding_callbacks:
+            self.shedding_callbacks.remove(callback)
+
+    def _sheds(self, buffer, size):
+        """Returns whether buffer has to be dropped and updates the shedding state, must hold buffer_ready
+        """
+        if self.shedding:
+            if self.buffered_bytes > self.low_watermark_bytes or not is_keyframe(buffer):
+                return True
+            self.shedding = False
+            return False
+
+        # a single buffer bigger than the high watermark still goes through when nothing else is waiting
+        if self.buffered_bytes > 0 and self.buffered_bytes + size > self.high_watermark_bytes:
+            self.shedding = True
+            return True
+        return False
+
     def write(self, buffer):
         """
         write method must return fast in order not to slow down the framerate
         """
-        if self.writable:
-            self.aux_buffer.append(buffer)
+        if not self.writable:
+            return
+
+        size = buffer_size(buffer)
+        with self.buffer_ready:
+            was_shedding = self.shedding
+            if self._sheds(buffer, size):
+                self.dropped_frames += 1
+                self.dropped_bytes += size
+            else:
+                self.aux_buffer.append(buffer)
+                self.buffered_bytes += size
+                self.buffer_ready.notify()
+            shedding = self.shedding
+
+        if shedding != was_shedding:
+            if shedding:
+                print("Output buffer over %d bytes, shedding frames" % self.high_watermark_bytes)
+            else:
+                print("Output buffer recovered, dropped %d frames so far" % self.dropped_frames)
+            for callback in list(self.shedding_callbacks):
+                try:
+                    callback(shedding)
+                except Exception as e:
+                    print("Error in shedding callback:", e)
+
+    def buffer_stats(self):
+        with self.buffer_ready:
+            return {
+                "buffered_frames": len(self.aux_buffer),
+                "buffered_bytes": self.buffered_bytes,
+                "max_buffered_bytes": self.max_buffered_bytes,
+                "shedding": self.shedding,
+                "dropped_frames": self.dropped_frames,
+                "dropped_bytes": self.dropped_bytes,
+            }
 
     def wait_for_rebind(self):
         self.rebind_wait.wait()
         self.rebind_wait.clear()
 
     def notify_split(self):
-        self.aux_buffer.append(True)
+        with self.buffer_ready:
+            self.aux_buffer.append(True)
+            self.buffer_ready.notify()
+
+    def _next_buffer(self):
+        """Blocks until there is a buffer to write, returns None once stopped
+        """
+        with self.buffer_ready:
+            while self.writable and len(self.aux_buffer) == 0:
+                self.buffer_ready.wait()
+            if not self.writable:
+                return None
+            buffer = self.aux_buffer.popleft()
+            self.buffered_bytes -= buffer_size(buffer)
+            return buffer
 
     def run(self):
         self.writable = True
-        with ThreadPoolExecutor(max_workers=10) as pool:
-            while self.writable:
-                try:
-                    buffer = self.aux_buffer.popleft()
-
-                    futures = []
-                    with self.output_lock:
-                        for oid, output in self.outputs.items():
-                            # Using pool because instantiating Threads on every write is pretty slow
-                            futures.append((oid, pool.submit(output.write, buffer)))
-                        for oid, future in futures:
-                            # Wait for result, if false remove the output
-                            try:
-                                if not future.result():
-                                    del self.outputs[oid]
-                            except Exception as e:
-                                print("error writing to output %s %s:" % (oid, self.outputs[oid]), e)
-                                del self.outputs[oid]
-
-                    #  Check if its a split notifier
-                    if type(buffer) is bool:
-                        for out_id, out in self.outputs_to_add.items():
-                            print("Changing output with id: %s" % out_id)
-                            self.outputs[out_id] = out
-                        self.outputs_to_add = {}
-                        self.rebind_wait.set()
-                        continue
-                except IndexError:
-                    sleep(0.05)
-                except Exception as e:
-                    print("Error writing frame to outputs:", e)
-                    print("threads:\n", active_count(), enumerate())
-                    self.stop()
+        while self.writable:
+            buffer = self._next_buffer()
+            if buffer is None:
+                break
+
+            try:
+                #  Check if its a split notifier
+                if type(buffer) is bool:
+                    for out_id, out in self.outputs_to_add.items():
+                        print("Changing output with id: %s" % out_id)
+                        self.add_output(out_id, out)
+                    self.outputs_to_add = {}
+                    self.rebind_wait.set()
+                    continue
+
+                with self.output_lock:
+                    if self.outputs_to_join:
+                        self._join_outputs()
+                    queues = [queue for oid, queue in self.queues.items() if not self._skips_frame(oid, buffer)]
+                    self.last_seq = getattr(buffer, "seq", self.last_seq)
+
+                # outside of the lock, queues with the block policy may wait here for their output
+                for queue in queues:
+                    queue.put(buffer)
+            except Exception as e:
+                print("Error writing frame to outputs:", e)
+                print("threads:\n", active_count(), enumerate())
+                self.stop()
 
     def stop(self):
-        self.writable = False
+        with self.buffer_ready:
+            self.writable = False
+            self.buffer_ready.notify_all()
+        with self.output_lock:
+            for queue in self.queues.values():
+                queue.close()
+
+    def shutdown(self, wait=True):
+        # a drain whose write failed may be stopping the streamer too and waiting for the lock
+        # held by whoever shuts us down, so running drains are left to finish on their own
+        self.pool.shutdown(False)
@@ -0,0 +1,172 @@
+"""
+The OutputQueue class.
+
+Every output of a WriterOutputHolder gets its own bounded queue, drained by a task on the holder's executor lane
+(see shared_executor) so a slow output only delays (and loses) its own frames instead of stalling the others.
+A queue has at most one drain task at a time which writes up to DRAIN_BATCH frames before giving up its worker.
+
+What happens to a frame written to a full queue depends on the drop policy:
+- drop_oldest: the oldest queued frame is dropped
+- keyframe: the queued frames are dropped and so is every new frame until the next keyframe,
+  so h264 outputs never get a frame that references a dropped one
+- latest: only the latest frame is kept, for outputs that just want the newest picture
+- block: the holder waits until there is room, for lossless outputs like recorders
+
+Frames replayed to a new output (a whole GOP from the gop cache) don't count towards max_frames,
+the live frames behind them still get max_frames of room.
+"""
+
+from collections import deque
+from threading import Condition
+
+DROP_OLDEST = "drop_oldest"
+DROP_TO_KEYFRAME = "keyframe"
+LATEST_ONLY = "latest"
+BLOCK = "block"
+DROP_POLICIES = (DROP_OLDEST, DROP_TO_KEYFRAME, LATEST_ONLY, BLOCK)
+
+DEFAULT_DROP_POLICY = DROP_TO_KEYFRAME
+DEFAULT_QUEUE_SIZE = 30
+DRAIN_BATCH = 8
+
+
+def is_keyframe(buffer):
+    # plain buffers (raw streams, split notifiers) don't depend on each other
+    return getattr(buffer, "keyframe", True)
+
+
+class OutputQueue:
+    def __init__(self, output_id, output, write, on_failure, executor,
+                 max_frames=DEFAULT_QUEUE_SIZE, policy=DEFAULT_DROP_POLICY):
+        if policy not in DROP_POLICIES:
+            raise Exception("Unknown drop policy '%s', use one of %s" % (policy, list(DROP_POLICIES)))
+
+        self.output_id = output_id
+        self.output = output
+        self.write_output = write
+        self.on_failure = on_failure
+        self.executor = executor
+        self.policy = policy
+        self.max_frames = 1 if policy == LATEST_ONLY else max(int(max_frames), 1)
+        self.frames = deque()
+        self.replayed = 0  # replayed frames still queued, always at the front
+        self.changed = Condition()
+        self.is_open = True
+        self.is_draining = False
+        self.waiting_keyframe = False
+        self.frames_written = 0
+        self.frames_dropped = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def _is_full(self):
+        return len(self.frames) - self.replayed >= self.max_frames
+
+    def _make_room(self, buffer):
+        """Applies the drop policy to a full queue, returns False if buffer has to be dropped too
+        """
+        if self.policy == BLOCK:
+            while self.is_open and self._is_full():
+                self.changed.wait()
+            return True
+
+        if self.policy == DROP_TO_KEYFRAME:
+            # the replayed frames go too, the live ones they lead up to are gone
+            self.frames_dropped += len(self.frames)
+            self.frames.clear()
+            self.replayed = 0
+            if not is_keyframe(buffer):
+                self.waiting_keyframe = True
+                return False
+            return True
+
+        while self._is_full():
+            del self.frames[self.replayed]
+            self.frames_dropped += 1
+        return True
+
+    def put(self, buffer):
+        """Queues buffer for the output, returns False once the queue is closed
+        """
+        with self.changed:
+            if self.waiting_keyframe and not is_keyframe(buffer):
+                self.frames_dropped += 1
+                return self.is_open
+            self.waiting_keyframe = False
+
+            if self._is_full() and not self._make_room(buffer):
+                self.frames_dropped += 1
+                return self.is_open
+            if not self.is_open:
+                return False
+
+            self.frames.append(buffer)
+            self.changed.notify_all()
+            self._schedule_drain()
+            return True
+
+    def put_many(self, buffers):
+        """Queues all buffers regardless of the queue size, used to replay frames to new outputs
+        """
+        with self.changed:
+            # queued in front of the live frames so they are written first
+            self.frames.extendleft(reversed(buffers))
+            self.replayed += len(buffers)
+            self.changed.notify_all()
+            self._schedule_drain()
+
+    def close(self):
+        with self.changed:
+            self.is_open = False
+            self.frames.clear()
+            self.replayed = 0
+            self.changed.notify_all()
+
+    def _schedule_drain(self):
+        # must hold changed
+        if self.is_draining or not self.is_open or not self.frames:
+            return
+        try:
+            self.executor.submit(self._drain)
+            self.is_draining = True
+        except RuntimeError as e:
+            print("can't write to output %s %s:" % (self.output_id, self.output), e)
+            self.is_open = False
+            self.frames.clear()
+            self.replayed = 0
+
+    def _drain(self):
+        for _ in range(DRAIN_BATCH):
+            with self.changed:
+                if not self.is_open or not self.frames:
+                    self.is_draining = False
+                    return
+                buffer = self.frames.popleft()
+                self.replayed = max(self.replayed - 1, 0)
+                self.changed.notify_all()
+
+            try:
+                written = self.write_output(self.output, buffer)
+            except Exception as e:
+                print("error writing to output %s %s:" % (self.output_id, self.output), e)
+                written = False
+
+            if not written:
+                # close first so a holder blocked on put lets go before it's asked to remove the output
+                self.close()
+                self.on_failure(self.output_id, self)
+                return
+            self.frames_written += 1
+
+        with self.changed:
+            self.is_draining = False
+            self._schedule_drain()
+
+    def stats(self):
+        return {
+            "policy": self.policy,
+            "queued": len(self.frames),
+            "written": self.frames_written,
+            "dropped": self.frames_dropped,
+        }
@@ -0,0 +1,176 @@
+"""
+The shared executor.
+
+All output holders run their work on a single process-wide ThreadPoolExecutor instead of
+keeping a pool of threads each, so idle streamers don't carry idle threads around.
+Holders submit through an ExecutorLane that caps how many of their tasks run at the same time,
+the rest wait in the lane so a busy holder can't take every worker from the others.
+The first task of a lane always gets a worker, the ones running beside it only while less than half
+of the workers are taken, so the caps of all lanes together can't take the other half from lanes that run nothing.
+
+Outputs that block on every write, like a ClientSocketWrap waiting up to its 5 second timeout on a stalled client,
+take up a slot of their lane each while they wait. Once max_concurrency of them are stalled the other outputs
+of that holder wait for them, and the other holders are only starved once half the workers are held
+by the first tasks of stalled lanes. Network clients served with the network_engine don't go through a lane
+and don't have these limits.
+
+The number of workers is set with configure_shared_executor before the first task is submitted,
+executor_stats reports the threads and queued tasks.
+"""
+
+import weakref
+from collections import deque
+from threading import Lock, Condition, get_ident, enumerate as enumerate_threads
+from concurrent.futures import ThreadPoolExecutor, Future
+
+DEFAULT_MAX_WORKERS = 16
+DEFAULT_MAX_CONCURRENCY = 8
+THREAD_NAME_PREFIX = "output_worker"
+
+_executor = None
+_max_workers = DEFAULT_MAX_WORKERS
+_executor_lock = Lock()
+_lanes = weakref.WeakSet()
+# tasks submitted to the executor that no worker picked up yet, and the ones not done yet
+_queued = 0
+_running = 0
+_counts_lock = Lock()
+
+
+def configure_shared_executor(max_workers):
+    """Sets the number of workers, a running executor is replaced once its tasks finish
+    """
+    global _executor, _max_workers
+    with _executor_lock:
+        max_workers = max(int(max_workers), 1)
+        if _executor is not None and max_workers != _max_workers:
+            _executor.shutdown(wait=False)
+            _executor = None
+        _max_workers = max_workers
+
+
+def get_shared_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=_max_workers, thread_name_prefix=THREAD_NAME_PREFIX)
+        return _executor
+
+
+def _count_queued(count):
+    global _queued
+    with _counts_lock:
+        _queued += count
+
+
+def _shared_workers():
+    # workers that tasks past the first of their lane may take, the rest is left to the first ones
+    return _max_workers // 2
+
+
+def _take_worker(first):
+    global _running
+    with _counts_lock:
+        if not first and _running >= _shared_workers():
+            return False
+        _running += 1
+        return True
+
+
+def _release_worker():
+    global _running
+    with _counts_lock:
+        _running -= 1
+
+
+def executor_stats():
+    with _executor_lock:
+        max_workers = _max_workers
+    lanes = [lane.stats() for lane in list(_lanes)]
+    return {
+        "max_workers": max_workers,
+        "shared_workers": max_workers // 2,
+        # workers of a replaced executor count until their last task is done
+        "threads": sum(1 for thread in enumerate_threads() if thread.name.startswith(THREAD_NAME_PREFIX)),
+        "queue_depth": _queued,
+        "lanes": len(lanes),
+        "running": sum(lane["running"] for lane in lanes),
+        "waiting": sum(lane["waiting"] for lane in lanes),
+    }
+
+
+class ExecutorLane:
+    """Submits tasks to the shared executor, at most max_concurrency of them run at the same time
+    """
+
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        self.max_concurrency = max(int(max_concurrency), 1)
+        self.waiting = deque()
+        self.running = 0
+        self.running_threads = set()
+        self.is_open = True
+        self._condition = Condition()
+        _lanes.add(self)
+
+    def submit(self, fn, *args):
+        future = Future()
+        with self._condition:
+            if not self.is_open:
+                raise RuntimeError("cannot submit to a lane after shutdown")
+            if self.running >= self.max_concurrency or not _take_worker(self.running == 0):
+                self.waiting.append((future, fn, args))
+                return future
+            self.running += 1
+        self._dispatch(future, fn, args)
+        return future
+
+    def _dispatch(self, future, fn, args):
+        _count_queued(1)
+        try:
+            get_shared_executor().submit(self._run, future, fn, args)
+        except BaseException:
+            _count_queued(-1)
+            raise
+
+    def _run(self, future, fn, args):
+        _count_queued(-1)
+        with self._condition:
+            self.running_threads.add(get_ident())
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args))
+                except BaseException as e:
+                    future.set_exception(e)
+        finally:
+            with self._condition:
+                self.running_threads.discard(get_ident())
+                task = self.waiting.popleft() if self.waiting else None
+                if task is None:
+                    self.running -= 1
+                    _release_worker()
+                    self._condition.notify_all()
+        # the next task takes over the worker of this one but goes to the back of the executor queue
+        # so other lanes get their turn
+        if task is not None:
+            self._dispatch(*task)
+
+    def shutdown(self, wait=True):
+        """Cancels the tasks that didn't start yet and waits for the running ones,
+        except for the one calling shutdown if it runs in this lane
+        """
+        with self._condition:
+            self.is_open = False
+            while self.waiting:
+                self.waiting.popleft()[0].cancel()
+            if wait:
+                this_task = 1 if get_ident() in self.running_threads else 0
+                self._condition.wait_for(lambda: self.running <= this_task)
+
+    def stats(self):
+        with self._condition:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "running": self.running,
+                "waiting": len(self.waiting),
+            }
@@ -0,0 +1,89 @@
+"""
+Stream protocol.
+
+Version 1 is the original wire format: the client sends a 4 byte little endian length and a JSON request,
+then gets the frames, prefixed with their size when the stream does so, or a size of 0 if it isn't served.
+
+A client that asks for "protocol": 2 in its request gets the version the server settles on back first,
+as MAGIC followed by a version byte, then every frame is sent after a FRAME_HEADER with its size,
+sequence number, capture timestamp of the camera clock in microseconds (-1 if unknown),
+the time the frame was published in microseconds since the epoch (0 if unknown), keyframe and config flags,
+format and resolution. Clients can measure latency, notice dropped frames by the gaps in the sequence numbers
+and skip to keyframes without looking at the frames themselves.
+Refusals are still a size of 0, which MAGIC never is.
+
+This module is part of the client package so it can only use the standard library.
+"""
+
+import struct
+from dataclasses import dataclass
+
+PROTOCOL_VERSION = 2
+MAGIC = b'PCAM'
+HANDSHAKE = struct.Struct('<4sB')  # magic, version
+FRAME_HEADER = struct.Struct('<IQqQBBHH')  # size, seq, timestamp, wall time, flags, format, width, height
+FLAG_KEYFRAME = 1
+FLAG_CONFIG = 2
+FORMATS = ("h264", "mjpeg", "yuv", "rgb", "bgr", "rgba", "bgra")  # format codes start at 1, 0 is unknown
+
+
+def negotiate(requested):
+    """Returns the version to speak with a client that asked for requested
+    """
+    return max(1, min(int(requested), PROTOCOL_VERSION))
+
+
+def handshake(version):
+    return HANDSHAKE.pack(MAGIC, version)
+
+
+def format_code(format):
+    return FORMATS.index(format) + 1 if format in FORMATS else 0
+
+
+def format_name(code):
+    return FORMATS[code - 1] if 0 < code <= len(FORMATS) else None
+
+
+@dataclass()
+class FrameInfo:
+    size: int
+    seq: int
+    timestamp: int
+    wall_time: int
+    keyframe: bool
+    config: bool
+    format: str
+    width: int
+    height: int
+
+
+def parse_frame_header(buffer) -> FrameInfo:
+    size, seq, timestamp, wall_time, flags, code, width, height = FRAME_HEADER.unpack(buffer)
+    return FrameInfo(size, seq, timestamp, wall_time, bool(flags & FLAG_KEYFRAME), bool(flags & FLAG_CONFIG),
+                     format_name(code), width, height)
+
+
+class FrameHeaders:
+    """
+    Builds the headers of the frames of one stream, the format and resolution never change within it
+    """
+
+    def __init__(self, format, resolution):
+        self.format_code = format_code(format)
+        self.width, self.height = resolution
+
+    def header(self, frame):
+        """Takes a Frame of a SplitFrameStreamer, the header describes frame.data which is sent after it
+        """
+        flags = (FLAG_KEYFRAME if frame.keyframe else 0) | (FLAG_CONFIG if frame.config else 0)
+        timestamp = frame.timestamp if frame.timestamp is not None else -1
+        wall_time = int(frame.published * 1000000) if frame.published else 0
+        return FRAME_HEADER.pack(len(frame.data), frame.seq, timestamp, wall_time, flags,
+                                 self.format_code, self.width, self.height)
+
+    def buffer_header(self, buffer, keyframe=True):
+        """For buffers written without a Frame, nothing is known about them but their size
+        """
+        return FRAME_HEADER.pack(len(buffer), 0, -1, 0, FLAG_KEYFRAME if keyframe else 0,
+                                 self.format_code, self.width, self.height)
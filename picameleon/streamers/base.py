@@ -2,6 +2,8 @@
 BaseStreamer is the base class for generic streamer implementations.
 """
 from utils.single_picamera import SinglePiCamera
+from utils.consts import GLOBALS, OUTPUT_BUFFER_SIZE, OUTPUT_BUFFER_HIGH_WATERMARK, OUTPUT_BUFFER_LOW_WATERMARK, \
+    OUTPUT_CONCURRENCY
 from outputs.output_holder import WriterOutputHolder
 from outputs.motion_output_holder import MotionOutputHolder
 from threading import Thread, Lock
@@ -14,8 +16,11 @@ class BaseStreamer:
         self.format = format
         self.resize = self.parse_resize(options["resize"])
         del options["resize"]
-        self.output = WriterOutputHolder()
-        self.motion_output = MotionOutputHolder(size=self.resize)
+        self.output = WriterOutputHolder(max_buffered_bytes=GLOBALS[OUTPUT_BUFFER_SIZE],
+                                         high_watermark=GLOBALS[OUTPUT_BUFFER_HIGH_WATERMARK],
+                                         low_watermark=GLOBALS[OUTPUT_BUFFER_LOW_WATERMARK],
+                                         max_concurrency=GLOBALS[OUTPUT_CONCURRENCY])
+        self.motion_output = MotionOutputHolder(size=self.resize, max_concurrency=GLOBALS[OUTPUT_CONCURRENCY])
         self.sub_output = None
         self.options = options
         self.is_running = False
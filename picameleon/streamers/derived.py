@@ -0,0 +1,124 @@
+"""
+The DerivedStreamer class.
+
+A DerivedStreamer produces a raw stream at a lower resolution from the frames of
+a raw SplitFrameStreamer that already holds a camera port, instead of taking a port of its own.
+It is registered as an output of the source streamer and downscales every frame in a worker pool,
+so once the camera ports run out many more resolutions can still be served.
+"""
+
+import os
+from collections import deque
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+from .split_frame import SplitFrameStreamer
+from .downscale import Downscaler, RAW_FORMATS, parse_resolution
+
+DEFAULT_DOWNSCALE_WORKERS = os.cpu_count() or 2
+DEFAULT_MAX_PENDING = 4
+
+
+def source_resolution(streamer):
+    # run_streamer drops resize when it is the camera resolution
+    if streamer.resize:
+        return tuple(streamer.resize)
+    return tuple(streamer.camera.resolution)
+
+
+def find_source(streamers, format, resize, options):
+    """Returns the smallest running raw streamer that a stream of this format,
+    resolution and recording options can be downscaled from, or None.
+    """
+    resolution = parse_resolution(resize)
+    if format not in RAW_FORMATS or resolution is None:
+        return None
+
+    candidates = []
+    for streamer in streamers:
+        if type(streamer) is not SplitFrameStreamer or streamer.format != format or streamer.options != options:
+            continue
+        src_resolution = source_resolution(streamer)
+        if src_resolution[0] >= resolution[0] and src_resolution[1] >= resolution[1]:
+            candidates.append((src_resolution[0] * src_resolution[1], streamer))
+
+    if not candidates:
+        return None
+    return min(candidates, key=lambda candidate: candidate[0])[1]
+
+
+class DerivedStreamer(SplitFrameStreamer):
+    _pool = None
+    _pool_lock = Lock()
+
+    def __init__(self, source, format, prepend_size=False, options=None, max_pending=DEFAULT_MAX_PENDING):
+        super().__init__(None, format, prepend_size, options)
+        self.source = source
+        self.source_output_id = "derived_%d" % id(self)
+        self.downscaler = Downscaler(format, source_resolution(source), self.resize)
+        self.max_pending = max_pending
+        self.pending = deque()
+        self._pending_lock = Lock()
+        self.frames_dropped = 0
+
+    @classmethod
+    def _get_pool(cls):
+        with cls._pool_lock:
+            if cls._pool is None:
+                cls._pool = ThreadPoolExecutor(max_workers=DEFAULT_DOWNSCALE_WORKERS)
+            return cls._pool
+
+    def write_frame(self, frame):
+        """Called by the source output holder with every frame of the source.
+        The frame is downscaled in the pool, frames arriving while max_pending are still being scaled are dropped.
+        """
+        with self._pending_lock:
+            if len(self.pending) >= self.max_pending:
+                self.frames_dropped += 1
+                return True
+
+            future = self._get_pool().submit(self.downscaler.scale, frame.data, self.prepend_size)
+            self.pending.append((frame.timestamp, future))
+        future.add_done_callback(self._publish_scaled)
+        return True
+
+    def _publish_scaled(self, _):
+        # frames finish in any order but are published in the order they came in
+        with self._pending_lock:
+            while self.pending and self.pending[0][1].done():
+                timestamp, future = self.pending.popleft()
+                try:
+                    frame, payload = future.result()
+                except Exception as e:
+                    print("Error downscaling frame:", e)
+                    continue
+                self.frames.put(frame, timestamp, payload)
+
+    def run_streamer(self):
+        print("Start deriving %s stream, size: %s, from %s" %
+              (self.format, str(self.resize), str(source_resolution(self.source))))
+        if not self.is_recording:
+            self.source.output.add_output(self.source_output_id, self)
+            self.source.start()
+            self.is_recording = True
+
+    def close(self):
+        try:
+            if self.is_recording and self.source.output.has_output(self.source_output_id):
+                self.source.output.remove_output(self.source_output_id)
+                # nobody else is using the source so give its port back
+                if not self.source.in_use():
+                    self.source.stop()
+        except Exception as e:
+            print("Error detaching from source streamer: %s" % e)
+        finally:
+            self.is_recording = False
+            print("stopped deriving %s stream, size: %s" % (self.format, str(self.resize)))
+
+    def wait_recording(self, seconds):
+        self.source.wait_recording(seconds)
+
+    def split_recording(self, output):
+        raise Exception("derived streams don't record from a camera port and can't be split")
+
+    def rebind_output(self, output_id, output):
+        raise Exception("derived streams don't record from a camera port and can't be rebound")
@@ -0,0 +1,136 @@
+"""
+Vectorized downscaling of raw camera frames.
+
+The camera pads unencoded frames to a multiple of 32 (sometimes 16) pixels horizontally
+and 16 vertically, yuv frames are planar YUV420 and rgb/bgr(a) frames are packed.
+A Downscaler precomputes, once per source/target resolution, the index of the source byte
+that ends up in every byte of the target frame, so scaling a frame is a single numpy gather
+into a new buffer with the same padded layout the camera would have produced for that size.
+"""
+
+import numpy as np
+from .frame_assembler import SIZE_PREFIX, SIZE_PREFIX_LENGTH
+
+RAW_FORMATS = {
+    "yuv": 0,
+    "rgb": 3,
+    "bgr": 3,
+    "rgba": 4,
+    "bgra": 4,
+}
+WIDTH_ALIGNMENTS = (32, 16)
+HEIGHT_ALIGNMENT = 16
+
+
+def parse_resolution(resize):
+    """Returns resize as a (width, height) tuple, or None if it can't be parsed
+    """
+    try:
+        if type(resize) is str:
+            width, height = map(int, resize.split("x"))
+            return (width, height)
+        if type(resize) is tuple or type(resize) is list:
+            return (int(resize[0]), int(resize[1]))
+    except Exception:
+        pass
+    return None
+
+
+def raw_resolution(resolution, width_alignment=32):
+    width, height = resolution
+    fwidth = (width + width_alignment - 1) & ~(width_alignment - 1)
+    fheight = (height + HEIGHT_ALIGNMENT - 1) & ~(HEIGHT_ALIGNMENT - 1)
+    return fwidth, fheight
+
+
+def raw_frame_size(format, resolution, width_alignment=32):
+    fwidth, fheight = raw_resolution(resolution, width_alignment)
+    if RAW_FORMATS[format] == 0:
+        return fwidth * fheight + 2 * (fwidth // 2) * (fheight // 2)
+    return fwidth * fheight * RAW_FORMATS[format]
+
+
+def width_alignment(format, resolution, frame_size):
+    """Returns the alignment the width of frames of frame_size bytes was padded to
+    """
+    for alignment in WIDTH_ALIGNMENTS:
+        if raw_frame_size(format, resolution, alignment) == frame_size:
+            return alignment
+    raise Exception("frame of %d bytes isn't a %s frame of %s" % (frame_size, format, tuple(resolution)))
+
+
+def luma_plane(data, resolution):
+    """Returns a (height, width) view of the Y plane of a yuv frame, without its padding
+    """
+    frame = np.frombuffer(data, dtype=np.uint8)
+    fwidth, fheight = raw_resolution(resolution, width_alignment("yuv", resolution, len(frame)))
+    return frame[:fwidth * fheight].reshape(fheight, fwidth)[:resolution[1], :resolution[0]]
+
+
+def _sample_positions(src_length, dst_length, padded_length):
+    # sample at the center of every target pixel, the padding repeats the last visible one
+    positions = ((2 * np.arange(padded_length) + 1) * src_length) // (2 * dst_length)
+    return np.minimum(positions, src_length - 1)
+
+
+def _plane_index(src_size, src_stride, dst_size, dst_padded, offset=0):
+    rows = _sample_positions(src_size[1], dst_size[1], dst_padded[1])
+    cols = _sample_positions(src_size[0], dst_size[0], dst_padded[0])
+    return offset + rows[:, np.newaxis] * src_stride + cols
+
+
+class Downscaler:
+    def __init__(self, format, src_resolution, dst_resolution):
+        if format not in RAW_FORMATS:
+            raise Exception("can only downscale raw formats %s, not %s" % (list(RAW_FORMATS.keys()), format))
+        if dst_resolution[0] > src_resolution[0] or dst_resolution[1] > src_resolution[1]:
+            raise Exception("can't downscale %s to the bigger %s" % (src_resolution, dst_resolution))
+
+        self.format = format
+        self.src_resolution = tuple(src_resolution)
+        self.dst_resolution = tuple(dst_resolution)
+        # (source frame size, index), replaced as a whole so concurrent scale calls always see a consistent pair
+        self.layout = None
+
+    def _build_layout(self, src_frame_size):
+        """Finds the padding of the source from the size of its frames and maps
+        every byte of the target frame to the byte of the source it's sampled from
+        """
+        alignment = width_alignment(self.format, self.src_resolution, src_frame_size)
+        src_padded = raw_resolution(self.src_resolution, alignment)
+        dst_padded = raw_resolution(self.dst_resolution, alignment)
+        bytes_per_pixel = RAW_FORMATS[self.format]
+        if bytes_per_pixel == 0:
+            # Y plane followed by the quarter sized U and V planes
+            half = lambda size: (size[0] // 2, size[1] // 2)
+            y_size = src_padded[0] * src_padded[1]
+            uv_size = half(src_padded)[0] * half(src_padded)[1]
+            planes = [_plane_index(self.src_resolution, src_padded[0], self.dst_resolution, dst_padded)]
+            for offset in (y_size, y_size + uv_size):
+                planes.append(_plane_index(half(self.src_resolution), half(src_padded)[0],
+                                           half(self.dst_resolution), half(dst_padded), offset))
+            index = np.concatenate([plane.ravel() for plane in planes])
+        else:
+            pixels = _plane_index(self.src_resolution, src_padded[0], self.dst_resolution, dst_padded)
+            index = pixels[:, :, np.newaxis] * bytes_per_pixel + np.arange(bytes_per_pixel)
+
+        self.layout = (src_frame_size, index.astype(np.intp).ravel())
+        return self.layout
+
+    def scale(self, data, prepend_size=False):
+        """Returns the downscaled frame and the payload to hand to outputs,
+        which has its size prepended when prepend_size is set.
+        """
+        src = np.frombuffer(data, dtype=np.uint8)
+        layout = self.layout
+        if layout is None or layout[0] != len(src):
+            layout = self._build_layout(len(src))
+
+        index = layout[1]
+        prefix_length = SIZE_PREFIX_LENGTH if prepend_size else 0
+        payload = np.empty(prefix_length + len(index), dtype=np.uint8)
+        frame = payload[prefix_length:]
+        np.take(src, index, out=frame)
+        if prepend_size:
+            SIZE_PREFIX.pack_into(payload, 0, len(index))
+        return memoryview(frame), memoryview(payload)
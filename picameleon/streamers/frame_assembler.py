@@ -0,0 +1,100 @@
+"""
+The FrameAssembler class.
+
+Collects the chunks written by the encoder into a small pool of preallocated
+bytearrays and hands out finished frames as read-only memoryviews,
+so a frame is copied exactly once (from the encoder chunk into the pool).
+
+Every slot reserves SIZE_PREFIX_LENGTH bytes in front of the frame, that way
+the '<L' size prefix can be written in place and a size prefixed view of the
+same frame is available without concatenating bytes.
+"""
+
+import struct
+
+SIZE_PREFIX = struct.Struct('<L')
+SIZE_PREFIX_LENGTH = SIZE_PREFIX.size
+DEFAULT_POOL_SIZE = 8
+DEFAULT_FRAME_SIZE = 65536
+
+# memoryview.toreadonly only exists from python 3.8 on, older versions get the plain view
+_readonly = getattr(memoryview, "toreadonly", lambda view: view)
+
+
+def buffer_in_use(buffer):
+    """Checks if a bytearray still has exported memoryviews.
+
+    A bytearray can't be resized while something holds a view on it,
+    so this is a cheap way of knowing if a consumer still references the frame.
+    """
+    try:
+        buffer.append(0)
+    except BufferError:
+        return True
+    del buffer[-1]
+    return False
+
+
+class FrameAssembler:
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, frame_size=DEFAULT_FRAME_SIZE):
+        self.pool = [bytearray(SIZE_PREFIX_LENGTH + frame_size) for _ in range(max(pool_size, 1))]
+        self.slot = 0
+        self.position = SIZE_PREFIX_LENGTH
+        self.is_assembling = False
+        # stats, useful to check that the pool is big enough for the consumers
+        self.allocations = 0
+        self.bytes_allocated = 0
+
+    def __len__(self):
+        return self.position - SIZE_PREFIX_LENGTH
+
+    def _allocate(self, size):
+        self.allocations += 1
+        self.bytes_allocated += size
+        return bytearray(size)
+
+    def _begin_frame(self):
+        # a slot can only be reused when nobody is reading the frame it holds anymore
+        buffer = self.pool[self.slot]
+        if buffer_in_use(buffer):
+            self.pool[self.slot] = self._allocate(len(buffer))
+        self.position = SIZE_PREFIX_LENGTH
+        self.is_assembling = True
+
+    def write(self, buf):
+        if not self.is_assembling:
+            self._begin_frame()
+
+        buffer = self.pool[self.slot]
+        end = self.position + len(buf)
+        if end > len(buffer):
+            # grow the slot once, from then on frames of this size fit without allocating
+            grown = self._allocate(max(end, 2 * len(buffer)))
+            grown[:self.position] = memoryview(buffer)[:self.position]
+            self.pool[self.slot] = buffer = grown
+
+        # assigning through a memoryview avoids the temporary copy bytearray slice assignment makes
+        with memoryview(buffer) as view:
+            view[self.position:end] = buf
+        self.position = end
+
+    def finish(self):
+        """Closes the current frame.
+
+        Returns a tuple with a read-only view of the frame and a read-only view
+        of the same frame prefixed with its '<L' packed size, or None if no frame was being assembled.
+        """
+        if not self.is_assembling:
+            return None
+
+        buffer = self.pool[self.slot]
+        SIZE_PREFIX.pack_into(buffer, 0, len(self))
+        view = memoryview(buffer)
+        sized_frame = _readonly(view[:self.position])
+        frame = _readonly(view[SIZE_PREFIX_LENGTH:self.position])
+        view.release()
+
+        self.slot = (self.slot + 1) % len(self.pool)
+        self.position = SIZE_PREFIX_LENGTH
+        self.is_assembling = False
+        return frame, sized_frame
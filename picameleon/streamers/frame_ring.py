@@ -0,0 +1,78 @@
+"""
+The FrameRing class.
+
+Keeps the most recent frames of a streamer, each tagged with a sequence number,
+so any number of readers can follow the stream independently.
+Every reader keeps track of the last sequence number it consumed and asks for the next one,
+a reader that falls behind more than the capacity of the ring skips to the oldest frame still held.
+"""
+
+import time
+from collections import deque
+from dataclasses import dataclass
+from threading import Condition
+from typing import Any, Optional
+
+DEFAULT_RING_SIZE = 8
+
+
+@dataclass()
+class Frame:
+    seq: int
+    timestamp: Optional[int]
+    data: Any  # the frame itself
+    payload: Any  # what gets written to plain outputs, data or data prefixed with its size
+    keyframe: bool = True  # frame can be decoded without the previous ones
+    config: bool = False  # frame carries the parameter sets needed to set up a decoder (h264 SPS/PPS)
+    published: Optional[float] = None  # time.time() when the frame was put in the ring
+
+    def __len__(self):
+        return len(self.payload)
+
+
+class FrameRing:
+    def __init__(self, capacity=DEFAULT_RING_SIZE):
+        self.capacity = capacity
+        self.frames = deque(maxlen=capacity)
+        self.seq = 0  # sequence number of the latest frame, the first frame gets 1
+        self.is_open = True
+        self._condition = Condition()
+
+    def put(self, data, timestamp=None, payload=None, keyframe=True, config=False):
+        with self._condition:
+            self.seq += 1
+            frame = Frame(self.seq, timestamp, data, data if payload is None else payload, keyframe, config,
+                          time.time())
+            self.frames.append(frame)
+            self._condition.notify_all()
+        return frame
+
+    def latest(self):
+        with self._condition:
+            return self.frames[-1] if self.frames else None
+
+    def _frame_after(self, after_seq):
+        oldest_seq = self.frames[0].seq
+        return self.frames[max(after_seq + 1 - oldest_seq, 0)]
+
+    def wait_for_frame(self, after_seq, timeout=None):
+        """Returns the first frame with a sequence number greater than after_seq.
+
+        Blocks until such a frame exists, returns None if the timeout expires or the ring gets closed.
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.seq > after_seq or not self.is_open, timeout):
+                return None
+            if self.seq <= after_seq:
+                return None
+            return self._frame_after(after_seq)
+
+    def close(self):
+        """Wakes up every waiting reader"""
+        with self._condition:
+            self.is_open = False
+            self._condition.notify_all()
+
+    def reopen(self):
+        with self._condition:
+            self.is_open = True
@@ -0,0 +1,87 @@
+"""
+The GopCache class.
+
+Keeps the latest h264 parameter sets and a copy of every frame since the last keyframe
+(the current group of pictures) so outputs joining a running stream can be replayed
+everything they need to decode the next live frame, instead of waiting for the next keyframe.
+
+The frames are copied into a single arena of max_size bytes allocated once,
+when a group of pictures doesn't fit the cache stays invalid until the next keyframe.
+"""
+
+from threading import Lock
+from dataclasses import replace
+from .h264 import parameter_sets
+from .frame_assembler import SIZE_PREFIX, buffer_in_use
+
+DEFAULT_GOP_CACHE_SIZE = 8 * 1024 * 1024
+
+
+class GopCache:
+    def __init__(self, max_size=DEFAULT_GOP_CACHE_SIZE):
+        self.max_size = max_size
+        self.arena = None
+        self.position = 0
+        self.frames = []
+        self.parameter_sets = None
+        self.is_valid = False
+        self._lock = Lock()
+
+    def _reset(self):
+        # drop our views first, if a replay still holds some the arena can't be reused
+        self.frames = []
+        if self.arena is None or buffer_in_use(self.arena):
+            self.arena = bytearray(self.max_size)
+        self.position = 0
+        self.is_valid = True
+
+    def _invalidate(self):
+        self.frames = []
+        self.position = 0
+        self.is_valid = False
+
+    def _keep_parameter_sets(self, frame):
+        data = parameter_sets(frame.data)
+        if not data:
+            return
+
+        prefixed = len(frame.payload) != len(frame.data)
+        payload = SIZE_PREFIX.pack(len(data)) + data if prefixed else data
+        self.parameter_sets = replace(frame, data=memoryview(payload)[len(payload) - len(data):],
+                                      payload=payload, keyframe=False)
+
+    def add(self, frame):
+        with self._lock:
+            if frame.config:
+                self._keep_parameter_sets(frame)
+            if frame.keyframe:
+                self._reset()
+            if not self.is_valid:
+                return
+
+            size = len(frame.payload)
+            if self.position + size > self.max_size:
+                print("GOP doesn't fit the %d bytes of the cache, not caching until next keyframe" % self.max_size)
+                self._invalidate()
+                return
+
+            end = self.position + size
+            view = memoryview(self.arena)[self.position:end]
+            view[:] = frame.payload
+            self.frames.append(replace(frame, data=view[size - len(frame.data):], payload=view))
+            self.position = end
+
+    def replay(self, until_seq):
+        """Returns the cached frames up to until_seq that a new output needs before the following live frame.
+        An empty list means the output has to wait for the next keyframe.
+        """
+        with self._lock:
+            frames = [frame for frame in self.frames if frame.seq <= until_seq]
+            if frames and not frames[0].config and self.parameter_sets is not None:
+                frames.insert(0, replace(self.parameter_sets, seq=frames[0].seq, timestamp=frames[0].timestamp))
+            return frames
+
+    def clear(self):
+        with self._lock:
+            self._invalidate()
+            self.parameter_sets = None
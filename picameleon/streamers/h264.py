@@ -0,0 +1,103 @@
+"""
+H.264 Access Unit splitting.
+
+The encoder writes the stream one NAL unit (or part of one) at a time:
+parameter sets (SPS/PPS), SEI and the slices of every picture.
+The AccessUnitSplitter groups every NAL belonging to the same picture into a single frame
+and flags the frames that are keyframes (IDR) or carry parameter sets.
+
+Picture boundaries follow the rules of the H.264 spec (7.4.1.2.3) simplified for the stream
+produced by the camera: a new access unit starts on an AUD, SEI or parameter set following a picture,
+or on a slice with first_mb_in_slice == 0 following a picture.
+"""
+
+from collections import namedtuple
+
+START_CODE = b'\x00\x00\x01'
+NAL_SLICE = 1
+NAL_IDR = 5
+NAL_SEI = 6
+NAL_SPS = 7
+NAL_PPS = 8
+NAL_AUD = 9
+VCL_NAL_TYPES = frozenset((1, 2, 3, 4, 5))
+PARAMETER_SET_NAL_TYPES = frozenset((NAL_SPS, NAL_PPS))
+# non VCL NAL types that open a new access unit when they follow a picture
+ACCESS_UNIT_START_NAL_TYPES = frozenset((NAL_SEI, NAL_SPS, NAL_PPS, NAL_AUD, 14, 15, 16, 17, 18))
+PARAMETER_SETS_WINDOW = 256  # Bytes at the start of an access unit first looked at for its parameter sets
+
+# offset is where the next frame starts in the written buffer,
+# keyframe and config describe the frame that ends there
+FrameBoundary = namedtuple("FrameBoundary", ["offset", "keyframe", "config"])
+
+
+def nal_units(buf):
+    """Yields (offset, nal_type, first_slice) for every NAL unit starting in buf.
+
+    offset points at the start code, first_slice tells if a slice NAL has first_mb_in_slice == 0.
+    """
+    position = buf.find(START_CODE)
+    while position != -1 and position + 3 < len(buf):
+        offset = position - 1 if position > 0 and buf[position - 1] == 0 else position
+        nal_type = buf[position + 3] & 0x1f
+        # first_mb_in_slice is the first ue(v) of the slice header, a leading 1 bit means 0
+        first_slice = nal_type in VCL_NAL_TYPES and \
+            (position + 4 >= len(buf) or buf[position + 4] & 0x80 != 0)
+        yield offset, nal_type, first_slice
+        position = buf.find(START_CODE, position + 3)
+
+
+def parameter_sets(data):
+    """Returns the SPS and PPS NAL units in data, start codes included.
+
+    They come before the slices of the picture, so only the start of data is copied to look for them,
+    a window that doubles until it reaches the first slice or the end of data.
+    """
+    view = memoryview(data)
+    window = PARAMETER_SETS_WINDOW
+    while True:
+        head = bytes(view[:window])
+        units = []
+        for unit in nal_units(head):
+            units.append(unit)
+            if unit[1] in VCL_NAL_TYPES:
+                break
+        if (units and units[-1][1] in VCL_NAL_TYPES) or window >= len(view):
+            break
+        window *= 2
+
+    result = b''
+    for i, (offset, nal_type, _) in enumerate(units):
+        if nal_type in VCL_NAL_TYPES:
+            break
+        if nal_type in PARAMETER_SET_NAL_TYPES:
+            end = units[i + 1][0] if i + 1 < len(units) else len(head)
+            result += head[offset:end]
+    return result
+
+
+class AccessUnitSplitter:
+    def __init__(self):
+        self.has_picture = False
+        self.keyframe = False
+        self.config = False
+
+    def feed(self, buf):
+        """Inspects a buffer written by the encoder.
+
+        Returns a list of FrameBoundary, one for every access unit that is completed by this buffer.
+        """
+        boundaries = []
+        for offset, nal_type, first_slice in nal_units(buf):
+            is_picture = nal_type in VCL_NAL_TYPES
+            if self.has_picture and (nal_type in ACCESS_UNIT_START_NAL_TYPES or (is_picture and first_slice)):
+                boundaries.append(FrameBoundary(offset, self.keyframe, self.config))
+                self.has_picture = self.keyframe = self.config = False
+
+            if is_picture:
+                self.has_picture = True
+            if nal_type == NAL_IDR:
+                self.keyframe = True
+            elif nal_type in PARAMETER_SET_NAL_TYPES:
+                self.config = True
+        return boundaries
@@ -1,29 +1,78 @@
-import io
-import struct
-from threading import Thread, Event
+from threading import Thread, Lock
 from .base import BaseStreamer
+from .h264 import AccessUnitSplitter, FrameBoundary
+from .frame_assembler import FrameAssembler
+from .frame_ring import FrameRing, DEFAULT_RING_SIZE
+from .gop_cache import GopCache, DEFAULT_GOP_CACHE_SIZE
 
 SPLITTER_STRINGS = {
-    "mjpeg": b'\xff\xd8',
-    "h264": b'\x00\x00\x00\x01'
+    "mjpeg": b'\xff\xd8'
 }
 
 
+class ChunkSplitter:
+    """Starts a new frame on every buffer that begins with the splitter string,
+    or on every buffer when there is no splitter string (raw formats).
+    Every frame of these formats can be decoded on its own so they are all keyframes.
+    """
+
+    def __init__(self, splitter_string=None):
+        self.splitter_string = splitter_string
+
+    def feed(self, buf):
+        if self.splitter_string is None or buf.startswith(self.splitter_string):
+            return [FrameBoundary(0, True, False)]
+        return []
+
+
+def get_splitter(format):
+    if format == "h264":
+        return AccessUnitSplitter()
+    return ChunkSplitter(SPLITTER_STRINGS[format] if format in SPLITTER_STRINGS.keys() else None)
+
+
 class SplitFrameStreamer(BaseStreamer):
-    def __init__(self, port, format, prepend_size=False, options=None):
+    def __init__(self, port, format, prepend_size=False, options=None,
+                 ring_size=DEFAULT_RING_SIZE, gop_cache_size=None):
         if options is None:
             options = {}
 
         super().__init__(port, format, options)
-        self.event = Event()
         self.prepend_size = prepend_size
-        self.stream = io.BytesIO()
-        self.last_frame = None
+        self.frames = FrameRing(ring_size)
+        # frames in the ring still reference their slot, the extra slots are the ones being assembled and read
+        self.assembler = FrameAssembler(pool_size=ring_size + 2)
+        self.frame_timestamp = None
         self.streamer_thread = None
-        self.splitter_string = SPLITTER_STRINGS[format] if format in SPLITTER_STRINGS.keys() else None
+        self.splitter = get_splitter(format)
+        # readers take frames with wait_for_frame instead of through an output
+        self.readers = 0
+        self._readers_lock = Lock()
+        self.gop_cache = None
+        if gop_cache_size:
+            self.enable_gop_cache(gop_cache_size)
+
+    def enable_gop_cache(self, max_size=DEFAULT_GOP_CACHE_SIZE):
+        """Outputs joining a running h264 stream get the current GOP replayed so they can decode right away.
+        Only modes serving joining clients ask for it, the cache copies every frame.
+        It starts replaying from the next keyframe when enabled on a running stream.
+        """
+        if self.format != "h264" or self.gop_cache is not None or not max_size:
+            return
+        with self.output.output_lock:
+            self.gop_cache = GopCache(max_size)
+            self.output.replay = self.gop_cache.replay
+
+    @property
+    def last_frame(self):
+        frame = self.frames.latest()
+        return frame.data if frame else None
 
     def _setup_streamer(self):
         self.sub_output = self
+        self.frames.reopen()
+        if self.gop_cache:
+            self.gop_cache.clear()
         if self.output:
             self.streamer_thread = Thread(target=self.stream_frames)
             self.streamer_thread.start()
@@ -32,43 +81,75 @@ class SplitFrameStreamer(BaseStreamer):
         return self.last_frame
 
     def get_next_frame(self, timeout=None):
-        if self.event.wait(timeout):
-            return self.last_frame
+        frame = self.wait_for_frame(self.frames.seq, timeout)
+        return frame.data if frame else None
+
+    def add_reader(self):
+        with self._readers_lock:
+            self.readers += 1
+
+    def remove_reader(self):
+        with self._readers_lock:
+            self.readers = max(0, self.readers - 1)
+
+    def in_use(self):
+        """True while the stream has outputs, derived streamers among them, or readers
+        """
+        return self.readers > 0 or self.output.has_outputs()
+
+    def wait_for_frame(self, after_seq, timeout=None):
+        """Returns the first frame newer than after_seq, see FrameRing.wait_for_frame.
+        Readers keep the seq of the returned frame to ask for the next one,
+        and are registered with add_reader while they read so the stream isn't stopped under them.
+        """
+        return self.frames.wait_for_frame(after_seq, timeout)
 
     def stream_frames(self):
+        seq = self.frames.seq
         while self.is_running:
             try:
-                frame = self.get_next_frame(timeout=1)
+                frame = self.wait_for_frame(seq, timeout=1)
                 if frame is None:
                     continue
 
-                self.event.clear()
-                if self.prepend_size:
-                    frame = struct.pack('<L', len(frame)) + frame
+                seq = frame.seq
+                if self.gop_cache:
+                    self.gop_cache.add(frame)
                 self.output.write(frame)
             except Exception as e:
                 print("Error writing next frame:", e)
 
-    def can_write(self, buf):
-        # check if buffer starts with splitter string if it exists
-        # if it doesn't exist then just check the stream is not empty
-        return ((self.splitter_string is not None and \
-                buf.startswith(self.splitter_string)) or \
-               (self.splitter_string is None)) and \
-               self.stream.tell() > 0
+    def _camera_timestamp(self):
+        try:
+            return self.camera.timestamp
+        except Exception:
+            return None
+
+    def _publish_frame(self, keyframe, config):
+        # frames are handed out as read-only views of the assembler pool, no copies are made
+        frame, sized_frame = self.assembler.finish()
+        self.frames.put(frame, self.frame_timestamp,
+                        sized_frame if self.prepend_size else frame,
+                        keyframe=keyframe, config=config)
 
+    def _assemble(self, buf):
+        if len(self.assembler) == 0:
+            self.frame_timestamp = self._camera_timestamp()
+        self.assembler.write(buf)
 
     def write(self, buf):
-        if self.can_write(buf):
-            self.stream.seek(0)
-            self.last_frame = self.stream.read()
-            self.event.set()
-            self.stream.seek(0)
-            self.stream.truncate()
+        start = 0
+        for boundary in self.splitter.feed(buf):
+            if boundary.offset > start:
+                self._assemble(memoryview(buf)[start:boundary.offset])
+            start = boundary.offset
+            if len(self.assembler) > 0:
+                self._publish_frame(boundary.keyframe, boundary.config)
 
-        self.stream.write(buf)
+        self._assemble(memoryview(buf)[start:] if start > 0 else buf)
 
     def _teardown_streamer(self):
+        self.frames.close()
         if self.streamer_thread:
             self.streamer_thread.join()
             self.streamer_thread = None
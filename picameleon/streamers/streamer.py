@@ -4,11 +4,17 @@ It also works as a multi-singleton class as it will only create new Streamer ins
 Different outputs can be appended to the same streamer instance.
 
 If the formats "h264" or "mjpeg" are set then it will return a SplitFrameStreamer which streams a frame at a time.
+h264 streamers only keep the current GOP for outputs joining later when one of their users passes a gop_cache_size.
 All other formats return an instance of BaseStreamer which produces raw streams.
+
+Raw streams (yuv, rgb, bgr) can also be derived from a running raw streamer of a bigger resolution,
+a DerivedStreamer downscales its frames in software instead of taking a camera port.
+This happens when the camera ports have run out, or always when derive is set.
 """
 import os
 from .base import BaseStreamer
 from .split_frame import SplitFrameStreamer
+from .derived import DerivedStreamer, find_source
 from utils.single_picamera import SinglePiCamera
 from threading import Lock
 
@@ -16,9 +22,9 @@ ROOT_PATH = '{0}/../'.format(os.path.dirname(os.path.abspath(__file__)))
 SPLIT_FRAME_FORMATS = ("mjpeg", "h264")
 
 
-def get_streamer_instance(port, format, prepend_size, split_frames, recording_options):
+def get_streamer_instance(port, format, prepend_size, split_frames, recording_options, gop_cache_size=None):
     if split_frames:
-        return SplitFrameStreamer(port, format, prepend_size, options=recording_options)
+        return SplitFrameStreamer(port, format, prepend_size, options=recording_options, gop_cache_size=gop_cache_size)
     else:
         return BaseStreamer(port, format, options=recording_options)
 
@@ -45,7 +51,9 @@ class Streamer:
                 id_motion_output=(None, None),
                 prepend_size=False,
                 split_frames=True,
-                recording_options=None):
+                recording_options=None,
+                gop_cache_size=None,
+                derive=None):
         with cls._lock:
             if recording_options is None:
                 recording_options = {"resize": SinglePiCamera().resolution}
@@ -63,31 +71,43 @@ class Streamer:
                     streamer.output.add_output(outID, output)
                 if motion_output:
                     streamer.motion_output.add_output(moutID, motion_output)
+                if gop_cache_size and type(streamer) is SplitFrameStreamer:
+                    streamer.enable_gop_cache(gop_cache_size)
                 return streamer
 
+            source = None
+            if derive or (derive is None and len(cls._available_ports) == 0):
+                options = {key: value for key, value in recording_options.items() if key != "resize"}
+                source = find_source(cls._streamers.values(), format, resolution, options)
+
+            if source is not None:
+                new_streamer = DerivedStreamer(source, format, prepend_size, options=recording_options)
+                new_streamer._callback = lambda port: cls._remove_derived_streamer(port_key)
             # Try cleaning up streamers and recovering ports
             elif len(cls._available_ports) == 0:
                 raise Exception("No more camera ports available for new streamer")
+            else:
+                port = cls._available_ports.pop(0)
+                new_streamer = get_streamer_instance(
+                    port, format, prepend_size, split_frames, recording_options, gop_cache_size)
+                cls._portmap[port] = port_key
+                new_streamer._callback = cls._return_port_availability
 
-            port = cls._available_ports.pop(0)
-            new_streamer = get_streamer_instance(
-                port, format, prepend_size, split_frames, recording_options)
             if output and outID:
                 new_streamer.output.add_output(outID, output)
             if motion_output and moutID:
                 new_streamer.motion_output.add_output(moutID, motion_output)
 
             cls._streamers[port_key] = new_streamer
-            cls._portmap[port] = port_key
-            new_streamer._callback = cls._return_port_availability
             return new_streamer
 
     @classmethod
     def shutdown_streamers(cls):
-        keys = [key for key in cls._streamers.keys()]
-        for streamerId in keys:
-            cls._streamers[streamerId].stop()
-            cls._streamers[streamerId].shutdown()
+        # stopping a streamer removes it from _streamers, and a derived one may stop its source too
+        streamers = [streamer for streamer in cls._streamers.values()]
+        for streamer in streamers:
+            streamer.stop()
+            streamer.shutdown()
 
 
     @classmethod
@@ -121,6 +141,12 @@ class Streamer:
                 cls._available_ports.append(port)
                 cls._picture_port = None
 
+    @classmethod
+    def _remove_derived_streamer(cls, port_key):
+        with cls._lock:
+            if port_key in cls._streamers:
+                del cls._streamers[port_key]
+
     @classmethod
     def take_picture(cls, output, format="jpeg", **capture_options):
         """Picture ports can be reused between components that have the same
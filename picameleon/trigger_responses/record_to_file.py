@@ -4,7 +4,7 @@ from datetime import datetime
 from utils.single_picamera import SinglePiCamera
 from streamers.streamer import Streamer, ROOT_PATH
 from .base import BaseTriggerResponse
-from picamerax import PiCameraCircularIO
+from utils.camera_backend import load_backend
 from threading import Thread
 
 
@@ -29,7 +29,7 @@ class RecordToFile(BaseTriggerResponse):
     def _initialize_trigger_response(self):
         self.streamer = Streamer(
             self.format, split_frames=False, recording_options=self.recording_options)
-        self.before_buffer = PiCameraCircularIO(
+        self.before_buffer = load_backend().PiCameraCircularIO(
             SinglePiCamera(), seconds=self.seconds_before, splitter_port=self.streamer.port)
         self.streamer.output = self.before_buffer
         self.streamer.start()
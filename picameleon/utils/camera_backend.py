@@ -0,0 +1,59 @@
+"""
+Camera backends.
+
+Everything that talks to the camera gets its classes from the selected backend:
+"picamera" uses the real camera through picamerax,
+"simulated" generates synthetic streams so the whole pipeline can run on any machine.
+
+The backend is chosen with the PICAMELEON_CAMERA_BACKEND environment variable
+or else with the "camera_backend" key of the globals config.
+"""
+import os
+import numpy as np
+from types import SimpleNamespace
+from .consts import GLOBALS, CAMERA_BACKEND
+
+CAMERA_BACKEND_ENV = "PICAMELEON_CAMERA_BACKEND"
+PICAMERA_BACKEND = "picamera"
+SIMULATED_BACKEND = "simulated"
+
+# Layout of the motion vector data of every macroblock as written by the camera to the motion_output
+MOTION_DTYPE = np.dtype([
+    ("x", np.int8),
+    ("y", np.int8),
+    ("sad", np.uint16),
+])
+
+
+def get_backend_name():
+    return os.environ.get(CAMERA_BACKEND_ENV, GLOBALS[CAMERA_BACKEND])
+
+
+def load_backend(name=None):
+    """Returns the PiCamera, PiCameraCircularIO and PiRGBArray classes of the backend.
+    The classes are looked up on every call so they can still be patched.
+    """
+    if name is None:
+        name = get_backend_name()
+
+    if name == PICAMERA_BACKEND:
+        import picamerax
+        import picamerax.array
+        return SimpleNamespace(PiCamera=picamerax.PiCamera,
+                               PiCameraCircularIO=picamerax.PiCameraCircularIO,
+                               PiRGBArray=picamerax.array.PiRGBArray)
+    if name == SIMULATED_BACKEND:
+        from . import simulated_camera
+        return SimpleNamespace(PiCamera=simulated_camera.SimulatedCamera,
+                               PiCameraCircularIO=simulated_camera.SimulatedCircularIO,
+                               PiRGBArray=simulated_camera.SimulatedRGBArray)
+
+    raise Exception("Unknown camera backend '%s', use '%s' or '%s'" % (name, PICAMERA_BACKEND, SIMULATED_BACKEND))
+
+
+def motion_resolution(resolution):
+    """Returns the (rows, cols) of macroblocks in the motion data of a frame,
+    there is always one extra column.
+    """
+    width, height = resolution
+    return (height + 15) // 16, ((width + 15) // 16) + 1
@@ -2,17 +2,38 @@
 TRUSTED_FACES = "trusted_faces"
 MOTION_DETECTOR_THRESHOLD = "motion_detector_threshold"
 MOTION_DETECTOR_SENSITIVITY = "motion_detector_sensitivity"
+MOTION_DETECTOR_SAD_THRESHOLD = "motion_detector_sad_threshold"
 TRIGGER_COOLDOWN_TIME = "trigger_cooldown_time"
+CAMERA_BACKEND = "camera_backend"
+OUTPUT_BUFFER_SIZE = "output_buffer_size"
+OUTPUT_BUFFER_HIGH_WATERMARK = "output_buffer_high_watermark"
+OUTPUT_BUFFER_LOW_WATERMARK = "output_buffer_low_watermark"
+OUTPUT_WORKERS = "output_workers"
+OUTPUT_CONCURRENCY = "output_concurrency"
 
 # Global Default
 TRUSTED_FACES_DEFAULT = []
 MOTION_DETECTOR_THRESHOLD_DEFAULT = 15  # Magnitude of motion vector
 MOTION_DETECTOR_SENSITIVITY_DEFAULT = 25  # Number of motion vectors
+MOTION_DETECTOR_SAD_THRESHOLD_DEFAULT = 256  # Sum of absolute differences of a macroblock
 TRIGGER_COOLDOWN_TIME_DEFAULT = 5
+CAMERA_BACKEND_DEFAULT = "picamera"  # or "simulated" to run without a camera
+OUTPUT_BUFFER_SIZE_DEFAULT = 16 * 1024 * 1024  # Bytes every stream may buffer for its writer thread
+OUTPUT_BUFFER_HIGH_WATERMARK_DEFAULT = 0.9  # Fraction of the buffer size where frames start being shed
+OUTPUT_BUFFER_LOW_WATERMARK_DEFAULT = 0.5  # Fraction of the buffer size where shedding stops
+OUTPUT_WORKERS_DEFAULT = 16  # Threads shared by all output holders to write to their outputs
+OUTPUT_CONCURRENCY_DEFAULT = 8  # Workers a single output holder may use at the same time
 
 GLOBALS = {
     TRUSTED_FACES: TRUSTED_FACES_DEFAULT,
     MOTION_DETECTOR_THRESHOLD: MOTION_DETECTOR_THRESHOLD_DEFAULT,
     MOTION_DETECTOR_SENSITIVITY: MOTION_DETECTOR_SENSITIVITY_DEFAULT,
-    TRIGGER_COOLDOWN_TIME: TRIGGER_COOLDOWN_TIME_DEFAULT
+    MOTION_DETECTOR_SAD_THRESHOLD: MOTION_DETECTOR_SAD_THRESHOLD_DEFAULT,
+    TRIGGER_COOLDOWN_TIME: TRIGGER_COOLDOWN_TIME_DEFAULT,
+    CAMERA_BACKEND: CAMERA_BACKEND_DEFAULT,
+    OUTPUT_BUFFER_SIZE: OUTPUT_BUFFER_SIZE_DEFAULT,
+    OUTPUT_BUFFER_HIGH_WATERMARK: OUTPUT_BUFFER_HIGH_WATERMARK_DEFAULT,
+    OUTPUT_BUFFER_LOW_WATERMARK: OUTPUT_BUFFER_LOW_WATERMARK_DEFAULT,
+    OUTPUT_WORKERS: OUTPUT_WORKERS_DEFAULT,
+    OUTPUT_CONCURRENCY: OUTPUT_CONCURRENCY_DEFAULT
 }
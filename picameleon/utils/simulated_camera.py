@@ -0,0 +1,488 @@
+"""
+The simulated camera backend.
+
+SimulatedCamera stands in for picamerax.PiCamera on machines without a camera.
+Every splitter port records in its own thread at the camera framerate and writes to its output
+byte streams shaped like the ones of the real encoders:
+- h264: SPS/PPS + IDR every intra_period frames and P slices in between, sized after the bitrate
+- mjpeg: one jpeg (SOI ... EOI) per frame, sized after the quality
+- yuv, rgb, bgr, rgba, bgra: padded raw frames of a scene with a moving block
+h264 recordings also write the motion vectors of the moving block to their motion_output.
+
+The scene is the same on every port, every motion_cycle seconds a block crosses the frame
+in CROSSING_TIME seconds and stays still until the next cycle, when it crosses back.
+"""
+import io
+import os
+import random
+from collections import deque
+from time import monotonic, sleep
+from threading import Thread, Event, Lock
+import numpy as np
+from .camera_backend import MOTION_DTYPE, motion_resolution
+from streamers.downscale import RAW_FORMATS, raw_resolution, parse_resolution
+from streamers.h264 import NAL_SPS
+
+DEFAULT_RESOLUTION = (1280, 720)
+DEFAULT_FRAMERATE = 30
+DEFAULT_BITRATE = 17000000
+DEFAULT_QUALITY = 85
+DEFAULT_INTRA_PERIOD = 60
+DEFAULT_MOTION_CYCLE = 10  # seconds, 0 keeps the scene still
+CROSSING_TIME = 2  # seconds the block takes to cross the frame
+WRITE_CHUNK_SIZE = 65536  # the encoders hand out big frames in several buffers
+FRAME_SIZE_JITTER = 0.2
+SPLIT_TIMEOUT = 5
+
+# I frames are about this many times bigger than P frames
+KEYFRAME_SIZE_RATIO = 4
+SPS_PPS = (b'\x00\x00\x00\x01\x27\x64\x00\x28\xac\x2b\x40\x28\x02\xdd\x00\xf1\x22\x6a'
+           b'\x00\x00\x00\x01\x28\xee\x02\x5c\xb0')
+# NAL header followed by a slice header starting with first_mb_in_slice == 0
+IDR_SLICE_HEADER = b'\x00\x00\x00\x01\x25\x88'
+P_SLICE_HEADER = b'\x00\x00\x00\x01\x21\x9a'
+JPEG_HEADER = b'\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00'
+JPEG_END = b'\xff\xd9'
+
+OBJECT_RGB = (255, 64, 0)
+OBJECT_YUV = (114, 79, 218)
+
+
+def _filler(size, seed):
+    # no 0x00 or 0xff bytes so the filler never looks like a start code or a jpeg marker
+    return np.random.RandomState(seed).randint(1, 255, size, dtype=np.uint8).tobytes()
+
+
+def _open_output(output):
+    if isinstance(output, str):
+        return open(output, "wb"), True
+    return output, False
+
+
+def _close_output(output, opened):
+    if opened:
+        output.close()
+        return
+
+    flush = getattr(output, "flush", None)
+    if flush is not None:
+        flush()
+
+
+def _get_format(output, format):
+    if format:
+        return "mjpeg" if format == "mjpg" else format
+    if isinstance(output, str):
+        extension = os.path.splitext(output)[1][1:].lower()
+        if extension:
+            return {"jpg": "jpeg", "mjpg": "mjpeg", "264": "h264"}.get(extension, extension)
+    raise Exception("Unable to determine the format of output %s, set format" % output)
+
+
+class Scene:
+    def __init__(self, framerate, motion_cycle=DEFAULT_MOTION_CYCLE):
+        self.framerate = framerate
+        self.motion_cycle = motion_cycle
+        self._layouts = {}
+
+    def object_box(self, index, resolution):
+        """Returns (x, y, width, height, speed) of the block in frame index,
+        speed is in pixels per frame along x.
+        """
+        width, height = resolution
+        box_width, box_height = max(width // 6, 16), max(height // 6, 16)
+        y = (height - box_height) // 2
+        travel = max(width - box_width, 0)
+        if not self.motion_cycle:
+            return 0, y, box_width, box_height, 0
+
+        cycle, elapsed = divmod(index / self.framerate, self.motion_cycle)
+        progress = min(elapsed / CROSSING_TIME, 1.0)
+        speed = travel / (CROSSING_TIME * self.framerate) if progress < 1 else 0
+        if int(cycle) % 2:
+            progress, speed = 1 - progress, -speed
+        return int(progress * travel), y, box_width, box_height, speed
+
+    def _build_layout(self, format, resolution):
+        """Returns the background of a padded raw frame and a function painting the block on a frame
+        """
+        fwidth, fheight = raw_resolution(resolution)
+        gradient = np.tile((np.arange(fwidth) * 200 // max(fwidth - 1, 1)).astype(np.uint8), (fheight, 1))
+        if format == "yuv":
+            uv_width, uv_height = fwidth // 2, fheight // 2
+            background = gradient.tobytes() + bytes([128]) * (2 * uv_width * uv_height)
+
+            def paint(frame, x, y, width, height):
+                planes = (frame[:fwidth * fheight].reshape(fheight, fwidth),
+                          frame[fwidth * fheight:fwidth * fheight + uv_width * uv_height].reshape(uv_height, uv_width),
+                          frame[fwidth * fheight + uv_width * uv_height:].reshape(uv_height, uv_width))
+                planes[0][y:y + height, x:x + width] = OBJECT_YUV[0]
+                for plane, value in zip(planes[1:], OBJECT_YUV[1:]):
+                    plane[y // 2:(y + height) // 2, x // 2:(x + width) // 2] = value
+        else:
+            bytes_per_pixel = RAW_FORMATS[format]
+            pixels = np.repeat(gradient[:, :, np.newaxis], bytes_per_pixel, axis=2)
+            color = OBJECT_RGB[::-1] if format.startswith("bgr") else OBJECT_RGB
+            if bytes_per_pixel == 4:
+                pixels[:, :, 3] = 255
+                color = color + (255,)
+            background = pixels.tobytes()
+
+            def paint(frame, x, y, width, height):
+                frame.reshape(fheight, fwidth, bytes_per_pixel)[y:y + height, x:x + width] = color
+
+        self._layouts[(format, resolution)] = (background, paint)
+        return background, paint
+
+    def raw_frame(self, format, index, resolution):
+        layout = self._layouts.get((format, resolution))
+        background, paint = layout if layout else self._build_layout(format, resolution)
+        frame = bytearray(background)
+        x, y, width, height, _ = self.object_box(index, resolution)
+        paint(np.frombuffer(frame, dtype=np.uint8), x, y, width, height)
+        return frame
+
+
+class MotionVectors:
+    def __init__(self, scene, resolution, seed=0):
+        self.scene = scene
+        self.resolution = resolution
+        self.background = np.zeros(motion_resolution(resolution), dtype=MOTION_DTYPE)
+        self.background["sad"] = np.random.RandomState(seed).randint(0, 64, self.background.shape)
+        self.still = self.background.tobytes()
+
+    def vectors(self, index):
+        x, y, width, height, speed = self.scene.object_box(index, self.resolution)
+        if speed == 0:
+            return self.still
+
+        vectors = self.background.copy()
+        block = (slice(y // 16, (y + height + 15) // 16), slice(x // 16, (x + width + 15) // 16))
+        vectors["x"][block] = int(np.clip(-round(speed), -128, 127))
+        vectors["sad"][block] += 512
+        return vectors.tobytes()
+
+
+class RawEncoder:
+    def __init__(self, format, resolution, scene):
+        self.format = format
+        self.resolution = resolution
+        self.scene = scene
+
+    def encode(self, index, keyframe=False):
+        return [self.scene.raw_frame(self.format, index, self.resolution)]
+
+
+class MJPEGEncoder:
+    def __init__(self, resolution, quality=DEFAULT_QUALITY, seed=0):
+        quality = quality if quality else DEFAULT_QUALITY
+        bytes_per_pixel = 0.02 + 0.2 * quality / 100
+        self.frame_size = int(resolution[0] * resolution[1] * bytes_per_pixel)
+        self.filler = _filler(int(self.frame_size * (1 + FRAME_SIZE_JITTER)) + 256, seed)
+        self.random = random.Random(seed)
+
+    def encode(self, index, keyframe=False):
+        size = int(self.frame_size * self.random.uniform(1 - FRAME_SIZE_JITTER, 1 + FRAME_SIZE_JITTER))
+        start = index % 256
+        frame = JPEG_HEADER + self.filler[start:start + size] + JPEG_END
+        return [frame[i:i + WRITE_CHUNK_SIZE] for i in range(0, len(frame), WRITE_CHUNK_SIZE)]
+
+
+class H264Encoder:
+    def __init__(self, framerate, bitrate=DEFAULT_BITRATE, intra_period=DEFAULT_INTRA_PERIOD,
+                 inline_headers=True, seed=0):
+        bitrate = bitrate if bitrate else DEFAULT_BITRATE
+        self.intra_period = max(int(intra_period), 1)
+        # keep the average frame size at the bitrate
+        frame_size = bitrate / 8 / framerate
+        self.p_size = int(frame_size * self.intra_period / (self.intra_period + KEYFRAME_SIZE_RATIO - 1))
+        self.i_size = self.p_size * KEYFRAME_SIZE_RATIO
+        self.inline_headers = inline_headers
+        self.filler = _filler(int(self.i_size * (1 + FRAME_SIZE_JITTER)) + 256, seed)
+        self.random = random.Random(seed)
+        self.frames_since_keyframe = None
+
+    def encode(self, index, keyframe=False):
+        keyframe = keyframe or self.frames_since_keyframe is None or self.frames_since_keyframe >= self.intra_period
+        buffers = []
+        if keyframe:
+            if self.inline_headers or self.frames_since_keyframe is None:
+                buffers.append(SPS_PPS)
+            self.frames_since_keyframe = 0
+        self.frames_since_keyframe += 1
+
+        size = int((self.i_size if keyframe else self.p_size) *
+                   self.random.uniform(1 - FRAME_SIZE_JITTER, 1 + FRAME_SIZE_JITTER))
+        start = index % 256
+        nal = (IDR_SLICE_HEADER if keyframe else P_SLICE_HEADER) + self.filler[start:start + size]
+        buffers.extend(nal[i:i + WRITE_CHUNK_SIZE] for i in range(0, len(nal), WRITE_CHUNK_SIZE))
+        return buffers
+
+
+def get_encoder(format, resolution, framerate, scene, options, seed=0):
+    if format == "h264":
+        return H264Encoder(framerate,
+                           bitrate=options.get("bitrate", DEFAULT_BITRATE),
+                           intra_period=options.get("intra_period", DEFAULT_INTRA_PERIOD),
+                           inline_headers=options.get("inline_headers", True),
+                           seed=seed)
+    if format == "mjpeg":
+        return MJPEGEncoder(resolution, quality=options.get("quality", DEFAULT_QUALITY), seed=seed)
+    if format in RAW_FORMATS:
+        return RawEncoder(format, resolution, scene)
+    raise Exception("Simulated camera can't record %s" % format)
+
+
+class SimulatedRecording(Thread):
+    def __init__(self, camera, port, output, format, resolution, motion_output=None, options={}):
+        Thread.__init__(self, daemon=True)
+        self.camera = camera
+        self.port = port
+        self.output, self.opened = _open_output(output)
+        self.encoder = get_encoder(format, resolution, camera.framerate, camera.scene, options, seed=port)
+        self.motion_output, self.motion_opened = None, False
+        self.motion_vectors = None
+        if motion_output is not None and format == "h264":
+            self.motion_output, self.motion_opened = _open_output(motion_output)
+            self.motion_vectors = MotionVectors(camera.scene, resolution, seed=port)
+        self.stopped = Event()
+        self.finished = Event()
+        self.error = None
+        self._split_output = None
+        self._split_done = Event()
+        self._lock = Lock()
+
+    def split(self, output, timeout=SPLIT_TIMEOUT):
+        """Switches to output on the next frame, which will be a keyframe, like the camera does
+        """
+        with self._lock:
+            self._split_done.clear()
+            self._split_output = output
+        if not self._split_done.wait(timeout):
+            raise Exception("Timed out splitting recording on port %d" % self.port)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def _write_frame(self):
+        with self._lock:
+            split_output, self._split_output = self._split_output, None
+        if split_output is not None:
+            _close_output(self.output, self.opened)
+            self.output, self.opened = _open_output(split_output)
+
+        index = self.camera.frame_index
+        for buf in self.encoder.encode(index, keyframe=split_output is not None):
+            self.output.write(buf)
+        if self.motion_output is not None:
+            self.motion_output.write(self.motion_vectors.vectors(index))
+        if split_output is not None:
+            self._split_done.set()
+
+    def run(self):
+        interval = 1.0 / self.camera.framerate
+        next_frame = monotonic()
+        try:
+            while not self.stopped.is_set():
+                self._write_frame()
+                next_frame += interval
+                delay = next_frame - monotonic()
+                if delay > 0:
+                    self.stopped.wait(delay)
+                elif delay < -interval:
+                    # the outputs are too slow, skip the frames that were missed like the camera does
+                    next_frame = monotonic()
+        except Exception as e:
+            print("Error in simulated recording on port %d: %s" % (self.port, e))
+            self.error = e
+        finally:
+            try:
+                _close_output(self.output, self.opened)
+                if self.motion_output is not None:
+                    _close_output(self.motion_output, self.motion_opened)
+            finally:
+                self.finished.set()
+
+
+class SimulatedCamera:
+    def __init__(self, camera_num=0, stereo_mode='none', stereo_decimate=False,
+                 resolution=None, framerate=None, sensor_mode=0, led_pin=None,
+                 clock_mode='reset', framerate_range=None, motion_cycle=DEFAULT_MOTION_CYCLE):
+        self.resolution = resolution
+        self.framerate = framerate
+        self.scene = Scene(self.framerate, motion_cycle)
+        self.recordings = {}
+        self.closed = False
+        self._lock = Lock()
+        self._start_time = monotonic()
+
+    @property
+    def resolution(self):
+        return self._resolution
+
+    @resolution.setter
+    def resolution(self, value):
+        self._resolution = parse_resolution(value) if value else DEFAULT_RESOLUTION
+
+    @property
+    def framerate(self):
+        return self._framerate
+
+    @framerate.setter
+    def framerate(self, value):
+        self._framerate = float(value) if value else DEFAULT_FRAMERATE
+        if hasattr(self, "scene"):
+            self.scene.framerate = self._framerate
+
+    @property
+    def timestamp(self):
+        """Microseconds since the camera started, like the camera clock
+        """
+        return int((monotonic() - self._start_time) * 1000000)
+
+    @property
+    def frame_index(self):
+        return int((monotonic() - self._start_time) * self.framerate)
+
+    @property
+    def recording(self):
+        return len(self.recordings) > 0
+
+    def _get_recording(self, splitter_port):
+        recording = self.recordings.get(splitter_port)
+        if recording is None:
+            raise Exception("There is no recording in progress on port %d" % splitter_port)
+        return recording
+
+    def start_recording(self, output, format=None, resize=None, splitter_port=1, **options):
+        with self._lock:
+            if splitter_port in self.recordings:
+                raise Exception("The camera is already using port %d" % splitter_port)
+            format = _get_format(output, format)
+            motion_output = options.pop("motion_output", None)
+            resolution = parse_resolution(resize) if resize else self.resolution
+            recording = SimulatedRecording(self, splitter_port, output, format, resolution, motion_output, options)
+            self.recordings[splitter_port] = recording
+        recording.start()
+
+    def split_recording(self, output, splitter_port=1, **options):
+        self._get_recording(splitter_port).split(output)
+
+    def wait_recording(self, timeout=0, splitter_port=1):
+        recording = self._get_recording(splitter_port)
+        recording.finished.wait(timeout)
+        if recording.error is not None:
+            raise recording.error
+
+    def stop_recording(self, splitter_port=1):
+        with self._lock:
+            recording = self._get_recording(splitter_port)
+            del self.recordings[splitter_port]
+        recording.stop()
+        if recording.error is not None:
+            raise recording.error
+
+    def capture(self, output, format=None, use_video_port=False, resize=None, splitter_port=0, **options):
+        format = _get_format(output, format)
+        resolution = parse_resolution(resize) if resize else self.resolution
+        # the picture is taken from the next frame
+        sleep(1.0 / self.framerate)
+        index = self.frame_index
+        if format in RAW_FORMATS:
+            data = self.scene.raw_frame(format, index, resolution)
+        else:
+            data = b"".join(MJPEGEncoder(resolution, options.get("quality", DEFAULT_QUALITY), seed=index).encode(index))
+
+        output, opened = _open_output(output)
+        output.write(data)
+        _close_output(output, opened)
+
+    def close(self):
+        for port in list(self.recordings.keys()):
+            try:
+                self.stop_recording(port)
+            except Exception as e:
+                print("Error stopping simulated recording on port %d: %s" % (port, e))
+        self.closed = True
+
+
+class SimulatedCircularIO:
+    """Keeps the latest seconds (or size bytes) of a h264 recording like picamerax.PiCameraCircularIO.
+    copy_to always starts at the first SPS header kept so the copy can be decoded.
+    """
+
+    def __init__(self, camera, size=None, seconds=None, bitrate=DEFAULT_BITRATE, splitter_port=1):
+        if size is None and seconds is None:
+            raise Exception("You must specify either size, or seconds")
+        self.camera = camera
+        self.size = size if size is not None else bitrate * seconds // 8
+        self.splitter_port = splitter_port
+        self.chunks = deque()
+        self.length = 0
+        self._lock = Lock()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        data = bytes(b)
+        keyframe = len(data) > 4 and data.startswith(b'\x00\x00\x00\x01') and data[4] & 0x1f == NAL_SPS
+        with self._lock:
+            self.chunks.append((self.camera.timestamp, keyframe, data))
+            self.length += len(data)
+            while self.length > self.size and len(self.chunks) > 1:
+                self.length -= len(self.chunks.popleft()[2])
+        return len(data)
+
+    def copy_to(self, output, size=None, seconds=None, first_frame=None):
+        with self._lock:
+            chunks = list(self.chunks)
+        if seconds is not None:
+            since = self.camera.timestamp - seconds * 1000000
+            chunks = [chunk for chunk in chunks if chunk[0] >= since]
+        if size is not None:
+            while chunks and sum(len(chunk[2]) for chunk in chunks) > size:
+                chunks.pop(0)
+
+        starts = [i for i, chunk in enumerate(chunks) if chunk[1]]
+        output, opened = _open_output(output)
+        for _, _, data in chunks[starts[0]:] if starts else []:
+            output.write(data)
+        if opened:
+            output.close()
+
+    def clear(self):
+        with self._lock:
+            self.chunks.clear()
+            self.length = 0
+
+
+class SimulatedRGBArray(io.BytesIO):
+    """Fills array with the (rows, columns, 3) pixels of the captured rgb data when flushed,
+    like picamerax.array.PiRGBArray.
+    """
+
+    def __init__(self, camera, size=None):
+        super().__init__()
+        self.camera = camera
+        self.size = size
+        self.array = None
+
+    def truncate(self, size=None):
+        result = super().truncate(size)
+        if size is not None:
+            self.seek(size)
+        return result
+
+    def flush(self):
+        super().flush()
+        data = self.getvalue()
+        if not data:
+            return
+
+        width, height = self.size or self.camera.resolution
+        fwidth, fheight = raw_resolution((width, height))
+        if len(data) != fwidth * fheight * 3:
+            raise Exception("Incorrect buffer length for resolution %dx%d" % (width, height))
+        self.array = np.frombuffer(data, dtype=np.uint8).reshape((fheight, fwidth, 3))[:height, :width]
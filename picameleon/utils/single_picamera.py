@@ -3,10 +3,11 @@ SinglePiCamera class
 
 Since only one instance of PiCamera can exist this
 simply wraps the PiCamera object in a singleton class.
+The PiCamera class comes from the configured camera backend, see utils.camera_backend.
 """
 import inspect
 
-from picamerax import PiCamera
+from .camera_backend import load_backend
 
 
 class SinglePiCamera:
@@ -14,6 +15,7 @@ class SinglePiCamera:
 
     def __init__(self, **options):
         if not SinglePiCamera.instance:
+            PiCamera = load_backend().PiCamera
             picam_args = set(inspect.getfullargspec(PiCamera).args)
 
             # clean up args that dont belong and set new ones that didn't exist before
@@ -66,6 +66,12 @@ class TestBaseMode(unittest.TestCase):
         mode.trigger_all()
         for mock in mock_trigger_responses:
             mock.assert_has_calls([call.trigger("base")])
+
+    def test_trigger_all_with_args(self):
+        mode = BaseMode({}, mock_trigger_responses)
+        mode.trigger_all({"blobs": []})
+        for mock in mock_trigger_responses:
+            mock.assert_has_calls([call.trigger("base", {"blobs": []})])
     """
     def test_retrigger(self):
         mode = BaseMode({}, mock_trigger_responses)
@@ -1,4 +1,6 @@
 from picameleon import Client
+from picameleon.outputs.stream_protocol import FrameHeaders, handshake
+from types import SimpleNamespace
 import unittest
 from unittest.mock import MagicMock, patch, call
 from struct import pack
@@ -14,6 +16,24 @@ def mocked_recv(bufsize):
     return b'\x00'*bufsize
 
 
+def framed_recv():
+    """Sends the handshake of protocol 2 then numbered frames for as long as they're read"""
+    headers = FrameHeaders("mjpeg", (640, 480))
+    data = handshake(2)
+    seq = 0
+
+    def recv(bufsize):
+        nonlocal data, seq
+        if not data:
+            seq += 1
+            frame = SimpleNamespace(seq=seq, timestamp=seq * 1000, published=None, keyframe=seq % 10 == 1,
+                                    config=False, data=b'\x00' * 512)
+            data = headers.header(frame) + frame.data
+        chunk, data = data[:bufsize], data[bufsize:]
+        return chunk
+    return recv
+
+
 class TestClient(unittest.TestCase):
     def tearDown(self):
         if client:
@@ -101,6 +121,29 @@ class TestClient(unittest.TestCase):
         self.assertEqual(0, len(client.current_streams))
         self.assertEqual(0, len(client.current_frames))
 
+    @patch("socket.socket")
+    def test_fetch_stream_protocol_2(self, mocked_socket: MagicMock):
+        global client
+        # given
+        mocked_socket.return_value = MagicMock()
+        mocked_socket.return_value.recv = framed_recv()
+        client = Client("localhost")
+
+        # when
+        client.fetch_stream("stream1", "mjpeg", protocol=2)
+        frame = client.get_next_frame("stream1")
+        info = client.get_frame_info("stream1")
+
+        # then
+        mocked_socket.assert_has_calls([call().sendall(b'{"format": "mjpeg", "protocol": 2}')], any_order=True)
+        self.assertEqual(frame, b'\x00'*512)
+        self.assertEqual(info.size, 512)
+        self.assertEqual(info.timestamp, info.seq * 1000)
+        self.assertEqual(info.keyframe, info.seq % 10 == 1)
+        self.assertEqual((info.format, info.width, info.height), ("mjpeg", 640, 480))
+        client.stop_stream("stream1")
+        self.assertEqual(0, len(client.current_frame_info))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,52 @@
+import sys
+sys.path.append("/picameleon")
+from streamers.downscale import Downscaler, parse_resolution, raw_frame_size
+import numpy as np
+import unittest
+
+
+class TestDownscale(unittest.TestCase):
+
+    def test_parse_resolution(self):
+        self.assertEqual(parse_resolution("1280x720"), (1280, 720))
+        self.assertEqual(parse_resolution([640, 480]), (640, 480))
+        self.assertIsNone(parse_resolution("720p"))
+
+    def test_raw_frame_size(self):
+        self.assertEqual(raw_frame_size("yuv", (1920, 1080)), 1920 * 1088 * 3 // 2)
+        self.assertEqual(raw_frame_size("rgb", (100, 100)), 128 * 112 * 3)
+        self.assertEqual(raw_frame_size("bgra", (100, 100), 16), 112 * 112 * 4)
+
+    def test_downscale_yuv(self):
+        y = np.arange(64 * 32, dtype=np.uint16).reshape(32, 64)
+        u = np.full((16, 32), 1, dtype=np.uint8)
+        v = np.full((16, 32), 2, dtype=np.uint8)
+        src = np.concatenate([(y % 251).astype(np.uint8).ravel(), u.ravel(), v.ravel()])
+        frame, payload = Downscaler("yuv", (64, 32), (32, 16)).scale(src.tobytes())
+
+        self.assertEqual(len(frame), raw_frame_size("yuv", (32, 16)))
+        self.assertEqual(bytes(frame), bytes(payload))
+        scaled = np.frombuffer(frame, dtype=np.uint8)
+        self.assertTrue(np.array_equal(scaled[:32 * 16].reshape(16, 32), (y[1::2, 1::2] % 251)))
+        self.assertTrue(np.all(scaled[32 * 16:32 * 16 + 16 * 8] == 1))
+        self.assertTrue(np.all(scaled[32 * 16 + 16 * 8:] == 2))
+
+    def test_downscale_rgb_keeps_padding(self):
+        src = np.zeros((48, 64, 3), dtype=np.uint8)
+        src[:, :, 0], src[:, :, 1], src[:, :, 2] = 10, 20, 30
+        frame, payload = Downscaler("rgb", (64, 48), (20, 10)).scale(src.tobytes(), prepend_size=True)
+
+        # the camera pads 20x10 to 32x16
+        self.assertEqual(len(frame), 32 * 16 * 3)
+        self.assertEqual(bytes(payload[:4]), (32 * 16 * 3).to_bytes(4, "little"))
+        pixels = np.frombuffer(frame, dtype=np.uint8).reshape(16, 32, 3)
+        self.assertTrue(np.all(pixels == [10, 20, 30]))
+
+    def test_invalid_downscale(self):
+        self.assertRaises(Exception, Downscaler, "h264", (64, 48), (32, 24))
+        self.assertRaises(Exception, Downscaler, "rgb", (64, 48), (128, 96))
+        self.assertRaises(Exception, Downscaler("rgb", (64, 48), (32, 24)).scale, bytes(10))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import sys
+sys.path.append("/picameleon")
+from streamers.frame_assembler import FrameAssembler, buffer_in_use
+import struct
+import unittest
+
+
+class TestFrameAssembler(unittest.TestCase):
+
+    def test_finish_returns_frame_and_sized_frame(self):
+        assembler = FrameAssembler(pool_size=2, frame_size=4)
+        assembler.write(b'\xff\xd8abc')
+        assembler.write(b'defgh')
+        frame, sized_frame = assembler.finish()
+        self.assertEqual(bytes(frame), b'\xff\xd8abcdefgh')
+        self.assertEqual(bytes(sized_frame), struct.pack('<L', 10) + b'\xff\xd8abcdefgh')
+        self.assertEqual(len(assembler), 0)
+        self.assertIsNone(assembler.finish())
+
+    def test_frames_are_readonly(self):
+        assembler = FrameAssembler()
+        assembler.write(b'frame')
+        frame, _ = assembler.finish()
+        self.assertTrue(frame.readonly)
+
+    def test_frame_stays_valid_while_referenced(self):
+        """Slots still referenced by a consumer must not be overwritten
+        """
+        assembler = FrameAssembler(pool_size=1)
+        assembler.write(b'first')
+        first, _ = assembler.finish()
+        assembler.write(b'second')
+        second, _ = assembler.finish()
+        self.assertEqual(bytes(first), b'first')
+        self.assertEqual(bytes(second), b'second')
+        self.assertEqual(assembler.allocations, 1)
+
+    def test_released_slots_are_reused(self):
+        assembler = FrameAssembler(pool_size=1)
+        for _ in range(10):
+            assembler.write(b'frame')
+            frame, sized_frame = assembler.finish()
+            del frame, sized_frame
+        self.assertEqual(assembler.allocations, 0)
+
+    def test_buffer_in_use(self):
+        buffer = bytearray(10)
+        self.assertFalse(buffer_in_use(buffer))
+        view = memoryview(buffer)[2:4]
+        self.assertTrue(buffer_in_use(buffer))
+        view.release()
+        self.assertFalse(buffer_in_use(buffer))
+        self.assertEqual(len(buffer), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
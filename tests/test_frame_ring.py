@@ -0,0 +1,70 @@
+import sys
+sys.path.append("/picameleon")
+from streamers.frame_ring import FrameRing
+from threading import Thread
+import time
+import unittest
+
+
+class TestFrameRing(unittest.TestCase):
+
+    def test_put_assigns_sequence_numbers(self):
+        ring = FrameRing(capacity=4)
+        first = ring.put(b'a', timestamp=10)
+        second = ring.put(b'b', timestamp=20, payload=b'sized b')
+        self.assertEqual((first.seq, first.timestamp, first.data, first.payload), (1, 10, b'a', b'a'))
+        self.assertEqual((second.seq, second.payload), (2, b'sized b'))
+        self.assertIs(ring.latest(), second)
+
+    def test_independent_readers(self):
+        """Every reader gets every frame no matter how many readers there are
+        """
+        ring = FrameRing(capacity=16)
+        results = [[], []]
+
+        def read(result):
+            seq = 0
+            while len(result) < 10:
+                frame = ring.wait_for_frame(seq, timeout=1)
+                if frame is None:
+                    break
+                seq = frame.seq
+                result.append(frame.data)
+
+        readers = [Thread(target=read, args=(result,)) for result in results]
+        for reader in readers:
+            reader.start()
+        for i in range(10):
+            ring.put(i)
+            time.sleep(.001)
+        for reader in readers:
+            reader.join()
+
+        self.assertEqual(results[0], list(range(10)))
+        self.assertEqual(results[1], list(range(10)))
+
+    def test_slow_reader_skips_to_oldest_frame(self):
+        ring = FrameRing(capacity=3)
+        for i in range(10):
+            ring.put(i)
+        self.assertEqual(ring.wait_for_frame(0).seq, 8)
+        self.assertEqual(ring.wait_for_frame(8).seq, 9)
+
+    def test_wait_times_out(self):
+        ring = FrameRing()
+        ring.put(b'frame')
+        self.assertIsNone(ring.wait_for_frame(1, timeout=.05))
+
+    def test_close_wakes_up_readers(self):
+        ring = FrameRing()
+        result = []
+        reader = Thread(target=lambda: result.append(ring.wait_for_frame(0)))
+        reader.start()
+        ring.close()
+        reader.join(1)
+        self.assertFalse(reader.is_alive())
+        self.assertEqual(result, [None])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import sys
+sys.path.append("/picameleon")
+from streamers.frame_ring import Frame
+from streamers.gop_cache import GopCache
+import unittest
+
+SPS_PPS = b'\x00\x00\x00\x01\x27\x64\x00\x28\x00\x00\x00\x01\x28\xee\x01'
+IDR = b'\x00\x00\x00\x01\x25\x88\x84\x00'
+SLICE = b'\x00\x00\x00\x01\x21\x9a\x02\x00'
+
+
+def frame(seq, data, keyframe=False, config=False):
+    return Frame(seq, seq * 10, data, data, keyframe=keyframe, config=config)
+
+
+class TestGopCache(unittest.TestCase):
+
+    def test_replays_current_gop(self):
+        cache = GopCache(1024)
+        cache.add(frame(1, SPS_PPS + IDR, keyframe=True, config=True))
+        cache.add(frame(2, SLICE))
+        cache.add(frame(3, SLICE))
+
+        replayed = cache.replay(2)
+        self.assertEqual([f.seq for f in replayed], [1, 2])
+        self.assertEqual(bytes(replayed[0].payload), SPS_PPS + IDR)
+
+        # a new keyframe starts a new GOP, the parameter sets are prepended to it
+        cache.add(frame(4, IDR, keyframe=True))
+        cache.add(frame(5, SLICE))
+        replayed = cache.replay(5)
+        self.assertEqual([bytes(f.payload) for f in replayed], [SPS_PPS, IDR, SLICE])
+        self.assertFalse(replayed[0].keyframe)
+
+    def test_waits_for_keyframe(self):
+        cache = GopCache(1024)
+        cache.add(frame(1, SLICE))
+        self.assertEqual(cache.replay(1), [])
+
+    def test_gop_bigger_than_cache(self):
+        cache = GopCache(len(IDR) + len(SLICE))
+        cache.add(frame(1, IDR, keyframe=True))
+        cache.add(frame(2, SLICE))
+        self.assertEqual(len(cache.replay(2)), 2)
+        cache.add(frame(3, SLICE))
+        self.assertEqual(cache.replay(3), [])
+        cache.add(frame(4, IDR, keyframe=True))
+        self.assertEqual([f.seq for f in cache.replay(4)], [4])
+
+    def test_replayed_frames_survive_new_gop(self):
+        cache = GopCache(1024)
+        cache.add(frame(1, IDR, keyframe=True))
+        replayed = cache.replay(1)
+        cache.add(frame(2, SLICE, keyframe=True))
+        self.assertEqual(bytes(replayed[0].payload), IDR)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import sys
+sys.path.append("/picameleon")
+from streamers.h264 import AccessUnitSplitter, FrameBoundary, nal_units, parameter_sets, PARAMETER_SETS_WINDOW
+import unittest
+
+SPS = b'\x00\x00\x00\x01\x27\x64\x00\x28'
+PPS = b'\x00\x00\x00\x01\x28\xee\x01'
+SEI = b'\x00\x00\x00\x01\x06\x05\x10'
+IDR = b'\x00\x00\x00\x01\x25\x88\x84\x00'
+SLICE = b'\x00\x00\x00\x01\x21\x9a\x02\x00'
+SECOND_SLICE = b'\x00\x00\x00\x01\x21\x1c\x02\x00'  # first_mb_in_slice != 0
+CONTINUATION = b'\x12\x34\x56\x78'
+
+
+class TestH264(unittest.TestCase):
+
+    def test_nal_units(self):
+        units = list(nal_units(SPS + PPS))
+        self.assertEqual(units, [(0, 7, False), (len(SPS), 8, False)])
+        self.assertEqual(list(nal_units(IDR)), [(0, 5, True)])
+        self.assertEqual(list(nal_units(SECOND_SLICE)), [(0, 1, False)])
+        self.assertEqual(list(nal_units(CONTINUATION)), [])
+
+    def test_groups_nal_units_of_a_picture(self):
+        splitter = AccessUnitSplitter()
+        # first access unit, nothing is completed until the next picture starts
+        for buf in (SPS + PPS, SEI, IDR, CONTINUATION):
+            self.assertEqual(splitter.feed(buf), [])
+
+        self.assertEqual(splitter.feed(SLICE), [FrameBoundary(0, True, True)])
+        self.assertEqual(splitter.feed(SECOND_SLICE), [])
+        self.assertEqual(splitter.feed(SLICE), [FrameBoundary(0, False, False)])
+        self.assertEqual(splitter.feed(SEI), [FrameBoundary(0, False, False)])
+        self.assertEqual(splitter.feed(IDR), [])
+        self.assertEqual(splitter.feed(SPS), [FrameBoundary(0, True, False)])
+
+    def test_multiple_access_units_in_one_buffer(self):
+        splitter = AccessUnitSplitter()
+        boundaries = splitter.feed(IDR + SLICE + SLICE)
+        self.assertEqual(boundaries, [FrameBoundary(len(IDR), True, False),
+                                      FrameBoundary(len(IDR) + len(SLICE), False, False)])
+
+    def test_parameter_sets(self):
+        self.assertEqual(parameter_sets(SPS + PPS + SEI + IDR), SPS + PPS)
+        self.assertEqual(parameter_sets(SLICE), b'')
+        self.assertEqual(parameter_sets(SPS + PPS), SPS + PPS)
+
+    def test_parameter_sets_of_a_big_access_unit(self):
+        # the picture isn't copied, only its start, and a long SEI makes the window grow
+        idr = IDR + CONTINUATION * 100000
+        long_sei = SEI + b'\x10' * PARAMETER_SETS_WINDOW * 3
+        self.assertEqual(parameter_sets(memoryview(bytearray(SPS + PPS + SEI + idr))), SPS + PPS)
+        self.assertEqual(parameter_sets(memoryview(bytearray(SPS + long_sei + PPS + idr))), SPS + PPS)
+        self.assertEqual(parameter_sets(memoryview(bytearray(long_sei + SPS + PPS))), SPS + PPS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import sys
+sys.path.append("/picameleon")
+from modes.http_streaming import HTTPStreamingMode
+from streamers.frame_ring import Frame
+import time
+import socket
+import unittest
+from unittest.mock import Mock, patch
+
+PORT = 5582
+JPEG = b'\xff\xd8jpeg\xff\xd9'
+
+
+def mock_streamer(*args, **kwargs):
+    streamer = Mock()
+    streamer.frames.latest.return_value = Frame(1, None, JPEG, JPEG)
+    streamer.output.has_output.return_value = True
+    return streamer
+
+
+def get(path):
+    client = socket.create_connection(("127.0.0.1", PORT))
+    client.sendall(b'GET %s HTTP/1.1\r\nHost: localhost\r\n\r\n' % path)
+    client.settimeout(2)
+    return client
+
+
+def read_until(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def read_response(sock):
+    data = b''
+    while True:
+        chunk = sock.recv(4096)
+        if not chunk:
+            return data
+        data += chunk
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(.01)
+    return condition()
+
+
+@patch("modes.http_streaming.Streamer", side_effect=mock_streamer)
+class TestHTTPStreamingMode(unittest.TestCase):
+
+    def start(self, config=None):
+        self.mode = HTTPStreamingMode({"listen_addr": "127.0.0.1", "listen_port": PORT, **(config or {})}, {})
+        self.mode.start()
+        self.assertTrue(wait_for(lambda: self.mode.engine is not None))
+
+    def tearDown(self):
+        self.mode.shutdown()
+
+    def test_snapshot(self, mocked_streamer):
+        self.start()
+        response = read_response(get(b'/snapshot.jpg?t=1'))
+        headers, body = response.split(b'\r\n\r\n', 1)
+        self.assertTrue(headers.startswith(b'HTTP/1.1 200 OK'))
+        self.assertIn(b'Content-Type: image/jpeg', headers)
+        self.assertIn(b'Content-Length: %d' % len(JPEG), headers)
+        self.assertEqual(body, JPEG)
+
+    def test_viewers_share_the_stream(self, mocked_streamer):
+        self.start()
+        self.mode.streamer.output.add_output.assert_called_once_with("http_engine", self.mode.engine)
+        viewers = [get(b'/stream.mjpg') for _ in range(3)]
+        self.assertTrue(wait_for(lambda: len(self.mode.engine.connections) == 3))
+        self.mode.engine.write_frame(Frame(2, None, b'second', b'second'))
+
+        part = b'\r\n--FRAME\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n'
+        for viewer in viewers:
+            headers = b''
+            while not headers.endswith(b'\r\n\r\n'):
+                headers += viewer.recv(1)
+            self.assertIn(b'Content-Type: multipart/x-mixed-replace; boundary=FRAME', headers)
+            # every viewer starts with the latest frame of the streamer
+            expected = part % len(JPEG) + JPEG + part % 6 + b'second'
+            self.assertEqual(read_until(viewer, len(expected)), expected)
+            viewer.close()
+        self.assertTrue(wait_for(lambda: len(self.mode.engine.connections) == 0))
+
+    def test_refuses_viewers_over_max_viewers(self, mocked_streamer):
+        self.start({"max_viewers": 1})
+        viewer = get(b'/stream.mjpg')
+        self.assertTrue(wait_for(lambda: len(self.mode.engine.connections) == 1))
+        self.assertTrue(read_response(get(b'/stream.mjpg')).startswith(b'HTTP/1.1 503'))
+        viewer.close()
+
+    def test_unknown_requests(self, mocked_streamer):
+        self.start()
+        self.assertTrue(read_response(get(b'/index.html')).startswith(b'HTTP/1.1 404'))
+        client = socket.create_connection(("127.0.0.1", PORT))
+        client.sendall(b'POST /snapshot.jpg HTTP/1.1\r\n\r\n')
+        client.settimeout(2)
+        self.assertTrue(read_response(client).startswith(b'HTTP/1.1 405'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import sys
+sys.path.append("/picameleon")
+from outputs.motion_blobs import label_blobs, BlobFilter
+from outputs.motion_detector import MotionDetector
+from utils.camera_backend import MOTION_DTYPE
+import numpy
+import unittest
+
+
+def grid(*cells, shape=(6, 8)):
+    moving = numpy.zeros(shape, dtype=bool)
+    for row, col in cells:
+        moving[row, col] = True
+    return moving
+
+
+# a U shape only joined at the bottom, a diagonal neighbour and a single macroblock
+SHAPES = grid((0, 0), (1, 0), (2, 0), (2, 1), (2, 2), (1, 2), (0, 2),
+              (3, 3), (5, 7))
+
+
+class TestMotionBlobs(unittest.TestCase):
+
+    def test_label_blobs(self):
+        labels = label_blobs(SHAPES)
+        u_shape = labels[SHAPES & (numpy.arange(8) < 3)]
+        self.assertTrue((u_shape == 0).all())
+        self.assertEqual(labels[3, 3], 3 * 8 + 3)
+        self.assertEqual(labels[5, 7], 5 * 8 + 7)
+        self.assertTrue((labels[~SHAPES] == SHAPES.size).all())
+
+    def test_label_blobs_spiral(self):
+        moving = numpy.zeros((9, 9), dtype=bool)
+        moving[0, :] = moving[:, 8] = moving[8, :] = moving[2:, 0] = moving[2, :7] = moving[2:7, 6] = True
+        labels = label_blobs(moving)
+        self.assertEqual(len(numpy.unique(labels[moving])), 1)
+
+    def test_min_area(self):
+        blobs = BlobFilter(min_area=2, persistence=1).update(SHAPES)
+        self.assertEqual(len(blobs), 1)
+        self.assertEqual(blobs[0]["area"], 7)
+        self.assertEqual(blobs[0]["bbox"], [0, 0, 0.375, 0.5])
+        self.assertEqual(blobs[0]["centroid"], [round(1.5 / 8, 4), round((8 / 7 + 0.5) / 6, 4)])
+
+    def test_persistence(self):
+        blob_filter = BlobFilter(min_area=2, persistence=3)
+        square = [(r, c) for r in range(2) for c in range(2)]
+        self.assertEqual(blob_filter.update(grid(*square)), [])
+        # moves one macroblock to the right, still overlapping
+        self.assertEqual(blob_filter.update(grid(*[(r, c + 1) for r, c in square])), [])
+        self.assertEqual(len(blob_filter.update(grid(*[(r, c + 2) for r, c in square]))), 1)
+        # jumps away so it starts over
+        self.assertEqual(blob_filter.update(grid(*[(r + 4, c + 6) for r, c in square])), [])
+
+    def test_detector_with_blobs(self):
+        vectors = numpy.zeros((6, 9), dtype=MOTION_DTYPE)
+        # scattered noise that is more than sensitivity macroblocks
+        vectors['x'][::2, ::2] = 20
+        detector = MotionDetector(5, 3, blobs={"min_area": 4, "persistence": 1})
+        detector.analyze(vectors)
+        self.assertFalse(detector.motion_detected.is_set())
+        self.assertTrue(MotionDetector(5, 3).moving_blocks(vectors) > 3)
+
+        vectors['x'][2:4, 2:4] = 20
+        detector.analyze(vectors)
+        self.assertTrue(detector.motion_detected.is_set())
+        self.assertEqual(len(detector.blobs), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
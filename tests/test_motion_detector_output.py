@@ -1,6 +1,6 @@
 import sys
 sys.path.append("/picameleon")
-from outputs.motion_detector import MotionDetector
+from outputs.motion_detector import MotionDetector, SADMotionDetector
 from threading import Thread
 import numpy
 import unittest
@@ -41,6 +41,27 @@ class TestMotionDetectorOutput(unittest.TestCase):
         self.assertFalse(motion_detector.wait_for_motion(DEFAULT_TIMEOUT))
         job.join()
 
+    def test_moving_blocks_matches_magnitude(self):
+        """Checks that the integer comparison counts the same blocks as
+        comparing the truncated magnitude of every vector with the threshold
+        """
+        for frame in motion_vectors[::10]:
+            magnitude = numpy.sqrt(frame['x'].astype(numpy.float64) ** 2 +
+                                   frame['y'].astype(numpy.float64) ** 2).astype(numpy.uint8)
+            for threshold in (0, 1, 2.5, THRESHOLD, 181, 182, 300):
+                self.assertEqual(MotionDetector(threshold).moving_blocks(frame), (magnitude >= threshold).sum())
+
+    def test_sad_counts_unmatched_blocks(self):
+        """Checks that the SAD detector also counts blocks with a high SAD but a short vector
+        """
+        frame = no_motion_vectors[0].copy()
+        frame['sad'][:3, :5] = 1000
+        self.assertEqual(MotionDetector(THRESHOLD).moving_blocks(frame), 0)
+        self.assertEqual(SADMotionDetector(THRESHOLD, sad_threshold=1000).moving_blocks(frame), 15)
+        for frame in motion_vectors[::10]:
+            self.assertGreaterEqual(SADMotionDetector(THRESHOLD).moving_blocks(frame),
+                                    MotionDetector(THRESHOLD).moving_blocks(frame))
+
     def test_calibration_fails(self):
         """Checks if calibration fails when motion is detected
         """
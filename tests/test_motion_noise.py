@@ -0,0 +1,65 @@
+import sys
+sys.path.append("/picameleon")
+from outputs.motion_noise import NoiseFloor
+from outputs.motion_detector import MotionDetector
+from utils.camera_backend import MOTION_DTYPE
+import numpy
+import unittest
+
+SHAPE = (4, 9)
+
+
+def noisy_vectors(rng, noisy_amplitude, quiet_amplitude=1):
+    """The left half of the picture is noisy, the right half is quiet
+    """
+    vectors = numpy.zeros(SHAPE, dtype=MOTION_DTYPE)
+    vectors['x'][:, :4] = rng.integers(-noisy_amplitude, noisy_amplitude + 1, (4, 4))
+    vectors['x'][:, 4:] = rng.integers(-quiet_amplitude, quiet_amplitude + 1, (4, 5))
+    return vectors
+
+
+class TestNoiseFloor(unittest.TestCase):
+
+    def test_learns_mean_and_variance(self):
+        noise_floor = NoiseFloor(1, alpha=0.5, warmup=2)
+        moving = numpy.zeros(SHAPE, dtype=bool)
+        noise_floor.update(numpy.full(SHAPE, 9, dtype=numpy.uint16), 36, moving)
+        self.assertFalse(noise_floor.ready.is_set())
+        self.assertEqual(noise_floor.squared_thresholds(36), 36)
+        noise_floor.update(numpy.full(SHAPE, 25, dtype=numpy.uint16), 36, moving)
+        self.assertTrue(noise_floor.ready.is_set())
+        # magnitudes 3 then 5 averaged evenly while warming up
+        numpy.testing.assert_allclose(noise_floor.mean, 4)
+        numpy.testing.assert_allclose(noise_floor.variance, 1)
+        numpy.testing.assert_allclose(noise_floor.squared_thresholds(36), (4 + 3 * 1) ** 2)
+
+    def test_moving_macroblocks_learn_slower(self):
+        noise_floor = NoiseFloor(2, alpha=0.5, warmup=1)
+        moving = numpy.zeros(SHAPE, dtype=bool)
+        noise_floor.update(numpy.zeros(SHAPE, dtype=numpy.uint16), 1, moving)
+        squared = numpy.full(SHAPE, 1, dtype=numpy.uint16)
+        squared[0, 0] = 100
+        noise_floor.update(squared, 1, moving)
+        self.assertEqual(numpy.count_nonzero(moving), 1)
+        self.assertAlmostEqual(float(noise_floor.mean[0, 0]), .5, places=5)
+        self.assertAlmostEqual(float(noise_floor.mean[0, 1]), .5, places=5)
+
+    def test_detector_adapts_to_noise(self):
+        rng = numpy.random.default_rng(0)
+        fixed = MotionDetector(4, 0)
+        adaptive = MotionDetector(4, 0, noise_floor={"warmup": 20})
+        for _ in range(100):
+            vectors = noisy_vectors(rng, 12)
+            adaptive.analyze(vectors)
+        self.assertTrue(adaptive.noise_floor.ready.is_set())
+
+        vectors = noisy_vectors(rng, 12)
+        self.assertGreater(fixed.moving_blocks(vectors[:, :4]), 0)
+        self.assertEqual(adaptive.moving_blocks(vectors), 0)
+        # the same motion still shows where it is quiet
+        vectors['x'][0, 6] = 12
+        self.assertEqual(adaptive.moving_blocks(vectors), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import sys
+sys.path.append("/picameleon")
+from outputs.motion_zones import zones_mask, zones_indices
+from outputs.motion_detector import MotionDetector
+from utils.camera_backend import MOTION_DTYPE
+import numpy
+import unittest
+
+# 4 rows and 8 columns of macroblocks plus the extra column
+SHAPE = (4, 9)
+
+
+class TestMotionZones(unittest.TestCase):
+
+    def test_no_include_zones_covers_everything(self):
+        mask = zones_mask({}, SHAPE)
+        self.assertEqual(mask.shape, SHAPE)
+        self.assertTrue(mask[:, :-1].all())
+        self.assertFalse(mask[:, -1].any())
+
+    def test_include_rect(self):
+        mask = zones_mask({"include": [{"rect": [0.5, 0, 0.5, 0.5]}]}, SHAPE)
+        expected = numpy.zeros(SHAPE, dtype=bool)
+        expected[:2, 4:8] = True
+        numpy.testing.assert_array_equal(mask, expected)
+
+    def test_exclude_polygon(self):
+        # the triangle over the top left half of the picture
+        mask = zones_mask({"exclude": [{"polygon": [[0, 0], [1, 0], [0, 1]]}]}, SHAPE)
+        self.assertFalse(mask[0, 0])
+        self.assertTrue(mask[3, 7])
+        self.assertEqual(mask[:, :-1].sum(), 16)
+
+    def test_indices(self):
+        indices = zones_indices({"include": [{"rect": [0, 0.75, 0.25, 0.25]}]}, SHAPE)
+        numpy.testing.assert_array_equal(indices, [27, 28])
+
+    def test_bad_zone(self):
+        self.assertRaises(Exception, MotionDetector, 1, 0, {"include": [{"circle": [0, 0, 1]}]})
+
+    def test_detector_only_counts_zones(self):
+        vectors = numpy.zeros(SHAPE, dtype=MOTION_DTYPE)
+        vectors['x'][:, :4] = 10
+        vectors['x'][0, 7] = 10
+        detector = MotionDetector(5, 0, {"include": [{"rect": [0.5, 0, 0.5, 1]}]})
+        self.assertEqual(detector.moving_blocks(vectors), 1)
+        self.assertEqual(MotionDetector(5, 0).moving_blocks(vectors), 17)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import sys
+sys.path.append("/picameleon")
+from outputs.network_engine import NetworkEngine, EngineConnection
+from outputs.stream_protocol import FrameHeaders, FRAME_HEADER, parse_frame_header, handshake
+from streamers.frame_ring import Frame
+import time
+import socket
+import unittest
+from unittest.mock import Mock
+
+
+def frame(seq, data, keyframe=False):
+    return Frame(seq, None, data, data, keyframe=keyframe)
+
+
+def read_exactly(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+class TestNetworkEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = NetworkEngine(max_send_buffer=64 * 1024)
+        self.engine.start()
+
+    def tearDown(self):
+        self.engine.stop()
+        self.engine.join(1)
+
+    def test_writes_to_all_connections(self):
+        pairs = [socket.socketpair() for _ in range(3)]
+        for index, (server, _) in enumerate(pairs):
+            self.engine.add_connection(index, server, greeting=b'hi')
+
+        self.assertTrue(self.engine.write_frame(frame(1, b'first', keyframe=True)))
+        self.assertTrue(self.engine.write(b'second'))
+        for _, client in pairs:
+            client.settimeout(1)
+            self.assertEqual(read_exactly(client, 13), b'hifirstsecond')
+            client.close()
+
+    def test_joins_with_replay(self):
+        replayed = [frame(1, b'1', keyframe=True), frame(2, b'2')]
+        self.engine.replay = lambda until_seq: [f for f in replayed if f.seq <= until_seq]
+        for f in replayed:
+            self.engine.write_frame(f)
+
+        server, client = socket.socketpair()
+        self.engine.add_connection("joined", server)
+        self.engine.write_frame(frame(3, b'3'))
+        client.settimeout(1)
+        self.assertEqual(read_exactly(client, 3), b'123')
+        client.close()
+
+    def test_slow_connection_drops_to_keyframe(self):
+        server, client = socket.socketpair()
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        self.engine.add_connection("slow", server)
+        chunk = b'x' * 16 * 1024
+        for seq in range(1, 30):
+            self.engine.write_frame(frame(seq, chunk, keyframe=seq == 1))
+        time.sleep(.2)
+
+        stats = self.engine.stats()["slow"]
+        self.assertGreater(stats["dropped_frames"], 0)
+        self.assertLessEqual(stats["pending_bytes"], 64 * 1024)
+        # frames are dropped whole, never after they started going out
+        self.assertEqual(stats["sent_bytes"] + stats["pending_bytes"], (29 - stats["dropped_frames"]) * len(chunk))
+        client.close()
+
+    def test_replay_over_the_send_buffer_is_kept_whole(self):
+        idr = frame(1, b'I' * 600 * 1024, keyframe=True)
+        replayed = [idr] + [frame(seq, (b'%d' % (seq % 10)) * 100 * 1024) for seq in range(2, 12)]
+        live = [frame(seq, (b'%d' % (seq % 10)) * 100 * 1024) for seq in range(12, 17)]
+        self.engine.replay = lambda until_seq: replayed
+        self.engine.write_frame(replayed[-1])
+
+        # the replay alone is bigger than the send buffer, the live frames fit in it
+        self.engine.max_send_buffer = 1024 * 1024
+        server, client = socket.socketpair()
+        self.engine.add_connection("joined", server, greeting=b'hi')
+        for f in live:
+            self.engine.write_frame(f)
+        client.settimeout(1)
+        expected = b'hi' + b''.join(f.payload for f in replayed + live)
+        self.assertEqual(read_exactly(client, len(expected)), expected)
+        self.assertEqual(self.engine.stats()["joined"]["dropped_frames"], 0)
+        client.close()
+
+    def test_greeting_is_never_dropped(self):
+        # nothing is flushed, everything stays pending
+        connection = EngineConnection(Mock(), "unsent", Mock(), None, max_send_buffer=1024)
+        connection.greet(handshake(2))
+        connection.queue([b'I' * 800], 800, True, budgeted=False)
+        for _ in range(3):
+            connection.queue([b'P' * 800], 800, False)
+
+        self.assertEqual(bytes(connection.pending[0][0]), handshake(2))
+        self.assertEqual(len(connection.pending), 1)
+        self.assertTrue(connection.waiting_keyframe)
+        connection.queue([b'I' * 800], 800, True)
+        self.assertEqual([bytes(frame[0]) for frame in connection.pending], [handshake(2), b'I' * 800])
+
+    def test_closed_connection_is_removed(self):
+        on_close = Mock()
+        server, client = socket.socketpair()
+        self.engine.add_connection("gone", server, on_close)
+        time.sleep(.1)
+        client.close()
+        time.sleep(.1)
+        on_close.assert_called_once_with("gone")
+        self.assertFalse(self.engine.has_connections())
+
+    def test_framed_connections_get_headers(self):
+        self.engine.framing = FrameHeaders("h264", (640, 480))
+        plain_server, plain = socket.socketpair()
+        framed_server, framed = socket.socketpair()
+        self.engine.add_connection("plain", plain_server)
+        self.engine.add_connection("framed", framed_server, framed=True)
+        # the payload of the frame has its size prepended, framed connections only get the frame after the header
+        self.engine.write_frame(Frame(7, 1234, b'data', b'\x04\x00\x00\x00data', keyframe=True, published=1.5))
+
+        plain.settimeout(1)
+        framed.settimeout(1)
+        self.assertEqual(read_exactly(plain, 8), b'\x04\x00\x00\x00data')
+        info = parse_frame_header(read_exactly(framed, FRAME_HEADER.size))
+        self.assertEqual((info.size, info.seq, info.timestamp, info.wall_time), (4, 7, 1234, 1500000))
+        self.assertTrue(info.keyframe)
+        self.assertEqual((info.format, info.width, info.height), ("h264", 640, 480))
+        self.assertEqual(read_exactly(framed, 4), b'data')
+        plain.close()
+        framed.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,12 @@ import sys
 sys.path.append("/picameleon")
 from mocks.mock_socket import MockSocket
 from modes.network_serving import NetworkServingMode
+from streamers.frame_ring import Frame
+from outputs.stream_protocol import FRAME_HEADER, handshake, parse_frame_header
+from outputs.output_holder import WriterOutputHolder
 import json
+import time
+import socket
 import unittest
 import struct
 from unittest.mock import Mock, call, patch
@@ -67,5 +72,181 @@ class TestNetworkTriggerMode(unittest.TestCase):
         self.assertIsNone(mode.redis_announcer)
 
 
+def mock_streamer(*args, **kwargs):
+    streamer = Mock()
+    streamer.is_running = False
+    streamer.start.side_effect = lambda: setattr(streamer, "is_running", True)
+    streamer.format = "mjpeg"
+    streamer.resize = (640, 480)
+    streamer.output = WriterOutputHolder()
+    streamer.output.replay = lambda until_seq: []
+    return streamer
+
+
+def send_request(port, request):
+    client = socket.create_connection(("127.0.0.1", port))
+    request = json.dumps(request).encode()
+    client.sendall(struct.pack("<L", len(request)) + request)
+    client.settimeout(2)
+    return client
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(.01)
+    return condition()
+
+
+class TestEventLoopServing(unittest.TestCase):
+    port = 5581
+
+    def setUp(self):
+        self.mode = NetworkServingMode({"event_loop": True, "listen_addr": "127.0.0.1",
+                                        "listen_port": self.port, "max_streams": 1}, {})
+
+    def tearDown(self):
+        self.mode.shutdown()
+
+    def start(self):
+        self.mode.start()
+        self.assertTrue(wait_for(lambda: self.mode.is_listening))
+
+    @patch("modes.network_serving.Streamer", side_effect=mock_streamer)
+    def test_slow_client_does_not_hold_back_others(self, mocked_streamer):
+        self.start()
+        slow = socket.create_connection(("127.0.0.1", self.port))
+        clients = [send_request(self.port, {"format": "mjpeg"}) for _ in range(50)]
+        self.assertTrue(wait_for(lambda: len(self.mode.socket_map) == 50, timeout=1))
+        mocked_streamer.assert_called_once()
+        self.mode.streamer_map["format_mjpeg"].start.assert_called_once()
+
+        engine = self.mode.engine_map["format_mjpeg"]
+        engine.write_frame(Frame(1, None, b'frame', b'frame', keyframe=True))
+        for client in clients:
+            self.assertEqual(client.recv(5), b'frame')
+            client.close()
+        self.assertTrue(wait_for(lambda: len(self.mode.socket_map) == 0))
+        self.assertEqual(self.mode.streamer_map, {})
+        slow.close()
+
+    @patch("modes.network_serving.Streamer", side_effect=mock_streamer)
+    def test_refuses_streams_over_max_streams(self, mocked_streamer):
+        self.start()
+        served = send_request(self.port, {"format": "mjpeg"})
+        self.assertTrue(wait_for(lambda: len(self.mode.socket_map) == 1))
+        refused = send_request(self.port, {"format": "h264"})
+        self.assertEqual(refused.recv(4), struct.pack("<L", 0))
+        self.assertEqual(refused.recv(4), b'')
+        self.assertEqual(list(self.mode.streamer_map.keys()), ["format_mjpeg"])
+        refused.close()
+        served.close()
+
+    @patch("modes.network_serving.REQUEST_TIMEOUT", .2)
+    def test_closes_clients_that_send_no_request(self):
+        self.start()
+        silent = socket.create_connection(("127.0.0.1", self.port))
+        silent.settimeout(2)
+        self.assertEqual(silent.recv(4), b'')
+        silent.close()
+
+    @patch("modes.network_serving.Streamer", side_effect=mock_streamer)
+    def test_protocol_2_clients_share_streams_with_old_ones(self, mocked_streamer):
+        self.start()
+        old = send_request(self.port, {"format": "mjpeg"})
+        framed = send_request(self.port, {"format": "mjpeg", "protocol": 3})
+        self.assertEqual(framed.recv(5), handshake(2))
+        self.assertTrue(wait_for(lambda: len(self.mode.socket_map) == 2))
+        mocked_streamer.assert_called_once()
+
+        self.mode.engine_map["format_mjpeg"].write_frame(Frame(3, 42, b'jpeg', b'jpeg', keyframe=True))
+        self.assertEqual(old.recv(4), b'jpeg')
+        info = parse_frame_header(framed.recv(FRAME_HEADER.size))
+        self.assertEqual((info.size, info.seq, info.timestamp, info.format), (4, 3, 42, "mjpeg"))
+        self.assertEqual(framed.recv(4), b'jpeg')
+        old.close()
+        framed.close()
+
+    @patch("modes.network_serving.Streamer", side_effect=mock_streamer)
+    def test_engine_leaves_other_outputs_of_the_stream(self, mocked_streamer):
+        self.start()
+        client = send_request(self.port, {"format": "mjpeg"})
+        self.assertTrue(wait_for(lambda: len(self.mode.socket_map) == 1))
+        streamer = self.mode.streamer_map["format_mjpeg"]
+        other = Mock(spec=["write"])
+        streamer.output.add_output("other_mode", other)
+        streamer.output.start()
+        try:
+            streamer.output.write(Frame(1, None, b'jpeg', b'jpeg', keyframe=True))
+            self.assertEqual(client.recv(4), b'jpeg')
+            client.close()
+            self.assertTrue(wait_for(lambda: self.mode.engine_map == {}))
+
+            self.assertEqual(list(streamer.output.outputs.keys()), ["other_mode"])
+            self.assertIn("format_mjpeg", self.mode.streamer_map)
+            streamer.stop.assert_not_called()
+            streamer.output.write(Frame(2, None, b'next', b'next', keyframe=True))
+            self.assertTrue(wait_for(lambda: other.write.call_count == 2))
+        finally:
+            streamer.output.stop()
+
+    @patch("modes.network_serving.Streamer", side_effect=mock_streamer)
+    def test_failed_client_keeps_the_stream_of_others(self, mocked_streamer):
+        self.start()
+        served = send_request(self.port, {"format": "mjpeg"})
+        self.assertTrue(wait_for(lambda: len(self.mode.socket_map) == 1))
+        with patch("modes.network_serving.handshake", side_effect=ValueError("broken")):
+            failed = send_request(self.port, {"format": "mjpeg", "protocol": 2})
+            self.assertEqual(failed.recv(4), b'')
+        failed.close()
+
+        self.assertFalse(wait_for(lambda: "format_mjpeg" not in self.mode.streamer_map, timeout=.2))
+        streamer = self.mode.streamer_map["format_mjpeg"]
+        streamer.stop.assert_not_called()
+        self.assertEqual(len(self.mode.socket_map), 1)
+        self.mode.engine_map["format_mjpeg"].write_frame(Frame(1, None, b'jpeg', b'jpeg', keyframe=True))
+        self.assertEqual(served.recv(4), b'jpeg')
+        served.close()
+        self.assertTrue(wait_for(lambda: self.mode.streamer_map == {}))
+        streamer.stop.assert_called_once()
+
+
+def at_camera_resolution(*args, **kwargs):
+    streamer = mock_streamer()
+    # streamers drop resize once they start if it's the camera resolution
+    streamer.start.side_effect = lambda: (setattr(streamer, "is_running", True), setattr(streamer, "resize", None))
+    streamer.camera.resolution = (1640, 1232)
+    return streamer
+
+
+class TestServeClient(unittest.TestCase):
+    def setUp(self):
+        self.mode = NetworkServingMode({}, {})
+        self.sockets = []
+
+    def tearDown(self):
+        for sock in self.sockets:
+            sock.close()
+
+    def serve(self, request):
+        conn, client = socket.socketpair()
+        client.settimeout(2)
+        self.sockets += [conn, client]
+        self.mode.serve_client(conn, "client%d" % len(self.sockets), request)
+        return client
+
+    @patch("modes.network_serving.Streamer", side_effect=at_camera_resolution)
+    def test_protocol_2_clients_on_a_stream_at_camera_resolution(self, mocked_streamer):
+        first = self.serve({"format": "mjpeg", "protocol": 2})
+        second = self.serve({"format": "mjpeg", "protocol": 2})
+        self.assertEqual(first.recv(5), handshake(2))
+        self.assertEqual(second.recv(5), handshake(2))
+        self.assertEqual(len(self.mode.socket_map), 2)
+
+        framing = self.mode.socket_map["client4"].framing
+        self.assertEqual((framing.width, framing.height), (1640, 1232))
+        self.mode.streamer_map["format_mjpeg"].stop.assert_not_called()
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -2,8 +2,10 @@ import sys
 sys.path.append("/picameleon")
 from outputs.motion_output_holder import MotionOutputHolder
 from outputs.output_holder import OutputHolder, WriterOutputHolder
+from streamers.frame_ring import Frame
 import time
 import unittest
+from threading import Event
 from unittest.mock import Mock, call
 
 mock_output = Mock()
@@ -85,6 +87,121 @@ class TestWriterOutputHolder(unittest.TestCase):
         self.assertEqual(mock_output.write.call_count, 1)
         self.assertEqual(len(output_holder.aux_buffer), 0)
 
+    def test_write_wakes_writer(self):
+        """Checks that an idle output holder writes a frame as soon as it arrives
+        """
+
+        output_holder = create_and_start_writer_output_holder()
+        output_holder.add_output("test", mock_output)
+        time.sleep(.1)
+        write_and_wait(output_holder, .02, "test1")
+        self.assertEqual(mock_output.write.call_count, 1)
+        output_holder.stop()
+        output_holder.join(1)
+        self.assertFalse(output_holder.is_alive())
+
+    def test_join_replays_frames(self):
+        """Checks that an output added to a running holder gets the replayed
+        frames first and otherwise waits for the next keyframe
+        """
+
+        frames = [Frame(seq, None, b'%d' % seq, b'%d' % seq, keyframe=seq % 3 == 1) for seq in range(1, 7)]
+        output_holder = create_and_start_writer_output_holder()
+        output_holder.replay = lambda until_seq: [f for f in frames[:3] if f.seq <= until_seq]
+        write_and_wait(output_holder, .2, *frames[:2])
+
+        joined, late = Mock(spec=["write"]), Mock(spec=["write"])
+        output_holder.add_output("joined", joined)
+        write_and_wait(output_holder, .2, frames[2])
+        output_holder.replay = lambda until_seq: []
+        output_holder.add_output("late", late)
+        write_and_wait(output_holder, .2, *frames[4:])
+        output_holder.stop()
+        output_holder.join()
+
+        joined.assert_has_calls([call.write(b'1'), call.write(b'2'), call.write(b'3'),
+                                 call.write(b'5'), call.write(b'6')])
+        self.assertEqual(joined.write.call_count, 5)
+        # nothing to replay and neither frame 5 nor 6 is a keyframe
+        late.write.assert_not_called()
+
+    def test_replays_gop_longer_than_the_queue(self):
+        """Checks that a replayed GOP longer than the queue size isn't dropped by the live frames after it
+        """
+
+        gop = [Frame(seq, None, b'%d' % seq, b'%d' % seq, keyframe=seq == 1) for seq in range(1, 41)]
+        live = [Frame(seq, None, b'%d' % seq, b'%d' % seq, keyframe=False) for seq in range(41, 61)]
+        output_holder = create_and_start_writer_output_holder()
+        output_holder.replay = lambda until_seq: gop
+        write_and_wait(output_holder, .05, gop[-1])
+
+        written = []
+        output = Mock(spec=["write"])
+        output.write = lambda data: time.sleep(.005) or written.append(bytes(data)) or True
+        output_holder.add_output("joined", output)
+        write_and_wait(output_holder, .6, *live)
+        stats = output_holder.output_stats()["joined"]
+        output_holder.stop()
+        output_holder.join()
+
+        self.assertEqual(written, [f.payload for f in gop + live])
+        self.assertEqual(stats["dropped"], 0)
+
+    def test_slow_output_does_not_block_others(self):
+        """Checks that an output that takes long to write only loses its own frames
+        """
+
+        written = []
+        slow, fast = Mock(spec=["write"]), Mock(spec=["write"])
+        slow.write = lambda data: time.sleep(.5) or True
+        fast.write = lambda data: written.append(data) or True
+        output_holder = create_and_start_writer_output_holder()
+        output_holder.add_output("slow", slow, drop_policy="drop_oldest", queue_size=2)
+        output_holder.add_output("fast", fast)
+        write_and_wait(output_holder, .2, *range(10))
+        stats = output_holder.output_stats()
+        output_holder.stop()
+        output_holder.join()
+
+        self.assertEqual(written, list(range(10)))
+        # the slow output is still busy with its first frame and kept at most 2 more
+        self.assertEqual(stats["slow"]["written"], 0)
+        self.assertLessEqual(stats["slow"]["queued"], 2)
+        self.assertGreaterEqual(stats["slow"]["dropped"], 7)
+
+    def test_sheds_frames_over_budget(self):
+        """Checks that buffers over the high watermark are dropped until the buffer
+        drains under the low watermark and a keyframe comes in
+        """
+
+        frames = [Frame(seq, None, b'x' * 10, b'x' * 10, keyframe=seq % 4 == 1) for seq in range(1, 10)]
+        output_holder = WriterOutputHolder(max_buffered_bytes=40, high_watermark=0.75, low_watermark=0.25)
+        on_shedding = Mock()
+        output_holder.add_shedding_callback(on_shedding)
+        # not started so nothing drains the buffer
+        output_holder.writable = True
+        for frame in frames[:4]:
+            output_holder.write(frame)
+
+        self.assertEqual([f.seq for f in output_holder.aux_buffer], [1, 2, 3])
+        self.assertTrue(output_holder.shedding)
+        on_shedding.assert_called_once_with(True)
+
+        output_holder._next_buffer()
+        output_holder._next_buffer()
+        # back under the low watermark but 6 isn't a keyframe
+        output_holder.write(frames[5])
+        self.assertTrue(output_holder.shedding)
+        output_holder.write(frames[8])
+        self.assertFalse(output_holder.shedding)
+        on_shedding.assert_called_with(False)
+
+        self.assertEqual([f.seq for f in output_holder.aux_buffer], [3, 9])
+        stats = output_holder.buffer_stats()
+        self.assertEqual(stats["buffered_bytes"], 20)
+        self.assertEqual(stats["dropped_frames"], 2)
+        self.assertEqual(stats["dropped_bytes"], 20)
+
 
 class TestMotionOutputHolder(unittest.TestCase):
 
@@ -92,12 +209,37 @@ class TestMotionOutputHolder(unittest.TestCase):
         mock_output.reset_mock()
 
     def test_analyze(self):
+        """Checks that every output gets the arrays in order, the latest one always
+        and that the ones it was too busy for are counted as skipped
+        """
         test_data = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
         output = MotionOutputHolder(outputs={"test": mock_output})
         write_and_wait(output, .1, *test_data, analyze=True)
-        self.assertEqual(mock_output.analyze.call_count, len(test_data))
-        mock_output.assert_has_calls(
-            [call.analyze(data) for data in test_data])
+        analyzed = [c[0][0] for c in mock_output.analyze.call_args_list]
+        self.assertEqual(analyzed, sorted(analyzed))
+        self.assertEqual(analyzed[-1], test_data[-1])
+        stats = output.analysis_stats()["test"]
+        self.assertEqual(stats["analyzed"], len(analyzed))
+        self.assertEqual(stats["analyzed"] + stats["skipped"], len(test_data))
+
+    def test_analyze_does_not_wait_for_outputs(self):
+        """Checks that a slow output doesn't hold back analyze and only gets the latest array
+        """
+        release = Event()
+        slow = Mock()
+        slow.analyze.side_effect = lambda motion_vectors: release.wait()
+        output = MotionOutputHolder(outputs={"slow": slow, "test": mock_output})
+
+        start = time.monotonic()
+        for data in range(5):
+            output.analyze(data)
+        self.assertLess(time.monotonic() - start, .1)
+
+        release.set()
+        time.sleep(.1)
+        slow.assert_has_calls([call.analyze(0), call.analyze(4)])
+        self.assertEqual(slow.analyze.call_count, 2)
+        self.assertEqual(output.analysis_stats()["slow"]["skipped"], 3)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,125 @@
+import sys
+sys.path.append("/picameleon")
+from outputs.output_queue import OutputQueue, DROP_OLDEST, DROP_TO_KEYFRAME, LATEST_ONLY, BLOCK
+from outputs.shared_executor import ExecutorLane
+from streamers.frame_ring import Frame
+from threading import Thread, Event
+import time
+import unittest
+from unittest.mock import Mock
+
+
+def frame(seq, keyframe=False):
+    return Frame(seq, None, b'%d' % seq, b'%d' % seq, keyframe=keyframe)
+
+
+def create_queue(policy, max_frames=3, write=None, on_failure=None, executor=None):
+    """Without an executor the queue is only drained when the test calls _drain
+    """
+    written = []
+    if write is None:
+        def write(output, buffer):
+            written.append(buffer)
+            return True
+    return OutputQueue("test", Mock(), write, on_failure or Mock(), executor or Mock(),
+                       max_frames=max_frames, policy=policy), written
+
+
+class TestOutputQueue(unittest.TestCase):
+
+    def test_drop_oldest(self):
+        queue, written = create_queue(DROP_OLDEST)
+        for seq in range(1, 6):
+            queue.put(seq)
+        self.assertEqual(list(queue.frames), [3, 4, 5])
+        self.assertEqual(queue.frames_dropped, 2)
+
+        # a single drain was scheduled for all of them
+        queue.executor.submit.assert_called_once_with(queue._drain)
+        queue._drain()
+        self.assertEqual(written, [3, 4, 5])
+        self.assertFalse(queue.is_draining)
+
+    def test_drop_to_keyframe(self):
+        queue, _ = create_queue(DROP_TO_KEYFRAME)
+        frames = [frame(1, keyframe=True), frame(2), frame(3), frame(4), frame(5), frame(6, keyframe=True)]
+        for f in frames[:4]:
+            queue.put(f)
+        # the queue was full so everything up to the next keyframe is dropped
+        self.assertEqual(len(queue), 0)
+        queue.put(frames[4])
+        self.assertEqual(len(queue), 0)
+        queue.put(frames[5])
+        self.assertEqual([f.seq for f in queue.frames], [6])
+        self.assertEqual(queue.frames_dropped, 5)
+
+    def test_latest_only(self):
+        queue, _ = create_queue(LATEST_ONLY, max_frames=10)
+        for seq in range(1, 6):
+            queue.put(seq)
+        self.assertEqual(list(queue.frames), [5])
+
+    def test_block(self):
+        release = Event()
+
+        def write(output, buffer):
+            release.wait()
+            return True
+
+        queue, _ = create_queue(BLOCK, max_frames=1, write=write, executor=ExecutorLane())
+        queue.put(1)
+        queue.put(2)
+        producer = Thread(target=queue.put, args=(3,))
+        producer.start()
+        producer.join(.1)
+        # the output is still busy with 1 and 2 fills the queue
+        self.assertTrue(producer.is_alive())
+
+        release.set()
+        producer.join(1)
+        self.assertFalse(producer.is_alive())
+        self.assertEqual(queue.frames_dropped, 0)
+        queue.close()
+
+    def test_failed_write_closes_queue(self):
+        on_failure = Mock()
+        queue, _ = create_queue(DROP_OLDEST, write=lambda output, buffer: False, on_failure=on_failure,
+                                executor=ExecutorLane())
+        queue.put(1)
+        time.sleep(.1)
+        on_failure.assert_called_once_with("test", queue)
+        self.assertFalse(queue.put(2))
+
+    def test_replay_does_not_count_towards_max_frames(self):
+        for policy in (DROP_TO_KEYFRAME, DROP_OLDEST):
+            queue, written = create_queue(policy, max_frames=3)
+            gop = [frame(1, keyframe=True)] + [frame(seq) for seq in range(2, 11)]
+            queue.put_many(gop)
+            for seq in range(11, 14):
+                queue.put(frame(seq))
+            self.assertEqual([f.seq for f in queue.frames], list(range(1, 14)))
+            self.assertEqual(queue.frames_dropped, 0)
+
+            # only live frames past max_frames are dropped
+            queue.put(frame(14))
+            if policy == DROP_OLDEST:
+                self.assertEqual([f.seq for f in queue.frames], list(range(1, 11)) + [12, 13, 14])
+            else:
+                self.assertEqual(len(queue), 0)
+                self.assertTrue(queue.waiting_keyframe)
+
+    def test_drained_replay_frees_no_live_room(self):
+        queue, written = create_queue(DROP_OLDEST, max_frames=2)
+        queue.put_many([frame(1, keyframe=True), frame(2)])
+        queue._drain()
+        self.assertEqual(queue.replayed, 0)
+        for seq in range(3, 6):
+            queue.put(frame(seq))
+        self.assertEqual([f.seq for f in queue.frames], [4, 5])
+
+    def test_unknown_policy(self):
+        self.assertRaises(Exception, create_queue, "unknown")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,11 @@
 import sys
 sys.path.append("/picameleon")
 from unittest.mock import Mock
-from modes.photo_motion_detection import PhotoMotionDetection
+from modes.photo_motion_detection import PhotoMotionDetection, BackgroundModel, BlockDiff
+from streamers.downscale import raw_frame_size
+from streamers.frame_ring import Frame
 import numpy
+import tracemalloc
 import unittest
 
 WIDTH = 224  # Default Width
@@ -84,6 +87,141 @@ class TestMotionDetectorOutput(unittest.TestCase):
         self.assertFalse(photo_motion_detector.motion_detected)
         self.assertTrue(photo_motion_detector.detrigger_all.called)
 
+    def test_detect_motion_on_luma(self):
+        """Checks that comparing luma only finds the same motion
+        """
+        luma_detector = PhotoMotionDetection({"luma": True}, {})
+        luma_detector.prev_pic = base_pic
+        luma_detector.get_rgb_pic = get_always_same_pic
+        luma_detector._detect_motion()
+        self.assertEqual(luma_detector.current_certainty, 0)
+        luma_detector.get_rgb_pic = lambda: motion_pic
+        luma_detector._detect_motion()
+        self.assertEqual(luma_detector.current_certainty, 1)
+
+    def test_changed_pixels_match_pixel_by_pixel(self):
+        """Checks that the changed pixels are the ones the sum of the channel differences is over the threshold for
+        """
+        expected = (numpy.abs(base_pic.astype(int) - motion_pic.astype(int)).sum(axis=2) > THRESHOLD).sum()
+        self.assertEqual(photo_motion_detector.pic_diff.changed_pixels(base_pic, motion_pic), expected)
+        self.assertEqual(photo_motion_detector.pic_diff.changed_pixels(motion_pic, base_pic), expected)
+
+    def test_yuv_stream_luma(self):
+        """Checks that the luma of the frames of the yuv stream is compared without its padding,
+        and copied out to a buffer that isn't the previous pic
+        """
+        luma_detector = PhotoMotionDetection({"yuv_stream": True, "resize": (100, 50)}, {})
+        luma_detector.streamer.stop()
+        frames = []
+        for seq in range(1, 4):
+            data = bytearray(raw_frame_size("yuv", (100, 50)))
+            # the Y plane is padded to 128x64
+            for row in range(50):
+                data[row * 128:row * 128 + 100] = bytes([seq * 40 + (row % 2)]) * 100
+            frames.append(Frame(seq, None, memoryview(data), memoryview(data)))
+        luma_detector.streamer = Mock()
+        luma_detector.streamer.wait_for_frame.side_effect = lambda seq, timeout: frames[seq] if seq < 3 else None
+
+        luma_detector.pre_routine()
+        first = luma_detector.prev_pic
+        self.assertEqual(first.shape, (50, 100))
+        self.assertEqual(first[0, 0], 40)
+        self.assertEqual(first[1, 99], 41)
+        self.assertFalse(luma_detector._detect_motion())
+        self.assertIsNot(luma_detector.prev_pic, first)
+        self.assertEqual(luma_detector.prev_pic[0, 0], 80)
+        self.assertEqual(luma_detector.current_certainty, 1)
+        # no frame in time
+        self.assertFalse(luma_detector._detect_motion())
+        self.assertEqual(luma_detector.frame_seq, 3)
+
+    def test_yuv_stream_reader(self):
+        """Checks that the mode reads the yuv stream as a registered reader and stops it once nobody else uses it
+        """
+        luma_detector = PhotoMotionDetection({"yuv_stream": True, "resize": (100, 50)}, {})
+        luma_detector.streamer.stop()
+        luma_detector.streamer = Mock()
+        luma_detector.streamer.wait_for_frame.return_value = None
+        luma_detector.streamer.in_use.return_value = False
+        luma_detector.pre_routine()
+        luma_detector.streamer.add_reader.assert_called_once()
+        luma_detector.streamer.start.assert_called_once()
+
+        luma_detector._cleanup()
+        luma_detector.streamer.remove_reader.assert_called_once()
+        luma_detector.streamer.stop.assert_called_once()
+
+    def test_background_learns_slow_changes(self):
+        """Checks that a slowly brightening scene stays background while a sudden change doesn't
+        """
+        background = BackgroundModel(threshold=10, alpha=0.5)
+        scene = numpy.full((20, 30), 100, dtype=numpy.uint8)
+        self.assertEqual(background.update(scene), 0)
+        for brightness in range(102, 140, 2):
+            self.assertEqual(background.update(numpy.full((20, 30), brightness, dtype=numpy.uint8)), 0)
+
+        scene = numpy.full((20, 30), 140, dtype=numpy.uint8)
+        scene[5:10, 5:10] = 250
+        self.assertEqual(background.update(scene), 25)
+        self.assertTrue(background.foreground[5:10, 5:10].all())
+        # foreground pixels are learned slower than the rest
+        self.assertLess(background.mean[5, 5], 250 - 50)
+
+    def test_background_detects_on_first_pic(self):
+        """Checks that with a background model the mode triggers without waiting for min_certainty pics
+        """
+        background_detector = PhotoMotionDetection({"background": True}, {})
+        self.assertEqual(background_detector.min_certainty, 0)
+        background_detector.get_rgb_pic = get_always_same_pic
+        background_detector.pre_routine()
+        self.assertFalse(background_detector._detect_motion())
+        background_detector.get_rgb_pic = lambda: motion_pic
+        self.assertTrue(background_detector._detect_motion())
+
+    def test_block_diff(self):
+        """Checks that the tiles whose mean changed are found, on luma planes and rgb pics
+        """
+        block_diff = BlockDiff(block_size=8, threshold=10)
+        plane = numpy.full((40, 60), 100, dtype=numpy.uint8)
+        changed = plane.copy()
+        # a quarter of the tile at column 2, row 1 changes a lot, the tile next to it only a bit
+        changed[8:12, 16:20] = 200
+        changed[8:16, 24:32] = 105
+        self.assertEqual(block_diff.changed_tiles(plane, changed), 1)
+        self.assertEqual(block_diff.changed_tile_list(), [[2, 1]])
+        self.assertEqual(block_diff.changed.shape, (5, 7))
+        self.assertEqual(block_diff.changed_tiles(changed, changed), 0)
+
+        self.assertEqual(block_diff.changed_tiles(base_pic, base_pic), 0)
+        self.assertGreater(block_diff.changed_tiles(base_pic, motion_pic), 0)
+
+    def test_tile_sums(self):
+        """Checks the sums of the whole tiles of pics whose size isn't a multiple of the block,
+        and that nothing is allocated for them once the buffers are
+        """
+        block_diff = BlockDiff(block_size=16)
+        for pic in (base_pic[:150, :220], base_pic[:150, :220, 1].copy()):
+            out = numpy.empty((9, 13), dtype=numpy.uint32)
+            block_diff._allocate(pic.shape)
+            block_diff.tile_sums(pic, out)
+            expected = pic[:144, :208].reshape(9, 16, 13, -1).astype(numpy.uint32).sum(axis=(1, 3))
+            numpy.testing.assert_array_equal(out, expected)
+
+            tracemalloc.start()
+            block_diff.tile_sums(pic, out)
+            allocated = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            self.assertLess(allocated, 4096)
+
+    def test_block_mode_triggers_with_tiles(self):
+        block_detector = PhotoMotionDetection({"block_size": 16, "min_certainty": 0}, {})
+        block_detector.trigger_all = Mock()
+        block_detector.prev_pic = base_pic
+        block_detector.get_rgb_pic = lambda: motion_pic
+        block_detector.routine()
+        tiles = block_detector.trigger_all.call_args[0][0]["changed_tiles"]
+        self.assertEqual(len(tiles), numpy.count_nonzero(block_detector.block_diff.changed))
+
 
 if __name__ == '__main__':
     unittest.main()
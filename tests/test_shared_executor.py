@@ -0,0 +1,93 @@
+import sys
+sys.path.append("/picameleon")
+from outputs.shared_executor import ExecutorLane, executor_stats, configure_shared_executor, DEFAULT_MAX_WORKERS
+from threading import Event, Lock
+import time
+import unittest
+
+
+class TestExecutorLane(unittest.TestCase):
+
+    def test_limits_concurrency(self):
+        lane = ExecutorLane(max_concurrency=2)
+        release = Event()
+        lock = Lock()
+        running = [0, 0]
+
+        def task():
+            with lock:
+                running[0] += 1
+                running[1] = max(running[1], running[0])
+            release.wait()
+            with lock:
+                running[0] -= 1
+            return True
+
+        futures = [lane.submit(task) for _ in range(5)]
+        time.sleep(.1)
+        self.assertEqual(lane.stats()["running"], 2)
+        self.assertEqual(lane.stats()["waiting"], 3)
+        self.assertGreaterEqual(executor_stats()["waiting"], 3)
+
+        release.set()
+        self.assertTrue(all(future.result(1) for future in futures))
+        self.assertEqual(running[1], 2)
+        self.assertEqual(lane.stats()["running"], 0)
+
+    def test_shutdown_cancels_waiting_tasks(self):
+        lane = ExecutorLane(max_concurrency=1)
+        release = Event()
+        running = lane.submit(release.wait)
+        waiting = lane.submit(lambda: True)
+        time.sleep(.05)
+
+        release.set()
+        lane.shutdown(wait=True)
+        self.assertTrue(running.done())
+        self.assertTrue(waiting.cancelled() or waiting.done())
+        self.assertRaises(RuntimeError, lane.submit, lambda: True)
+
+    def test_executor_stats(self):
+        lane = ExecutorLane()
+        lane.submit(lambda: True).result(1)
+        stats = executor_stats()
+        self.assertGreaterEqual(stats["threads"], 1)
+        self.assertLessEqual(stats["threads"], stats["max_workers"])
+        self.assertGreaterEqual(stats["lanes"], 1)
+
+    def test_stalled_lanes_leave_workers_to_others(self):
+        configure_shared_executor(4)
+        release = Event()
+        try:
+            lanes = [ExecutorLane(), ExecutorLane()]
+            stalled = [lane.submit(release.wait) for lane in lanes for _ in range(8)]
+            time.sleep(.05)
+            self.assertEqual(executor_stats()["running"], 3)
+            # a lane that runs nothing still gets a worker
+            self.assertTrue(ExecutorLane().submit(lambda: True).result(1))
+
+            release.set()
+            self.assertTrue(all(future.result(1) for future in stalled))
+        finally:
+            release.set()
+            configure_shared_executor(DEFAULT_MAX_WORKERS)
+
+    def test_queue_depth(self):
+        configure_shared_executor(1)
+        try:
+            release = Event()
+            busy = ExecutorLane().submit(release.wait)
+            time.sleep(.05)
+            queued = [ExecutorLane().submit(lambda: True) for _ in range(2)]
+            self.assertEqual(executor_stats()["queue_depth"], 2)
+
+            release.set()
+            self.assertTrue(busy.result(1))
+            self.assertTrue(all(future.result(1) for future in queued))
+            self.assertEqual(executor_stats()["queue_depth"], 0)
+        finally:
+            configure_shared_executor(DEFAULT_MAX_WORKERS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import sys
+sys.path.append("/picameleon")
+from utils.camera_backend import load_backend, MOTION_DTYPE, SIMULATED_BACKEND
+from utils.simulated_camera import SimulatedCamera, Scene, H264Encoder, MJPEGEncoder, get_encoder
+from streamers.h264 import AccessUnitSplitter
+from streamers.downscale import raw_frame_size
+import numpy as np
+import unittest
+
+
+class Collector:
+    def __init__(self):
+        self.buffers = []
+
+    def write(self, buf):
+        self.buffers.append(bytes(buf))
+        return len(buf)
+
+
+class TestSimulatedCamera(unittest.TestCase):
+
+    def test_load_backend(self):
+        backend = load_backend(SIMULATED_BACKEND)
+        self.assertIs(backend.PiCamera, SimulatedCamera)
+        self.assertRaises(Exception, load_backend, "webcam")
+
+    def test_h264_stream(self):
+        encoder = H264Encoder(30, bitrate=8000000, intra_period=10)
+        splitter = AccessUnitSplitter()
+        boundaries = []
+        for index in range(31):
+            for buf in encoder.encode(index, keyframe=index == 25):
+                boundaries.extend(splitter.feed(buf))
+
+        keyframes = [i for i, boundary in enumerate(boundaries) if boundary.keyframe]
+        self.assertEqual(len(boundaries), 30)
+        self.assertEqual(keyframes, [0, 10, 20, 25])
+        self.assertTrue(all(boundary.config for boundary in boundaries if boundary.keyframe))
+
+    def test_mjpeg_stream(self):
+        buffers = MJPEGEncoder((1280, 720)).encode(0)
+        self.assertTrue(buffers[0].startswith(b'\xff\xd8'))
+        self.assertTrue(buffers[-1].endswith(b'\xff\xd9'))
+        self.assertFalse(any(buf.startswith(b'\xff\xd8') for buf in buffers[1:]))
+
+    def test_raw_frames_and_motion(self):
+        scene = Scene(10, motion_cycle=4)
+        for format in ("yuv", "rgb", "bgra"):
+            frame = get_encoder(format, (100, 50), 10, scene, {}).encode(5)[0]
+            self.assertEqual(len(frame), raw_frame_size(format, (100, 50)))
+
+        # moving during the first CROSSING_TIME seconds of the cycle, then still
+        self.assertGreater(scene.object_box(5, (640, 480))[4], 0)
+        self.assertEqual(scene.object_box(30, (640, 480))[4], 0)
+        self.assertLess(scene.object_box(45, (640, 480))[4], 0)
+
+    def test_recording(self):
+        camera = SimulatedCamera(resolution=(320, 240), framerate=50)
+        output, split_output, motion_output = Collector(), Collector(), Collector()
+        camera.start_recording(output, format="h264", splitter_port=1, motion_output=motion_output)
+        camera.start_recording(Collector(), format="mjpeg", splitter_port=2)
+        self.assertRaises(Exception, camera.start_recording, Collector(), format="h264", splitter_port=1)
+
+        camera.wait_recording(0.2, splitter_port=1)
+        camera.split_recording(split_output, splitter_port=1)
+        camera.wait_recording(0.1, splitter_port=1)
+        camera.close()
+        self.assertFalse(camera.recording)
+
+        self.assertTrue(output.buffers[0].startswith(b'\x00\x00\x00\x01\x27'))
+        # the split output starts with a keyframe
+        self.assertTrue(split_output.buffers[0].startswith(b'\x00\x00\x00\x01\x27'))
+        vectors = np.frombuffer(motion_output.buffers[0], dtype=MOTION_DTYPE)
+        self.assertEqual(len(vectors), 15 * 21)
+        self.assertRaises(Exception, camera.wait_recording, 0, splitter_port=1)
+
+    def test_circular_io_and_rgb_capture(self):
+        camera = SimulatedCamera(resolution=(320, 240), framerate=50)
+        backend = load_backend(SIMULATED_BACKEND)
+        circular = backend.PiCameraCircularIO(camera, seconds=1, bitrate=1000000)
+        camera.start_recording(circular, format="h264", bitrate=1000000, intra_period=5)
+        camera.wait_recording(0.3)
+        camera.stop_recording()
+        copy = Collector()
+        circular.copy_to(copy, seconds=1)
+        self.assertTrue(copy.buffers[0].startswith(b'\x00\x00\x00\x01\x27'))
+        self.assertLessEqual(circular.length, 1000000 // 8)
+
+        array = backend.PiRGBArray(camera, size=(100, 60))
+        camera.capture(array, format="rgb", resize=(100, 60))
+        self.assertEqual(array.array.shape, (60, 100, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import sys
+sys.path.append("/picameleon")
+from outputs.stream_protocol import FrameHeaders, FRAME_HEADER, HANDSHAKE, MAGIC, negotiate, handshake, \
+    parse_frame_header
+from streamers.frame_ring import Frame
+import unittest
+
+
+class TestStreamProtocol(unittest.TestCase):
+
+    def test_negotiate(self):
+        self.assertEqual(negotiate(1), 1)
+        self.assertEqual(negotiate(2), 2)
+        # a newer client gets the latest version the server knows, nonsense gets the first one
+        self.assertEqual(negotiate(9), 2)
+        self.assertEqual(negotiate(0), 1)
+        self.assertEqual(HANDSHAKE.unpack(handshake(2)), (MAGIC, 2))
+
+    def test_frame_header(self):
+        headers = FrameHeaders("h264", (1920, 1080))
+        frame = Frame(12, 5000, b'x' * 10, b'\x0a\x00\x00\x00' + b'x' * 10, keyframe=False, config=True,
+                      published=100.25)
+        header = headers.header(frame)
+        self.assertEqual(len(header), FRAME_HEADER.size)
+
+        info = parse_frame_header(header)
+        self.assertEqual((info.size, info.seq, info.timestamp, info.wall_time), (10, 12, 5000, 100250000))
+        self.assertEqual((info.keyframe, info.config), (False, True))
+        self.assertEqual((info.format, info.width, info.height), ("h264", 1920, 1080))
+
+    def test_unknown_metadata(self):
+        headers = FrameHeaders("gif", (320, 240))
+        info = parse_frame_header(headers.header(Frame(1, None, b'x', b'x')))
+        self.assertEqual((info.timestamp, info.wall_time, info.format), (-1, 0, None))
+        info = parse_frame_header(headers.buffer_header(b'xyz', keyframe=False))
+        self.assertEqual((info.size, info.seq, info.keyframe), (3, 0, False))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,10 +3,13 @@ sys.path.append("/picameleon")
 from unittest.mock import patch
 import unittest
 import filecmp
+import struct
 import time
 import os
 from streamers.base import BaseStreamer
 from streamers.split_frame import SplitFrameStreamer
+from streamers.derived import DerivedStreamer
+from streamers.frame_ring import Frame
 from streamers.streamer import Streamer
 
 
@@ -86,6 +89,71 @@ class TestStreamer(unittest.TestCase):
         streamer4.stop()
         self.assertEqual(len(Streamer.get_available_ports()), 4)
 
+    def test_split_frame_access_units(self):
+        """Tests that all the NAL units of a h264 picture end up in one frame
+        """
+        sps_pps = b'\x00\x00\x00\x01\x27\x64\x00\x28\x00\x00\x00\x01\x28\xee\x01'
+        idr = b'\x00\x00\x00\x01\x25\x88\x84\x00'
+        p_slice = b'\x00\x00\x00\x01\x21\x9a\x02\x00'
+        streamer = SplitFrameStreamer(0, "h264", prepend_size=True, options={"resize": (640, 480)})
+        for buf in (sps_pps, idr, p_slice, p_slice):
+            streamer.write(buf)
+
+        keyframe = streamer.wait_for_frame(0, timeout=0)
+        self.assertEqual(bytes(keyframe.data), sps_pps + idr)
+        self.assertEqual(bytes(keyframe.payload), struct.pack('<L', len(sps_pps + idr)) + sps_pps + idr)
+        self.assertTrue(keyframe.keyframe)
+        self.assertTrue(keyframe.config)
+        frame = streamer.wait_for_frame(keyframe.seq, timeout=0)
+        self.assertEqual(bytes(frame.data), p_slice)
+        self.assertFalse(frame.keyframe)
+        self.assertFalse(frame.config)
+
+    def test_derived_streamer(self):
+        """Tests that raw streams are derived from a bigger raw stream once the ports run out
+        """
+        sources = [Streamer("yuv", recording_options={"resize": (64, 32)}),
+                   Streamer("h264"), Streamer("mjpeg"), Streamer("rgb")]
+        self.assertEqual(len(Streamer.get_available_ports()), 0)
+
+        derived = Streamer("yuv", recording_options={"resize": (32, 16)})
+        self.assertIsInstance(derived, DerivedStreamer)
+        self.assertIs(derived.source, sources[0])
+        self.assertIs(Streamer("yuv", recording_options={"resize": (32, 16)}), derived)
+        self.assertRaises(Exception, Streamer, "yuv", recording_options={"resize": (128, 64)})
+        self.assertRaises(Exception, Streamer, "mjpeg", recording_options={"resize": (32, 16)})
+
+        data = bytes(64 * 32 * 3 // 2)
+        self.assertTrue(derived.write_frame(Frame(1, 10, data, data)))
+        frame = derived.wait_for_frame(0, timeout=1)
+        self.assertEqual((frame.seq, frame.timestamp, len(frame.data)), (1, 10, 32 * 16 * 3 // 2))
+
+        derived.stop()
+        self.assertNotIn(derived, Streamer._streamers.values())
+        for streamer in sources:
+            streamer.stop()
+        self.assertEqual(len(Streamer.get_available_ports()), 4)
+
+    def test_derived_streamer_keeps_read_source(self):
+        """Tests that a source still read with wait_for_frame isn't stopped when its derived streamer is
+        """
+        sources = [Streamer("yuv", recording_options={"resize": (64, 32)}),
+                   Streamer("h264"), Streamer("mjpeg"), Streamer("rgb")]
+        source = sources[0]
+        source.add_reader()
+        source.start()
+        derived = Streamer("yuv", recording_options={"resize": (32, 16)})
+        derived.start()
+        self.assertTrue(source.in_use())
+
+        derived.stop()
+        self.assertTrue(source.is_running)
+        source.remove_reader()
+        self.assertFalse(source.in_use())
+        for streamer in sources:
+            streamer.stop()
+        self.assertEqual(len(Streamer.get_available_ports()), 4)
+
     def test_get_picture_port(self):
         # Check initial port availability
         self.assertEqual(len(Streamer.get_available_ports()), 4)
@@ -128,6 +196,20 @@ class TestStreamer(unittest.TestCase):
                                                splitter_port=2,
                                                use_video_port=True)
 
+    def test_uses_gop_cache_only_when_asked(self):
+        """Tests that h264 streamers only cache their GOP once a user asks for it
+        """
+        streamer = Streamer("h264")
+        self.assertIsNone(streamer.gop_cache)
+        self.assertIsNone(streamer.output.replay)
+
+        self.assertIs(Streamer("h264", gop_cache_size=1024), streamer)
+        self.assertEqual(streamer.gop_cache.max_size, 1024)
+        self.assertEqual(streamer.output.replay, streamer.gop_cache.replay)
+        self.assertIsNone(Streamer("mjpeg", gop_cache_size=1024).gop_cache)
+        Streamer.shutdown_streamers()
+        self.assertEqual(len(Streamer.get_available_ports()), 4)
+
 
 if __name__ == '__main__':
     unittest.main()